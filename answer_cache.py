@@ -0,0 +1,160 @@
+# answer_cache.py
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95 # Cosine similarity a new question needs to reuse an answer
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def index_version(folder_path: str) -> str:
+    """Fingerprints the files of an index directory so a rebuild can be detected."""
+    digest = hashlib.sha256()
+    if os.path.isdir(folder_path):
+        for name in sorted(os.listdir(folder_path)):
+            stat = os.stat(os.path.join(folder_path, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class SemanticAnswerCache:
+    """Reuses chat answers for paraphrased questions.
+
+    An entry stores the normalized query embedding, the IDs of the chunks that were
+    retrieved for it and the final answer. A lookup hits when a stored query is at
+    least `similarity_threshold` cosine-similar AND retrieved the same chunks, so a
+    paraphrase only reuses an answer that was generated from identical context.
+
+    Retrievals without a query embedding (the lexical fast path) are cached by their
+    normalized question text instead, again together with the retrieved chunk IDs.
+    Both kinds share the TTL, the size bound and index invalidation.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_version: Optional[str] = None
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._exact_entries: "OrderedDict[tuple, dict]" = OrderedDict() # (normalized question, chunk ids) -> entry
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None # Stacked entry vectors, rebuilt lazily after changes
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def ensure_index_version(self, version: str):
+        """Drops every entry when the knowledge base index has been rebuilt."""
+        with self._lock:
+            if self.index_version != version:
+                if self.index_version is not None:
+                    logger.info(f"Index changed ({self.index_version} -> {version}); clearing {len(self._entries)} cached answers.")
+                self._entries.clear()
+                self._exact_entries.clear()
+                self._matrix = None
+                self.index_version = version
+
+    def lookup(self, query_embedding: List[float], chunk_ids: List[str], question: Optional[str] = None) -> Optional[str]:
+        """Answer for a similar question over the same chunks; matched by `question` text when
+        there is no query embedding."""
+        if not query_embedding:
+            return self._lookup_exact(question, chunk_ids) if question else None
+        vector = self._normalize(query_embedding)
+        context_key = frozenset(chunk_ids)
+        with self._lock:
+            self._expire()
+            if self._entries and self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.vstack([self._entries[i]["vector"] for i in self._matrix_ids])
+            if self._matrix is not None and self._matrix.shape[1] == vector.shape[0]:
+                similarities = self._matrix @ vector
+                for position in np.argsort(-similarities):
+                    if similarities[position] < self.similarity_threshold:
+                        break
+                    entry_id = self._matrix_ids[position]
+                    entry = self._entries[entry_id]
+                    if entry["context_key"] == context_key:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        logger.info(f"Semantic answer cache hit (similarity {similarities[position]:.3f}).")
+                        return entry["answer"]
+            self.misses += 1
+            return None
+
+    def _lookup_exact(self, question: str, chunk_ids: List[str]) -> Optional[str]:
+        key = (normalize_query(question), frozenset(chunk_ids))
+        with self._lock:
+            self._expire()
+            entry = self._exact_entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._exact_entries.move_to_end(key)
+            self.hits += 1
+            logger.info("Answer cache hit (same question text and chunks).")
+            return entry["answer"]
+
+    def store(self, query_embedding: List[float], chunk_ids: List[str], answer: str, question: Optional[str] = None):
+        if not query_embedding:
+            if question:
+                key = (normalize_query(question), frozenset(chunk_ids))
+                with self._lock:
+                    self._exact_entries.pop(key, None) # Re-insert as the newest entry
+                    self._exact_entries[key] = {"answer": answer, "stored_at": time.monotonic()}
+                    while len(self._exact_entries) > self.max_entries:
+                        self._exact_entries.popitem(last=False)
+            return
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": self._normalize(query_embedding),
+                "context_key": frozenset(chunk_ids),
+                "answer": answer,
+                "stored_at": time.monotonic()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [entry_id for entry_id, entry in self._entries.items() if now - entry["stored_at"] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+        for key in [key for key, entry in self._exact_entries.items() if now - entry["stored_at"] > self.ttl_seconds]:
+            del self._exact_entries[key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries) + len(self._exact_entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
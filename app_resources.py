@@ -0,0 +1,166 @@
+# app_resources.py
+import logging
+from typing import Optional
+
+import streamlit as st
+
+from answer_cache import SemanticAnswerCache, index_version
+from engine import (
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY_THRESHOLD, CHUNK_SELECTION_ENABLED, CONTEXT_TOKEN_BUDGET,
+    FAISS_INDEX_PATH, FAISS_LOAD_MODE, FAST_PATH_ENABLED, HTTP2_ENABLED, HTTP_POOL_SIZE, QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_TTL_SECONDS, RETRIEVAL_K, create_chat_client, create_chunk_selector, create_embeddings,
+    create_fast_path_gate, load_vector_store, university_base_url
+)
+from http_client import AsyncPooledTransport, get_transport
+from index_types import load_index_settings
+from lexical_index import LexicalIndex
+from query_cache import QueryEmbeddingCache
+from rag_pipeline import AsyncRAGPipeline, get_background_loop
+from section_search import SectionSearch
+from warmup import run_warmup
+
+logger = logging.getLogger(__name__)
+
+# Shared, process-wide resources of the chatbot: the engine.py building blocks cached with
+# st.cache_resource. They live in this module rather than in main.py so the server
+# launcher (serve.py) can build them before the first session runs the script; cache
+# entries are keyed by module and function, so sessions then find them already cached.
+
+# --- Configuration ---
+university_api_key = st.secrets.get("university_api_key")
+WARMUP_QUERY = "What is the annual fee of the Smart Card?" # Retrieval-only synthetic query run at warm-up; None to skip
+WARMUP_TIMEOUT_SECONDS = 60
+TIMING_DEBUG_EXPANDER = False # Show the per-stage timing of each answer in the chat; also on with ?debug=timings
+
+
+# --- Helper function to share the HTTP connection pool ---
+@st.cache_resource
+def initialize_http_transport():
+    logger.info(f"Creating shared HTTP transport with pool size {HTTP_POOL_SIZE}")
+    return get_transport(pool_size=HTTP_POOL_SIZE)
+
+# --- Helper function to share query embeddings across sessions ---
+@st.cache_resource
+def initialize_query_cache(embedding_dimensions: int = None):
+    # One cache per embedding size, so a rebuild with other dimensions never reuses stale vectors
+    logger.info(f"Creating query embedding cache (max {QUERY_CACHE_MAX_ENTRIES} entries, TTL {QUERY_CACHE_TTL_SECONDS}s)")
+    return QueryEmbeddingCache(max_entries=QUERY_CACHE_MAX_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+# --- Helper function to read the build settings saved next to the FAISS files ---
+@st.cache_resource(max_entries=1)
+def initialize_index_settings(index_version: str):
+    return load_index_settings(FAISS_INDEX_PATH) or {}
+
+# --- Helper function to build the section filter for the loaded index ---
+@st.cache_resource(max_entries=1)
+def initialize_section_search(_vectorstore, index_version: str):
+    logger.info("Building section search over the loaded FAISS index.")
+    return SectionSearch(_vectorstore)
+
+# --- Helper function to remove redundant chunks using the stored vectors ---
+@st.cache_resource(max_entries=1)
+def initialize_chunk_selector(_vectorstore, index_version: str):
+    logger.info("Mapping stored vectors for chunk de-duplication and MMR.")
+    return create_chunk_selector(_vectorstore, FAISS_INDEX_PATH)
+
+# --- Helper function to load the BM25 index saved next to the FAISS files ---
+@st.cache_resource(max_entries=1)
+def initialize_lexical_index(index_version: str):
+    return LexicalIndex.load(FAISS_INDEX_PATH)
+
+# --- Helper function to share the lexical fast-path gate (and its counters) ---
+@st.cache_resource
+def initialize_fast_path_gate():
+    return create_fast_path_gate()
+
+# --- Helper function to share answers between paraphrased questions ---
+@st.cache_resource
+def initialize_answer_cache():
+    logger.info(f"Creating semantic answer cache (threshold {ANSWER_CACHE_SIMILARITY_THRESHOLD}, max {ANSWER_CACHE_MAX_ENTRIES} entries)")
+    return SemanticAnswerCache(similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES)
+
+# --- Helper function to initialize Vector Store ---
+# index_version is part of the cache key, so a rebuilt index is reloaded without a restart
+@st.cache_resource(show_spinner="Loading Knowledge Base...", max_entries=1)
+def initialize_vector_store(_embedding_function, index_version: str):
+    # Raises when the index is missing or unreadable; failures are not cached, so the next session retries
+    return load_vector_store(_embedding_function, FAISS_INDEX_PATH, FAISS_LOAD_MODE, settings=initialize_index_settings(index_version))
+
+# --- Helper function to share the async connection pool ---
+@st.cache_resource
+def initialize_async_transport():
+    logger.info(f"Creating shared async HTTP transport with pool size {HTTP_POOL_SIZE}")
+    return AsyncPooledTransport(pool_size=HTTP_POOL_SIZE, http2=HTTP2_ENABLED)
+
+
+# --- Per-session pipeline over the shared resources ---
+def build_rag_pipeline(api_key: str) -> AsyncRAGPipeline:
+    """Wires the cached transports, index structures and caches into a RAG pipeline.
+
+    Raises when the knowledge base cannot be loaded; the caller decides how to report it.
+    """
+    http_transport = initialize_http_transport()
+    async_transport = initialize_async_transport()
+    current_index_version = index_version(FAISS_INDEX_PATH)
+    # Queries must be embedded with the same `dimensions` the index was built with
+    embedding_dimensions = initialize_index_settings(current_index_version).get("embedding_dimensions")
+    embeddings = create_embeddings(
+        api_key,
+        http_transport,
+        async_transport,
+        query_cache=initialize_query_cache(embedding_dimensions),
+        dimensions=embedding_dimensions
+    )
+    vectorstore = initialize_vector_store(embeddings, current_index_version)
+    answer_cache = initialize_answer_cache()
+    answer_cache.ensure_index_version(current_index_version)
+    chat_client = create_chat_client(api_key, async_transport)
+    return AsyncRAGPipeline(
+        embeddings=embeddings,
+        vectorstore=vectorstore,
+        chat_client=chat_client,
+        answer_cache=answer_cache,
+        section_search=initialize_section_search(vectorstore, current_index_version),
+        lexical_index=initialize_lexical_index(current_index_version),
+        fast_path_gate=initialize_fast_path_gate() if FAST_PATH_ENABLED else None,
+        chunk_selector=initialize_chunk_selector(vectorstore, current_index_version) if CHUNK_SELECTION_ENABLED else None,
+        k=RETRIEVAL_K,
+        context_token_budget=CONTEXT_TOKEN_BUDGET
+    )
+
+# --- Eager warm-up at server start ---
+def _open_connections():
+    """Pays DNS + TCP + TLS to the GenAI host once per transport; any HTTP status will do."""
+    initialize_http_transport().get(university_base_url, timeout=10)
+    async_transport = initialize_async_transport()
+    get_background_loop().run(async_transport.get(university_base_url, timeout=10), timeout=15)
+
+def warm_up(api_key: Optional[str] = None, synthetic_query: Optional[str] = WARMUP_QUERY) -> bool:
+    """Builds every shared resource before users arrive and reports readiness.
+
+    Loading the knowledge base is required; opening connections and the synthetic
+    query (retrieval only, no chat tokens) are best-effort.
+    """
+    api_key = api_key or university_api_key
+    if not api_key:
+        logger.error("Warm-up skipped: no University API key in Streamlit secrets.")
+        return run_warmup([("api_key", _missing_api_key, True)])
+    pipeline_holder = {}
+
+    def load_knowledge_base():
+        pipeline_holder["pipeline"] = build_rag_pipeline(api_key)
+
+    def run_synthetic_query():
+        retrieval = get_background_loop().run(pipeline_holder["pipeline"].aretrieve(synthetic_query), timeout=WARMUP_TIMEOUT_SECONDS)
+        logger.info(f"Warm-up query retrieved {len(retrieval.documents)} documents.")
+
+    steps = [
+        ("knowledge_base", load_knowledge_base, True),
+        ("connections", _open_connections, False)
+    ]
+    if synthetic_query:
+        steps.append(("synthetic_query", run_synthetic_query, False))
+    return run_warmup(steps)
+
+def _missing_api_key():
+    raise RuntimeError("University API key not found in Streamlit secrets (key: university_api_key).")
@@ -0,0 +1,488 @@
+# benchmark.py
+import os
+import sys
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import math
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from chunking import CHUNK_OVERLAP, CHUNK_SIZE, split_source
+from chunk_selection import ChunkSelector
+from engine import CONTEXT_TOKEN_BUDGET, FAISS_INDEX_PATH, FAST_PATH_ENABLED, RETRIEVAL_K, create_chunk_selector, create_fast_path_gate, load_vector_store
+from index_types import INDEX_TYPES, QUANTIZATIONS, build_index, index_vectors, load_index_settings, tune_index
+from knowledge_loader import KNOWLEDGE_PATH, iter_sources
+from lexical_index import FastPathGate, LexicalIndex, tokenize
+from rag_pipeline import AsyncRAGPipeline, build_messages
+from section_search import SectionSearch
+
+logger = logging.getLogger(__name__)
+
+# --- Settings ---
+BENCHMARK_DATA_PATH = "benchmark_data"
+GOLDEN_SET_FILENAME = "golden_set.json" # [{"question", "section", "expected": [text that a relevant chunk contains]}]
+BASELINE_FILENAME = "baseline.json" # Results of an accepted run, compared against by default
+RECORDED_QUESTIONS_FILENAME = "query_embeddings.json" # Recorded questions (row order) and the model they came from
+RECORDED_VECTORS_FILENAME = "query_embeddings.f32" # Their embeddings, float32 little-endian, row-major
+MODES = ("mock", "recorded")
+MOCK_EMBEDDING_DIMENSIONS = 512
+RECALL_AT = (1, 3, 5, 10)
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+STAGES = ("embed", "search", "prompt_build", "chat", "total")
+QUALITY_TOLERANCE = 0.02 # Absolute drop in recall@k or MRR reported as a regression
+LATENCY_TOLERANCE = 0.25 # Relative p95 increase reported as a regression
+LATENCY_FLOOR_MS = 1.0 # p95 changes smaller than this are timer noise, never regressions
+OFFLINE_ANSWER = "Offline benchmark answer." # Streamed by the offline chat client in a few pieces
+FAST_PATH_COVERAGE_GRID = [round(0.5 + 0.05 * step, 2) for step in range(11)] # --calibrate-fast-path sweeps every combination
+FAST_PATH_MARGIN_GRID = [round(0.05 * step, 2) for step in range(11)]
+FAST_PATH_MATCHED_TERMS_GRID = [1, 2, 3, 4]
+CALIBRATION_METRICS = tuple(f"recall@{k}" for k in RECALL_AT) + ("mrr",) # Must not drop below the no-fast-path run
+
+
+# --- Offline Embeddings ---
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embeddings: feature-hashed unigrams and bigrams of BM25 terms.
+
+    Only lexical overlap is captured, so absolute scores are lower than with the real
+    model; they are stable across runs and machines, which is what comparing chunking,
+    k or index settings needs.
+    """
+
+    def __init__(self, dimensions: int = MOCK_EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        terms = tokenize(text)
+        features = Counter(terms + [a + " " + b for a, b in zip(terms, terms[1:])])
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, count in features.items():
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class RecordedEmbeddings(Embeddings):
+    """Replays query embeddings recorded from the live API with --record."""
+
+    def __init__(self, vectors: Dict[str, List[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise RuntimeError(
+            f"Recorded mode replays golden-set query embeddings only and cannot embed {len(texts)} documents; "
+            "it searches the committed index. Use --mode mock to benchmark other chunking or index settings."
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        if text not in self.vectors:
+            raise KeyError(f"No recorded embedding for '{text}'. Run 'python benchmark.py --record' with an API key.")
+        return self.vectors[text]
+
+
+class TimedEmbeddings:
+    """Wraps the pipeline's embeddings and keeps the duration of the last query embedding."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.last_ms = 0.0
+
+    async def aembed_query(self, text: str) -> List[float]:
+        start = time.perf_counter()
+        try:
+            return await self.embeddings.aembed_query(text)
+        finally:
+            self.last_ms = (time.perf_counter() - start) * 1000
+
+
+class OfflineChat:
+    """Stands in for AsyncUniversityChat without network access, so the chat stage
+    measures the pipeline's own streaming overhead."""
+
+    async def astream(self, messages: List[Dict[str, str]]):
+        for word in OFFLINE_ANSWER.split(" "):
+            await asyncio.sleep(0)
+            yield word + " "
+
+
+# --- Golden Set and Recordings ---
+def load_golden_set(data_path: str = BENCHMARK_DATA_PATH) -> List[dict]:
+    with open(os.path.join(data_path, GOLDEN_SET_FILENAME), encoding="utf-8") as f:
+        return json.load(f)
+
+def load_recorded_embeddings(data_path: str = BENCHMARK_DATA_PATH) -> Dict[str, List[float]]:
+    questions_path = os.path.join(data_path, RECORDED_QUESTIONS_FILENAME)
+    if not os.path.exists(questions_path):
+        raise FileNotFoundError(f"{questions_path} not found. Run 'python benchmark.py --record' with an API key first.")
+    with open(questions_path, encoding="utf-8") as f:
+        recorded = json.load(f)
+    vectors = np.fromfile(os.path.join(data_path, RECORDED_VECTORS_FILENAME), dtype="<f4")
+    vectors = vectors.reshape(len(recorded["questions"]), recorded["dimensions"])
+    return {question: vectors[row].tolist() for row, question in enumerate(recorded["questions"])}
+
+def record_query_embeddings(golden_set: List[dict], api_key: str, data_path: str = BENCHMARK_DATA_PATH):
+    """Embeds every golden question with the live API, as the served index expects, and saves them."""
+    from engine import create_embeddings, university_embedding_model_name
+    from http_client import AsyncPooledTransport, get_transport
+
+    settings = load_index_settings(FAISS_INDEX_PATH) or {}
+    embeddings = create_embeddings(api_key, get_transport(), AsyncPooledTransport(), dimensions=settings.get("embedding_dimensions"))
+    questions = [entry["question"] for entry in golden_set]
+    vectors = np.array([embeddings.embed_query(question) for question in questions], dtype="<f4")
+    vectors.tofile(os.path.join(data_path, RECORDED_VECTORS_FILENAME))
+    with open(os.path.join(data_path, RECORDED_QUESTIONS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": university_embedding_model_name,
+            "dimensions": int(vectors.shape[1]),
+            "questions": questions
+        }, f, ensure_ascii=False, indent=2)
+    logger.info(f"Recorded {len(questions)} query embeddings ({vectors.shape[1]} dims) in {data_path}")
+
+
+# --- Pipeline Setup ---
+def build_mock_vectorstore(chunk_size: int, chunk_overlap: int, index_type: str, quantization: str) -> FAISS:
+    """Chunks the knowledge sources with the given settings and indexes them with hashing embeddings."""
+    chunks = []
+    for source in iter_sources(KNOWLEDGE_PATH):
+        chunks.extend(split_source(source, chunk_size=chunk_size, chunk_overlap=chunk_overlap))
+    db = FAISS.from_documents(chunks, HashingEmbeddings())
+    if index_type != "flat" or quantization != "none":
+        vectors = index_vectors(db.index)
+        db.index = build_index(vectors, index_type, quantization=quantization)
+        tune_index(db.index, vectors)
+    logger.info(f"Mock index: {len(chunks)} chunks (size {chunk_size}, overlap {chunk_overlap}), {index_type}/{quantization}")
+    return db
+
+def build_benchmark_pipeline(
+    mode: str,
+    k: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    index_type: str,
+    quantization: str,
+    fast_path: bool,
+    context_token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    chunk_selection: bool = True
+) -> AsyncRAGPipeline:
+    if mode == "recorded":
+        embeddings = RecordedEmbeddings(load_recorded_embeddings())
+        vectorstore = load_vector_store(embeddings, FAISS_INDEX_PATH, load_mode="memory")
+        lexical_index = LexicalIndex.load(FAISS_INDEX_PATH)
+        chunk_selector = create_chunk_selector(vectorstore, FAISS_INDEX_PATH)
+    else:
+        embeddings = HashingEmbeddings()
+        vectorstore = build_mock_vectorstore(chunk_size, chunk_overlap, index_type, quantization)
+        lexical_index = LexicalIndex.from_vectorstore(vectorstore)
+        chunk_selector = ChunkSelector.from_vectorstore(vectorstore)
+    return AsyncRAGPipeline(
+        embeddings=TimedEmbeddings(embeddings),
+        vectorstore=vectorstore,
+        chat_client=OfflineChat(),
+        answer_cache=None, # Repeated questions must not turn into cache hits
+        section_search=SectionSearch(vectorstore),
+        lexical_index=lexical_index,
+        fast_path_gate=create_fast_path_gate() if fast_path else None,
+        chunk_selector=chunk_selector if chunk_selection else None,
+        k=k,
+        context_token_budget=context_token_budget
+    )
+
+
+# --- Metrics ---
+def relevant_ranks(documents, expected: List[str]) -> List[int]:
+    """1-based ranks of the retrieved chunks that contain any expected text."""
+    return [rank for rank, doc in enumerate(documents, start=1) if any(text in doc.page_content for text in expected)]
+
+def question_recall(documents, expected: List[str], k: int) -> float:
+    """Fraction of the expected texts found in the top k chunks."""
+    top = [doc.page_content for doc in documents[:k]]
+    return sum(any(text in content for content in top) for text in expected) / len(expected)
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.array(samples)
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in LATENCY_PERCENTILES}
+    summary["mean"] = round(float(values.mean()), 3)
+    return summary
+
+async def run_question(pipeline: AsyncRAGPipeline, question: str) -> tuple:
+    """Runs one question end to end and returns (retrieval, stage timings in ms)."""
+    pipeline.embeddings.last_ms = 0.0
+    start = time.perf_counter()
+    retrieval = await pipeline.aretrieve(question)
+    retrieve_ms = (time.perf_counter() - start) * 1000
+    prompt_start = time.perf_counter()
+    build_messages(retrieval.context, question)
+    prompt_ms = (time.perf_counter() - prompt_start) * 1000
+    chat_start = time.perf_counter()
+    async for _ in pipeline.astream_answer(retrieval):
+        pass
+    chat_ms = (time.perf_counter() - chat_start) * 1000
+    timings = {
+        "embed": pipeline.embeddings.last_ms, # 0 when the lexical fast path skipped the embedding
+        "search": retrieve_ms - pipeline.embeddings.last_ms,
+        "prompt_build": prompt_ms,
+        "chat": chat_ms,
+        "total": (time.perf_counter() - start) * 1000
+    }
+    return retrieval, timings
+
+def summarize_quality(per_question: List[dict]) -> Dict[str, float]:
+    count = len(per_question)
+    quality = {f"recall@{k}": round(sum(q[f"recall@{k}"] for q in per_question) / count, 4) for k in RECALL_AT}
+    quality["mrr"] = round(sum(q["reciprocal_rank"] for q in per_question) / count, 4)
+    quality["fast_path_rate"] = round(sum(q["fast_path"] for q in per_question) / count, 4)
+    quality["mean_context_chunks"] = round(sum(q["context_chunks"] for q in per_question) / count, 2)
+    quality["mean_context_tokens"] = round(sum(q["context_tokens"] for q in per_question) / count, 1)
+    return quality
+
+async def run_benchmark(pipeline: AsyncRAGPipeline, golden_set: List[dict], repeat: int) -> dict:
+    """Scores retrieval on the first pass and collects stage latencies over `repeat` passes."""
+    samples = {stage: [] for stage in STAGES}
+    per_question = []
+    for run in range(repeat):
+        for entry in golden_set:
+            retrieval, timings = await run_question(pipeline, entry["question"])
+            for stage, value in timings.items():
+                samples[stage].append(value)
+            if run == 0:
+                ranks = relevant_ranks(retrieval.documents, entry["expected"])
+                per_question.append({
+                    "question": entry["question"],
+                    "section": entry.get("section"),
+                    "ranks": ranks,
+                    "reciprocal_rank": 1.0 / ranks[0] if ranks else 0.0,
+                    **{f"recall@{k}": question_recall(retrieval.documents, entry["expected"], k) for k in RECALL_AT},
+                    "fast_path": retrieval.fast_path,
+                    "context_chunks": len(retrieval.documents),
+                    "context_tokens": retrieval.context_tokens,
+                    "routed_sections": retrieval.sections
+                })
+    return {
+        "quality": summarize_quality(per_question),
+        "latency_ms": {stage: percentiles(values) for stage, values in samples.items()},
+        "questions": per_question
+    }
+
+
+# --- Fast-path Calibration ---
+class RecordingGate(FastPathGate):
+    """Takes the fast path whenever BM25 found anything and keeps each question's
+    (coverage, margin, matched_terms), so one run scores every threshold setting."""
+
+    def __init__(self):
+        super().__init__(min_coverage=0.0, min_margin=0.0, min_matched_terms=0)
+        self.features: Dict[str, tuple] = {}
+
+    def decide(self, index: LexicalIndex, query: str, hits) -> bool:
+        self.features[query] = self.measure(index, query, hits)
+        return super().decide(index, query, hits)
+
+async def calibrate_fast_path(pipeline: AsyncRAGPipeline, golden_set: List[dict]) -> dict:
+    """Sweeps the fast-path thresholds over the golden set.
+
+    Each question is answered once through the vector path and once through the fast
+    path; a threshold setting then takes the fast-path answer for the questions it admits.
+    The recommended gate takes the fast path most often without lowering any of
+    CALIBRATION_METRICS; None when every gate that takes it loses quality.
+    """
+    pipeline.fast_path_gate = None
+    reference = await run_benchmark(pipeline, golden_set, repeat=1)
+    recording_gate = RecordingGate()
+    pipeline.fast_path_gate = recording_gate
+    lexical = await run_benchmark(pipeline, golden_set, repeat=1)
+    pipeline.fast_path_gate = None
+
+    candidates = []
+    for min_coverage, min_margin, min_matched_terms in itertools.product(
+        FAST_PATH_COVERAGE_GRID, FAST_PATH_MARGIN_GRID, FAST_PATH_MATCHED_TERMS_GRID
+    ):
+        gate = FastPathGate(min_coverage, min_margin, min_matched_terms)
+        per_question = [
+            fast if fast["fast_path"] and gate.admits(*recording_gate.features[fast["question"]]) else full
+            for full, fast in zip(reference["questions"], lexical["questions"])
+        ]
+        quality = summarize_quality(per_question)
+        candidates.append({
+            "min_coverage": min_coverage,
+            "min_margin": min_margin,
+            "min_matched_terms": min_matched_terms,
+            "lossless": all(quality[metric] >= reference["quality"][metric] for metric in CALIBRATION_METRICS),
+            **{metric: quality[metric] for metric in CALIBRATION_METRICS + ("fast_path_rate",)}
+        })
+    # Loosest lossless gate; among gates taking the same questions, the strictest thresholds
+    lossless = [c for c in candidates if c["lossless"] and c["fast_path_rate"] > 0]
+    recommended = max(
+        lossless,
+        key=lambda c: (c["fast_path_rate"], c["min_coverage"], c["min_margin"], c["min_matched_terms"]),
+        default=None
+    )
+    return {
+        "reference": {metric: reference["quality"][metric] for metric in CALIBRATION_METRICS},
+        "recommended": recommended,
+        "candidates": candidates
+    }
+
+def format_calibration(calibration: dict) -> str:
+    reference = calibration["reference"]
+    lines = ["Without fast path: " + "  ".join(f"{metric}={value:.3f}" for metric, value in reference.items())]
+    best = sorted(calibration["candidates"], key=lambda c: c["fast_path_rate"], reverse=True)
+    lines.append(f"{'coverage':>9}{'margin':>8}{'terms':>6}{'rate':>7}" + "".join(f"{metric:>10}" for metric in reference) + "  lossless")
+    for c in [c for c in best if c["lossless"]][:5] + [c for c in best if not c["lossless"]][:5]:
+        lines.append(
+            f"{c['min_coverage']:>9.2f}{c['min_margin']:>8.2f}{c['min_matched_terms']:>6}{c['fast_path_rate']:>7.3f}" +
+            "".join(f"{c[metric]:>10.3f}" for metric in reference) + f"  {'yes' if c['lossless'] else 'no'}"
+        )
+    recommended = calibration["recommended"]
+    if recommended is None:
+        lines.append("No threshold setting takes the fast path without losing quality: set FAST_PATH_ENABLED = False.")
+    else:
+        lines.append(
+            f"Recommended: FAST_PATH_MIN_COVERAGE = {recommended['min_coverage']}, FAST_PATH_MIN_MARGIN = {recommended['min_margin']}, "
+            f"FAST_PATH_MIN_MATCHED_TERMS = {recommended['min_matched_terms']} (fast path on {recommended['fast_path_rate']:.1%} of questions)"
+        )
+    return "\n".join(lines)
+
+
+# --- Baseline Comparison ---
+def compare_to_baseline(results: dict, baseline: dict) -> List[str]:
+    """Regressions of `results` against `baseline`, as human-readable lines."""
+    regressions = []
+    for metric, base_value in baseline.get("quality", {}).items():
+        if metric in ("fast_path_rate", "mean_context_chunks", "mean_context_tokens") or metric not in results["quality"]:
+            continue
+        value = results["quality"][metric]
+        if base_value - value > QUALITY_TOLERANCE:
+            regressions.append(f"{metric} dropped from {base_value:.3f} to {value:.3f}")
+    for stage, base_summary in baseline.get("latency_ms", {}).items():
+        base_p95 = base_summary.get("p95")
+        p95 = results["latency_ms"].get(stage, {}).get("p95")
+        if base_p95 is None or p95 is None:
+            continue
+        if p95 > base_p95 * (1 + LATENCY_TOLERANCE) and p95 - base_p95 > LATENCY_FLOOR_MS:
+            regressions.append(f"{stage} p95 rose from {base_p95:.2f} ms to {p95:.2f} ms")
+    return regressions
+
+def format_summary(results: dict) -> str:
+    quality = results["quality"]
+    lines = ["  ".join(f"{metric}={value:.3f}" for metric, value in quality.items())]
+    lines.append(f"{'stage':<13}" + "".join(f"{name:>10}" for name in [f"p{p}" for p in LATENCY_PERCENTILES] + ["mean"]))
+    for stage in STAGES:
+        summary = results["latency_ms"].get(stage, {})
+        lines.append(f"{stage:<13}" + "".join(f"{summary.get(name, 0):>10.2f}" for name in [f"p{p}" for p in LATENCY_PERCENTILES] + ["mean"]))
+    misses = [q["question"] for q in results["questions"] if not q["ranks"]]
+    if misses:
+        lines.append(f"Not retrieved in top k ({len(misses)}): " + "; ".join(misses))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure retrieval quality and per-stage latency on the golden question set, offline.")
+    parser.add_argument("--mode", choices=MODES, default="mock", help="mock: index the knowledge sources with local hashing embeddings; recorded: the committed index with recorded query embeddings (default: %(default)s).")
+    parser.add_argument("--k", type=int, default=RETRIEVAL_K, help="Chunks retrieved per question (default: %(default)s).")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Mock mode: chunk size (default: %(default)s).")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="Mock mode: chunk overlap (default: %(default)s).")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="Mock mode: FAISS index type (default: %(default)s).")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="none", help="Mock mode: vector encoding (default: %(default)s).")
+    parser.add_argument("--context-tokens", type=int, default=CONTEXT_TOKEN_BUDGET, help="Token budget of the prompt context, 0 for no budget (default: %(default)s).")
+    parser.add_argument("--no-chunk-selection", action="store_true", help="Keep overlapping and near-duplicate chunks in retrieval order.")
+    parser.add_argument("--fast-path", action=argparse.BooleanOptionalAction, default=FAST_PATH_ENABLED, help="Skip the query embedding when BM25 is confident (default: %(default)s, as served).")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the golden set for latency percentiles (default: %(default)s).")
+    parser.add_argument("--output", help="Write the results JSON here (default: print the summary only).")
+    parser.add_argument("--baseline", default=os.path.join(BENCHMARK_DATA_PATH, BASELINE_FILENAME), help="Baseline results to compare against (default: %(default)s).")
+    parser.add_argument("--update-baseline", action="store_true", help="Save these results as the new baseline.")
+    parser.add_argument("--calibrate-fast-path", action="store_true", help="Sweep the fast-path thresholds over the golden set, print the loosest gate without recall loss and exit.")
+    parser.add_argument("--record", action="store_true", help="Record golden-question embeddings from the live API (needs UNIVERSITY_API_KEY) and exit.")
+    parser.add_argument("--verbose", action="store_true", help="Log pipeline activity.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s', stream=sys.stderr)
+    logger.setLevel(logging.INFO)
+    golden_set = load_golden_set()
+
+    if args.record:
+        from dotenv import load_dotenv
+        load_dotenv()
+        record_query_embeddings(golden_set, os.environ["UNIVERSITY_API_KEY"])
+        sys.exit(0)
+
+    config = {
+        "mode": args.mode,
+        "k": args.k,
+        "chunk_size": args.chunk_size if args.mode == "mock" else None,
+        "chunk_overlap": args.chunk_overlap if args.mode == "mock" else None,
+        "index_type": args.index_type if args.mode == "mock" else (load_index_settings(FAISS_INDEX_PATH) or {}).get("index_type", "flat"),
+        "quantization": args.quantization if args.mode == "mock" else (load_index_settings(FAISS_INDEX_PATH) or {}).get("quantization", "none"),
+        "fast_path": args.fast_path,
+        "context_token_budget": args.context_tokens or None,
+        "chunk_selection": not args.no_chunk_selection,
+        "repeat": args.repeat,
+        "questions": len(golden_set)
+    }
+    try:
+        pipeline = build_benchmark_pipeline(
+            args.mode, args.k, args.chunk_size, args.chunk_overlap, args.index_type, args.quantization, args.fast_path,
+            args.context_tokens or None, not args.no_chunk_selection
+        )
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(2)
+    if args.calibrate_fast_path:
+        calibration = asyncio.run(calibrate_fast_path(pipeline, golden_set))
+        print(format_calibration(calibration))
+        if args.mode == "mock":
+            print("Mock mode: hashing embeddings agree with BM25 far more than the served model does. "
+                  "Confirm with --mode recorded before enabling the fast path in engine.py.")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"config": config, **calibration}, f, ensure_ascii=False, indent=2)
+            print(f"Calibration written to {args.output}")
+        sys.exit(0)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        **asyncio.run(run_benchmark(pipeline, golden_set, args.repeat))
+    }
+    print(format_summary(results))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        sys.exit(0)
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = {key: (baseline["config"].get(key), value) for key, value in config.items() if baseline["config"].get(key) != value}
+        if changed:
+            print(f"Config differs from the baseline: {changed}")
+        regressions = compare_to_baseline(results, baseline)
+        if regressions:
+            print("REGRESSIONS against the baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against the baseline.")
@@ -1,82 +1,355 @@
 # build_index.py
 import os
+import sys
+import argparse
+import ctypes
+import errno
+import json
 import logging
+import shutil
+import tempfile
+import numpy as np
 from dotenv import load_dotenv
 
 # --- RAG Libraries ---
 from langchain_community.vectorstores import FAISS
 from langchain_core.embeddings import Embeddings # Base class for UniversityEmbeddings if needed separately
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 
-from main import UniversityEmbeddings 
-from config import full_knowledge_text 
+from engine import university_api_version, university_base_url, university_embedding_model_name
+from university_embeddings import UniversityEmbeddings
+from embedding_cache import EmbeddingCache, hash_text
+from lexical_index import LEXICAL_INDEX_FILENAME, LexicalIndex
+from index_store import IndexStore, has_legacy_store, has_store, load_vectorstore, save_store
+from index_types import (
+    INDEX_TYPES, QUANTIZATIONS, build_index, compare_compression, format_report, index_vectors,
+    load_index_settings, save_index_settings, tune_index
+)
+from chunking import split_sources
+from knowledge_loader import KNOWLEDGE_PATH, corpus_bytes, list_sources
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv() # Load environment variables from .env file
 
 # --- Secrets & Settings ---
-UNIVERSITY_API_KEY = os.getenv("UNIVERSITY_API_KEY")
-if not UNIVERSITY_API_KEY:
-    logging.error("UNIVERSITY_API_KEY not found in .env file.")
-    exit(1)
+UNIVERSITY_API_KEY = os.getenv("UNIVERSITY_API_KEY") # Only needed to build; --report works without it
 
-# Reuse configuration from main.py if possible
-UNIVERSITY_BASE_URL = "https://genai.hkbu.edu.hk/general/rest"
-UNIVERSITY_EMBEDDING_MODEL_NAME = "text-embedding-3-large"
-UNIVERSITY_API_VERSION = "2024-05-01-preview"
-EMBEDDING_BATCH_SIZE = 16 # Match batch size used in main app
+# Same endpoint and model as the serving engine (engine.py)
+UNIVERSITY_BASE_URL = university_base_url
+UNIVERSITY_EMBEDDING_MODEL_NAME = university_embedding_model_name
+UNIVERSITY_API_VERSION = university_api_version
+EMBEDDING_BATCH_SIZE = 64 # Starting texts per request; batches are packed by tokens and tuned at runtime
+EMBEDDING_MAX_BATCH_TOKENS = 8000 # Starting per-request token budget; tuned at runtime up to the API's limit
+EMBEDDING_MAX_CONCURRENCY = 4 # Batch requests in flight at once during a rebuild
+EMBEDDING_DIMENSIONS = None # e.g. 1024 to request shortened vectors via the API's `dimensions`; None = native 3072
 
 FAISS_INDEX_PATH = "faiss_index" # Directory where index files will be saved
+INDEX_TYPE = "flat" # flat (exact), hnsw or ivf; approximate types are tuned against flat at build time
+QUANTIZATION = "none" # none (float32), fp16, int8 or pq (ivf only)
+EMBEDDING_CACHE_PATH = os.path.join(".embedding_cache", "embeddings.sqlite3") # Reused across rebuilds
+
+def chunk_fingerprint(doc: Document) -> str:
+    """Content hash of a chunk (text + metadata) used to diff chunk sets between builds."""
+    return hash_text(doc.page_content + "\x00" + json.dumps(doc.metadata, sort_keys=True, default=str))
+
+def plan_incremental_update(db: FAISS, chunks: list) -> tuple:
+    """Diffs the stored chunks against `chunks` by fingerprint.
+
+    Returns (docstore ids to delete, [(chunk, stored vector)] to re-add without
+    embedding, chunks to embed). A chunk whose text is unchanged but whose metadata
+    changed reuses the vector of the stored chunk it replaces.
+    """
+    stored = {} # fingerprint -> docstore ids
+    for docstore_id in db.index_to_docstore_id.values():
+        stored.setdefault(chunk_fingerprint(db.docstore.search(docstore_id)), []).append(docstore_id)
+    wanted = {} # fingerprint -> chunks
+    for chunk in chunks:
+        wanted.setdefault(chunk_fingerprint(chunk), []).append(chunk)
+
+    to_delete = []
+    for fingerprint, docstore_ids in stored.items():
+        surplus = len(docstore_ids) - len(wanted.get(fingerprint, []))
+        if surplus > 0:
+            to_delete.extend(docstore_ids[:surplus])
+    to_add = []
+    for fingerprint, new_chunks in wanted.items():
+        missing = len(new_chunks) - len(stored.get(fingerprint, []))
+        if missing > 0:
+            to_add.extend(new_chunks[-missing:])
+
+    # Exact vectors of the removed chunks by text; db.index is a float32 flat index here
+    faiss_ids = {docstore_id: faiss_id for faiss_id, docstore_id in db.index_to_docstore_id.items()}
+    reusable = {}
+    for docstore_id in to_delete:
+        text = db.docstore.search(docstore_id).page_content
+        reusable.setdefault(text, []).append(db.index.reconstruct(faiss_ids[docstore_id]).tolist())
+    to_reuse, to_embed = [], []
+    for chunk in to_add:
+        if reusable.get(chunk.page_content):
+            to_reuse.append((chunk, reusable[chunk.page_content].pop()))
+        else:
+            to_embed.append(chunk)
+    return to_delete, to_reuse, to_embed
+
+def update_index_incrementally(db: FAISS, chunks: list) -> tuple:
+    """Brings an existing FAISS store in line with `chunks`, embedding only new chunks.
+
+    A changed chunk shows up as one removal plus one addition. When only its metadata
+    changed, the removed chunk's stored vector is reused instead of embedding the text
+    again. Returns (added, removed).
+    """
+    to_delete, to_reuse, to_embed = plan_incremental_update(db, chunks)
+    if to_delete:
+        db.delete(to_delete)
+    if to_reuse:
+        db.add_embeddings(
+            [(chunk.page_content, vector) for chunk, vector in to_reuse],
+            metadatas=[chunk.metadata for chunk, _ in to_reuse]
+        )
+        logging.info(f"Reused stored vectors for {len(to_reuse)} chunks whose text did not change.")
+    if to_embed:
+        db.add_documents(to_embed) # Calls the embedding API for the new chunks only
+    return len(to_reuse) + len(to_embed), len(to_delete)
+
+def exact_vectors(db: FAISS, embeddings: Embeddings, quantization: str):
+    """Float32 vectors of every stored chunk, in FAISS id order.
+
+    Quantized indexes only hold approximations, so their vectors are fetched again through
+    `embeddings` (normally straight from the on-disk embedding cache).
+    """
+    if quantization == "none":
+        return index_vectors(db.index)
+    texts = [db.docstore.search(db.index_to_docstore_id[i]).page_content for i in range(db.index.ntotal)]
+    return np.array(embeddings.embed_documents(texts), dtype=np.float32)
+
+def convert_index(db: FAISS, vectors: np.ndarray, index_type: str, quantization: str = "none") -> list:
+    """Rebuilds the store's index from its exact `vectors` as `index_type`/`quantization`
+    (FAISS ids keep their order).
+
+    Approximate types get their search parameter tuned; returns the recall-vs-latency report.
+    """
+    db.index = build_index(vectors, index_type, quantization=quantization)
+    if index_type == "flat" and quantization == "none":
+        return []
+    report = tune_index(db.index, vectors)
+    logging.info(f"Recall vs latency for {index_type}/{quantization} ({len(vectors)} vectors):\n{format_report(report)}")
+    return report
+
+def exchange_directories(path_a: str, path_b: str) -> bool:
+    """Atomically swaps two existing directories with Linux renameat2(RENAME_EXCHANGE).
+
+    Returns False where the call is unavailable (other platforms, old glibc or kernels,
+    file systems without support), so the caller can fall back to two renames.
+    """
+    renameat2 = getattr(ctypes.CDLL(None, use_errno=True), "renameat2", None)
+    if renameat2 is None:
+        return False
+    at_fdcwd, rename_exchange = -100, 2
+    result = renameat2(at_fdcwd, os.fsencode(path_a), at_fdcwd, os.fsencode(path_b), rename_exchange)
+    if result == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+        return False
+    raise OSError(error, os.strerror(error), path_a, None, path_b)
+
+def save_index_atomically(
+    db: FAISS,
+    vectors: np.ndarray,
+    folder_path: str,
+    tuning_report: list = None,
+    embedding_dimensions: int = None
+):
+    """Writes the index (native store, search settings and the BM25 lexical index) to a
+    temporary directory and swaps it into place.
+
+    Readers never see a half-written index directory. On Linux the old and new directories
+    are exchanged in one step, so `folder_path` always exists. Elsewhere the swap is two
+    renames, and a reader opening the index in between gets FileNotFoundError and should retry.
+    """
+    parent = os.path.dirname(os.path.abspath(folder_path))
+    tmp_path = tempfile.mkdtemp(prefix=".faiss_index-", dir=parent)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o777 & ~umask) # mkdtemp creates 0700; keep the index readable like a normal directory
+    backup_path = tmp_path + ".old"
+    try:
+        save_store(tmp_path, db, vectors) # Pickle-free: mapped vectors/texts, JSON metadata, manifest
+        save_index_settings(db.index, tmp_path, tuning_report, embedding_dimensions)
+        LexicalIndex.from_vectorstore(db).save(tmp_path) # BM25 index travels with the FAISS files
+        if os.path.exists(folder_path) and exchange_directories(tmp_path, folder_path):
+            shutil.rmtree(tmp_path, ignore_errors=True) # Now holds the previous index
+            return
+        if os.path.exists(folder_path):
+            os.rename(folder_path, backup_path)
+        os.rename(tmp_path, folder_path)
+    except Exception:
+        if os.path.exists(backup_path) and not os.path.exists(folder_path):
+            os.rename(backup_path, folder_path) # Put the previous index back
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    shutil.rmtree(backup_path, ignore_errors=True)
+
+def build_and_save_index(
+    incremental: bool = True,
+    index_type: str = INDEX_TYPE,
+    quantization: str = QUANTIZATION,
+    dimensions: int = EMBEDDING_DIMENSIONS
+):
+    """Builds the FAISS index from the knowledge base and saves it locally.
+
+    With incremental=True and an existing index, only the chunks that were added,
+    changed or removed since the last build are applied. The result is saved as an
+    `index_type` index storing `quantization`-encoded vectors of `dimensions` size.
+    Changing `dimensions` always re-embeds every chunk.
+    """
+    if not UNIVERSITY_API_KEY:
+        logging.error("UNIVERSITY_API_KEY not found in .env file.")
+        sys.exit(1)
 
-def build_and_save_index():
-    """Builds the FAISS index from the knowledge base and saves it locally."""
     logging.info("Initializing University Embeddings...")
     try:
+        embedding_cache = EmbeddingCache(
+            path=EMBEDDING_CACHE_PATH,
+            model_name=UNIVERSITY_EMBEDDING_MODEL_NAME,
+            api_version=UNIVERSITY_API_VERSION,
+            dimensions=dimensions
+        )
         embeddings = UniversityEmbeddings(
             api_key=UNIVERSITY_API_KEY,
             base_url=UNIVERSITY_BASE_URL,
             model_name=UNIVERSITY_EMBEDDING_MODEL_NAME,
             api_version=UNIVERSITY_API_VERSION,
-            embed_batch_size=EMBEDDING_BATCH_SIZE
+            embed_batch_size=EMBEDDING_BATCH_SIZE,
+            max_batch_tokens=EMBEDDING_MAX_BATCH_TOKENS,
+            max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+            embedding_cache=embedding_cache,
+            dimensions=dimensions
         )
         logging.info("Embeddings client initialized successfully.")
     except Exception as e:
         logging.error(f"Failed to initialize University Embeddings client: {e}", exc_info=True)
         return
 
-    if not full_knowledge_text:
-        logging.error("Source text data (full_knowledge_text) is empty. Cannot build index.")
+    try:
+        knowledge_sources = list_sources(KNOWLEDGE_PATH)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to list knowledge sources in {KNOWLEDGE_PATH}: {e}")
+        return
+    if not corpus_bytes(knowledge_sources):
+        logging.error(f"Knowledge sources in {KNOWLEDGE_PATH} are empty. Cannot build index.")
         return
 
     logging.info("Preparing documents...")
-    docs = [Document(page_content=full_knowledge_text)]
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=100,
-        length_function=len,
-    )
-    chunks = text_splitter.split_documents(docs)
-    logging.info(f"Split data into {len(chunks)} chunks.")
+    # Each source file is read and chunked on its own, so chunks never straddle two sources
+    chunks = list(split_sources(knowledge_sources))
+    logging.info(f"Split {len(knowledge_sources)} sources ({corpus_bytes(knowledge_sources)} bytes) into {len(chunks)} chunks.")
 
     if not chunks:
         logging.error("No chunks were created. Cannot build index.")
         return
 
     try:
-        logging.info("Creating FAISS index from documents... This may take a while.")
-        # This step will call the embedding API for all chunks
-        db = FAISS.from_documents(chunks, embeddings)
-        logging.info("FAISS index created successfully.")
+        existing_index = has_store(FAISS_INDEX_PATH) or has_legacy_store(FAISS_INDEX_PATH)
+        saved = load_index_settings(FAISS_INDEX_PATH) or {}
+        saved_type = saved.get("index_type", "flat")
+        saved_quantization = saved.get("quantization", "none")
+        if incremental and existing_index and saved.get("embedding_dimensions") != dimensions:
+            logging.info(f"Embedding dimensions changed ({saved.get('embedding_dimensions')} -> {dimensions}); rebuilding from scratch.")
+            incremental = False
+        if incremental and existing_index:
+            logging.info(f"Updating existing FAISS index in {FAISS_INDEX_PATH} incrementally...")
+            if has_store(FAISS_INDEX_PATH):
+                # Exact flat index rebuilt from the stored float32 vectors, mutable docstore
+                db = load_vectorstore(FAISS_INDEX_PATH, embeddings, mutable=True, verify=True)
+            else:
+                logging.info("Converting a pickled index from an earlier build to the native format...")
+                db = FAISS.load_local(
+                    folder_path=FAISS_INDEX_PATH,
+                    embeddings=embeddings,
+                    allow_dangerous_deserialization=True # Only our own earlier build output is read here
+                )
+                if saved_type != "flat" or saved_quantization != "none":
+                    # Updates run on an exact flat copy: HNSW cannot remove vectors and quantized codes are lossy
+                    db.index = build_index(exact_vectors(db, embeddings, saved_quantization), "flat")
+            added, removed = update_index_incrementally(db, chunks)
+            logging.info(f"Incremental update: {added} chunks added, {removed} chunks removed, {db.index.ntotal} total.")
+            if not added and not removed and saved_type == index_type and saved_quantization == quantization and \
+               has_store(FAISS_INDEX_PATH) and os.path.exists(os.path.join(FAISS_INDEX_PATH, LEXICAL_INDEX_FILENAME)):
+                logging.info("Index already up to date. Nothing to save.")
+                return
+        else:
+            logging.info("Creating FAISS index from documents... This may take a while.")
+            # This step will call the embedding API for all chunks
+            db = FAISS.from_documents(chunks, embeddings)
+            logging.info("FAISS index created successfully.")
 
-        logging.info(f"Saving FAISS index to: {FAISS_INDEX_PATH}")
-        db.save_local(FAISS_INDEX_PATH)
+        vectors = index_vectors(db.index) # Exact: db.index is a float32 flat index at this point
+        tuning_report = convert_index(db, vectors, index_type, quantization)
+        logging.info(f"Saving {index_type}/{quantization} FAISS index ({db.index.d} dims) to: {FAISS_INDEX_PATH}")
+        save_index_atomically(db, vectors, FAISS_INDEX_PATH, tuning_report, dimensions)
         logging.info("FAISS index saved successfully.")
-        logging.info(f"Index files saved: {FAISS_INDEX_PATH}/index.faiss, {FAISS_INDEX_PATH}/index.pkl")
+        logging.info(f"Index files saved in {FAISS_INDEX_PATH}: {', '.join(sorted(os.listdir(FAISS_INDEX_PATH)))}")
 
     except Exception as e:
         logging.error(f"Error creating or saving FAISS index: {e}", exc_info=True)
 
+def report_index_types(folder_path: str = FAISS_INDEX_PATH):
+    """Prints recall, latency and size of every index type, embedding size and
+    quantization over the saved vectors.
+
+    Uses the stored vectors only, so it makes no embedding calls and changes nothing on disk.
+    """
+    import faiss
+    settings = load_index_settings(folder_path) or {}
+    if settings.get("quantization", "none") != "none" or settings.get("embedding_dimensions"):
+        print("The saved index is quantized or shortened; rebuild it with the defaults before reporting.")
+        return
+    if has_store(folder_path):
+        vectors = np.array(IndexStore(folder_path).vectors)
+    else:
+        vectors = index_vectors(faiss.read_index(os.path.join(folder_path, "index.faiss")))
+    print(f"\nShortened / quantized flat ({len(vectors)} vectors)\n{format_report(compare_compression(vectors))}")
+    for index_type in INDEX_TYPES:
+        if index_type == "flat":
+            continue
+        report = tune_index(build_index(vectors, index_type), vectors)
+        print(f"\n{index_type} ({len(vectors)} vectors)\n{format_report(report)}")
+
+def report_pending_changes(folder_path: str = FAISS_INDEX_PATH):
+    """Prints what an incremental build would change in the saved index.
+
+    Embeds nothing, so it runs without an API key.
+    """
+    if not has_store(folder_path):
+        print(f"No native index in {folder_path}; a build embeds every chunk.")
+        return
+    db = load_vectorstore(folder_path, None, mutable=True)
+    chunks = list(split_sources(list_sources(KNOWLEDGE_PATH)))
+    to_delete, to_reuse, to_embed = plan_incremental_update(db, chunks)
+    print(f"{len(chunks)} chunks in {KNOWLEDGE_PATH}: {len(to_delete)} stored chunks to remove, "
+          f"{len(to_reuse)} to update with their stored vectors, {len(to_embed)} to embed.")
+    for chunk in to_embed:
+        print(f"  embed {chunk.metadata.get('source')} #{chunk.metadata.get('chunk_index')}: {chunk.page_content[:60]!r}")
+
 if __name__ == "__main__":
-    build_and_save_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build or update the FAISS knowledge base index.")
+    parser.add_argument("--full", action="store_true", help="Rebuild the index from scratch instead of updating it incrementally.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE, help="FAISS index type to save (default: %(default)s).")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=QUANTIZATION, help="How stored vectors are encoded (default: %(default)s).")
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS, help="Request shortened embeddings of this size (default: native).")
+    parser.add_argument("--report", action="store_true", help="Only print a recall-vs-latency report for the saved index and exit.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what an incremental build would remove, reuse and embed, and exit.")
+    args = parser.parse_args()
+    if args.report:
+        report_index_types()
+    elif args.dry_run:
+        report_pending_changes()
+    else:
+        build_and_save_index(
+            incremental=not args.full,
+            index_type=args.index_type,
+            quantization=args.quantization,
+            dimensions=args.dimensions
+        )
\ No newline at end of file
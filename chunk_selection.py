@@ -0,0 +1,143 @@
+# chunk_selection.py
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from context_builder import store_token_count
+from index_types import index_vectors
+
+logger = logging.getLogger(__name__)
+
+# --- Redundancy Filtering ---
+DUPLICATE_SIMILARITY = 0.97 # Cosine similarity above which a lower-ranked chunk counts as a near-duplicate
+MMR_LAMBDA = 0.7 # Relevance vs. diversity in MMR; 1.0 keeps the retrieval order
+
+
+class ChunkSelector:
+    """Removes redundancy from ranked retrieval results using the stored chunk vectors.
+
+    select() drops chunks whose vectors nearly match a better-ranked chunk (e.g. the same
+    promotion boilerplate repeated for several cards) and reorders the rest by maximal
+    marginal relevance, so the context budget fills with distinct facts first.
+    merge_adjacent() then joins consecutive chunks of one source that both made it into
+    the context, keeping the text they share (chunk_overlap) only once.
+
+    MMR relevance is the position in the incoming ranking, the only score comparable
+    across vector, hybrid and lexical fast-path results. Makes no API calls.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        index_to_docstore_id: Dict[int, str],
+        duplicate_similarity: float = DUPLICATE_SIMILARITY,
+        mmr_lambda: float = MMR_LAMBDA
+    ):
+        self.vectors = vectors # Stored vectors in FAISS id order; memory-mapped for native stores
+        self.positions = {docstore_id: faiss_id for faiss_id, docstore_id in index_to_docstore_id.items()}
+        self.duplicate_similarity = duplicate_similarity
+        self.mmr_lambda = mmr_lambda
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, vectors: Optional[np.ndarray] = None, **kwargs) -> "ChunkSelector":
+        """Without `vectors`, they are read back from the FAISS index (approximate if it is quantized)."""
+        if vectors is None:
+            vectors = index_vectors(vectorstore.index)
+        return cls(vectors, vectorstore.index_to_docstore_id, **kwargs)
+
+    def _unit_vector(self, doc: Document) -> Optional[np.ndarray]:
+        faiss_id = self.positions.get(doc.id)
+        if faiss_id is None:
+            return None
+        vector = np.asarray(self.vectors[faiss_id], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def select(self, documents: List[Document], scores: List[float]) -> Tuple[List[Document], List[float]]:
+        """Returns the chunks without near-duplicates, in MMR order."""
+        if len(documents) < 2:
+            return documents, scores
+        candidates = [(doc, score, self._unit_vector(doc)) for doc, score in zip(documents, scores)]
+        kept = []
+        for doc, score, vector in candidates:
+            if _max_similarity(vector, [other for _, _, other in kept]) < self.duplicate_similarity:
+                kept.append((doc, score, vector))
+        if len(kept) < len(candidates):
+            logger.info(f"Chunk selection: dropped {len(candidates) - len(kept)} near-duplicate chunks.")
+        ordered = self._mmr(kept)
+        return [doc for doc, _, _ in ordered], [score for _, score, _ in ordered]
+
+    def _mmr(self, candidates: list) -> list:
+        if self.mmr_lambda >= 1.0 or len(candidates) < 3:
+            return candidates
+        relevance = [1.0 - rank / len(candidates) for rank in range(len(candidates))]
+        remaining = list(range(len(candidates)))
+        ordered = [remaining.pop(0)]
+        while remaining:
+            chosen = [candidates[rank][2] for rank in ordered]
+            best = max(remaining, key=lambda rank: (
+                self.mmr_lambda * relevance[rank] - (1 - self.mmr_lambda) * _max_similarity(candidates[rank][2], chosen)
+            ))
+            remaining.remove(best)
+            ordered.append(best)
+        return [candidates[rank] for rank in ordered]
+
+    @staticmethod
+    def merge_adjacent(documents: List[Document], scores: List[float]) -> Tuple[List[Document], List[float]]:
+        """Joins runs of consecutive chunks of one source into one chunk, placed at the
+        run's best rank with that chunk's score."""
+        by_position = {}
+        for rank, doc in enumerate(documents):
+            source, chunk_index = doc.metadata.get("source"), doc.metadata.get("chunk_index")
+            if source is not None and chunk_index is not None:
+                by_position[(source, doc.metadata.get("section"), chunk_index)] = rank
+        runs: Dict[int, List[int]] = {} # Best rank in the run -> ranks of its chunks in source order
+        for (source, section, chunk_index), rank in sorted(by_position.items(), key=lambda item: item[0][2]):
+            if (source, section, chunk_index - 1) in by_position:
+                continue # Not the start of a run
+            run = [rank]
+            while (source, section, chunk_index + 1) in by_position:
+                chunk_index += 1
+                run.append(by_position[(source, section, chunk_index)])
+            if len(run) > 1:
+                runs[min(run)] = run
+        if not runs:
+            return documents, scores
+        merged_ranks = {rank for run in runs.values() for rank in run}
+        merged_documents, merged_scores = [], []
+        for rank, doc in enumerate(documents):
+            if rank in runs:
+                merged_documents.append(_merge_documents([documents[member] for member in runs[rank]]))
+            elif rank in merged_ranks:
+                continue # Joined into a better-ranked chunk of its run
+            else:
+                merged_documents.append(doc)
+            merged_scores.append(scores[rank])
+        logger.info(f"Chunk selection: merged {len(documents)} chunks into {len(merged_documents)} (adjacent chunks of one source).")
+        return merged_documents, merged_scores
+
+
+def _max_similarity(vector: Optional[np.ndarray], others: List[Optional[np.ndarray]]) -> float:
+    """Highest cosine similarity to any of `others` (unit vectors); 0 when unknown."""
+    if vector is None:
+        return 0.0
+    return max((float(vector @ other) for other in others if other is not None), default=0.0)
+
+def _merge_documents(chunks: List[Document]) -> Document:
+    """Joins consecutive chunks of one source, dropping the overlap the splitter repeated."""
+    text = chunks[0].page_content
+    end = chunks[0].metadata.get("start_index", 0) + len(text)
+    for chunk in chunks[1:]:
+        start = chunk.metadata.get("start_index")
+        overlap = end - start if start is not None else 0
+        if 0 < overlap <= len(chunk.page_content) and text.endswith(chunk.page_content[:overlap]):
+            text += chunk.page_content[overlap:]
+        else: # The splitter stripped the whitespace between them, usually a paragraph break
+            text += ("\n\n" if start is None or start - end >= 2 else "\n") + chunk.page_content
+        end = (start if start is not None else end) + len(chunk.page_content)
+    metadata = dict(chunks[0].metadata)
+    metadata["merged_chunk_indexes"] = [chunk.metadata.get("chunk_index") for chunk in chunks]
+    store_token_count(metadata, text)
+    return Document(id=chunks[0].id, page_content=text, metadata=metadata)
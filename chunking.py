@@ -0,0 +1,81 @@
+# chunking.py
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from context_builder import store_token_count
+from knowledge_loader import read_source_text
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+PARALLEL_MIN_CHARS = 1_000_000 # Below this, process start-up costs more than it saves
+
+_EFFECTIVE_DATE_PATTERN = re.compile(r"Effective Date:\s*(.+)", re.IGNORECASE)
+_PROMOTION_PERIOD_PATTERN = re.compile(r"Promotion period:\s*(.+)", re.IGNORECASE)
+
+
+def _first_match(pattern: re.Pattern, text: str) -> Optional[str]:
+    match = pattern.search(text)
+    return match.group(1).strip() if match else None
+
+def _section_title(text: str) -> str:
+    for line in text.splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
+
+def split_source(source: Dict, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Document]:
+    """Splits one knowledge source into chunks tagged with where they came from.
+
+    The source is an entry from knowledge_loader.list_sources (its file is read here) or
+    a dict that already carries its "text".
+
+    Metadata: source (source name), section, title, effective_date, chunk_index
+    (position within the source), start_index (character offset in the source),
+    token_count (chat-model tokens, for budgeting the prompt context) and, where the
+    chunk states one, promotion_period.
+    """
+    text = read_source_text(source)
+    base_metadata = {
+        "source": source["source"],
+        "section": source["section"],
+        "title": _section_title(text),
+        "effective_date": _first_match(_EFFECTIVE_DATE_PATTERN, text)
+    }
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=True
+    )
+    chunks = text_splitter.create_documents([text], metadatas=[base_metadata])
+    for chunk_index, chunk in enumerate(chunks):
+        chunk.metadata["chunk_index"] = chunk_index
+        store_token_count(chunk.metadata, chunk.page_content)
+        promotion_period = _first_match(_PROMOTION_PERIOD_PATTERN, chunk.page_content)
+        if promotion_period:
+            chunk.metadata["promotion_period"] = promotion_period
+    return chunks
+
+def split_sources(sources: List[Dict], max_workers: Optional[int] = None) -> Iterator[Document]:
+    """Chunks every source, in worker processes when the corpus is large enough to benefit.
+
+    Yields chunks grouped by source in input order. Sources listed by knowledge_loader are
+    read one at a time (by the worker that chunks them, in parallel mode), so only the
+    sources being chunked are held in memory.
+    """
+    total_chars = sum(source["bytes"] if "bytes" in source else len(source["text"]) for source in sources)
+    if len(sources) > 1 and total_chars >= PARALLEL_MIN_CHARS:
+        logger.info(f"Chunking {len(sources)} sources ({total_chars} chars) in parallel...")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for chunks in executor.map(split_source, sources):
+                yield from chunks
+    else:
+        for source in sources:
+            yield from split_source(source)
@@ -0,0 +1,73 @@
+# context_builder.py
+import logging
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from token_batching import count_tokens, tokens_are_estimated
+
+logger = logging.getLogger(__name__)
+
+# --- Context Assembly ---
+CONTEXT_SEPARATOR = "\n\n---\n\n" # Between chunks in the prompt context
+TOKEN_COUNT_MODEL = "gpt-4o-mini" # tiktoken name of the chat model (the deployment is called gpt-4-o-mini)
+TOKEN_COUNT_KEY = "token_count" # Chunk metadata written by chunking.split_source
+TOKEN_COUNT_ESTIMATED_KEY = "token_count_estimated" # Set when TOKEN_COUNT_KEY is the length estimate, not a tiktoken count
+
+
+def count_chunk_tokens(text: str) -> int:
+    """Tokens a chunk adds to the chat prompt."""
+    return count_tokens(text, TOKEN_COUNT_MODEL)
+
+def store_token_count(metadata: dict, text: str):
+    """Writes the token count of `text` to chunk `metadata`, flagged when it is only estimated."""
+    metadata[TOKEN_COUNT_KEY] = count_chunk_tokens(text)
+    if tokens_are_estimated(TOKEN_COUNT_MODEL):
+        metadata[TOKEN_COUNT_ESTIMATED_KEY] = True
+    else:
+        metadata.pop(TOKEN_COUNT_ESTIMATED_KEY, None)
+
+def chunk_tokens(doc: Document) -> int:
+    """Token count stored at build time, counted now for chunks of older indexes.
+
+    A stored estimate (built without tiktoken) is recounted once tiktoken is available;
+    the next build_index.py run then stores the exact count without re-embedding.
+    """
+    token_count = doc.metadata.get(TOKEN_COUNT_KEY)
+    if token_count is None or (doc.metadata.get(TOKEN_COUNT_ESTIMATED_KEY) and not tokens_are_estimated(TOKEN_COUNT_MODEL)):
+        return count_chunk_tokens(doc.page_content)
+    return token_count
+
+def select_within_budget(
+    documents: List[Document],
+    scores: List[float],
+    max_tokens: Optional[int]
+) -> Tuple[List[Document], List[float], int]:
+    """Greedily fills `max_tokens` with chunks in rank order (best score first).
+
+    A chunk that does not fit is skipped so smaller, lower-ranked ones can still use the
+    rest of the budget; the top chunk is always kept. The number of chunks therefore
+    follows their sizes instead of a fixed k. None keeps every chunk.
+    Returns (documents, scores, context tokens).
+    """
+    separator_tokens = count_chunk_tokens(CONTEXT_SEPARATOR)
+    selected, selected_scores, total = [], [], 0
+    for doc, score in zip(documents, scores):
+        tokens = chunk_tokens(doc) + (separator_tokens if selected else 0)
+        if selected and max_tokens is not None and total + tokens > max_tokens:
+            continue
+        selected.append(doc)
+        selected_scores.append(score)
+        total += tokens
+    if len(selected) < len(documents):
+        logger.info(f"Context budget {max_tokens} tokens: kept {len(selected)} of {len(documents)} chunks ({total} tokens).")
+    return selected, selected_scores, total
+
+def count_context_tokens(documents: List[Document]) -> int:
+    """Tokens of the joined context, separators included."""
+    if not documents:
+        return 0
+    return sum(chunk_tokens(doc) for doc in documents) + count_chunk_tokens(CONTEXT_SEPARATOR) * (len(documents) - 1)
+
+def join_context(documents: List[Document]) -> str:
+    return CONTEXT_SEPARATOR.join(doc.page_content for doc in documents)
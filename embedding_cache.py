@@ -0,0 +1,71 @@
+# embedding_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".embedding_cache", "embeddings.sqlite3")
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk, content-addressed store of document embeddings.
+
+    Entries are keyed by (model, api version, dimensions) and the SHA-256 of the
+    chunk text, with vectors stored as packed float32 blobs in SQLite. An edit to
+    one source paragraph therefore only invalidates the chunks it touches.
+    """
+
+    def __init__(self, path: str, model_name: str, api_version: str, dimensions: Optional[int] = None):
+        self.path = path
+        self.namespace = f"{model_name}|{api_version}|{dimensions or 'native'}"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " namespace TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (namespace, text_hash))"
+        )
+        self._conn.commit()
+        logger.info(f"Opened embedding cache at {path} (namespace: {self.namespace})")
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None where it is missing."""
+        hashes = [hash_text(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_hashes = list(set(hashes))
+            for i in range(0, len(unique_hashes), 500): # Stay under SQLite's bound-parameter limit
+                chunk = unique_hashes[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE namespace = ? AND text_hash IN ({placeholders})",
+                    [self.namespace, *chunk]
+                )
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+        return [found.get(text_hash) for text_hash in hashes]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        rows = [(self.namespace, hash_text(text), array("f", vector).tobytes()) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (namespace, text_hash, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
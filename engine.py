@@ -0,0 +1,245 @@
+# engine.py
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from answer_cache import SemanticAnswerCache
+from chunk_selection import ChunkSelector
+from http_client import AsyncPooledTransport, PooledTransport, get_transport
+from index_store import MANIFEST_FILENAME, has_legacy_store, has_store, load_vectorstore, map_vectors
+from index_types import apply_search_settings, load_index_settings
+from lexical_index import FastPathGate, LexicalIndex
+from metrics import RequestTrace
+from query_cache import QueryEmbeddingCache
+from rag_pipeline import AsyncRAGPipeline, AsyncUniversityChat, RetrievalResult, get_background_loop
+from section_search import SectionSearch
+from university_embeddings import UniversityEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# Headless RAG engine: configuration, index loading and the retrieve-then-generate hot
+# path with no Streamlit dependency. The web app (app_resources.py) caches these same
+# building blocks per process; benchmarks, batch jobs and CLI tools use RAGEngine.
+
+# --- Configuration ---
+university_base_url = os.getenv("UNIVERSITY_BASE_URL", "https://genai.hkbu.edu.hk/general/rest") # Override to use mock_genai.py
+university_chat_model_name = "gpt-4-o-mini"
+university_embedding_model_name = "text-embedding-3-large"
+university_api_version = "2024-05-01-preview"
+API_KEY_ENV_VAR = "UNIVERSITY_API_KEY" # Read by headless callers that do not pass a key
+EMBEDDING_BATCH_SIZE = 16
+HTTP_POOL_SIZE = 10 # Keep-alive connections shared by embedding and chat calls
+HTTP2_ENABLED = True # Async transport uses HTTP/2 when the optional 'h2' package is installed
+RETRIEVAL_K = 10 # Candidate chunks per question; the context keeps those that fit CONTEXT_TOKEN_BUDGET
+CONTEXT_TOKEN_BUDGET = 1000 # Max chat-model tokens of retrieved context per prompt; None keeps all RETRIEVAL_K chunks
+FAST_PATH_ENABLED = False # Skip the query embedding when BM25 alone is confident; off until calibrated with --mode recorded
+FAST_PATH_MIN_COVERAGE = 0.8 # From `benchmark.py --calibrate-fast-path` in mock mode only (hashing embeddings, not the served model)
+FAST_PATH_MIN_MARGIN = 0.05
+FAST_PATH_MIN_MATCHED_TERMS = 4
+CHUNK_SELECTION_ENABLED = True # Merge overlapping neighbours, drop near-duplicates and diversify (MMR) retrieved chunks
+QUERY_CACHE_MAX_ENTRIES = 1024 # Distinct normalized questions kept in memory
+QUERY_CACHE_TTL_SECONDS = 6 * 60 * 60
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95 # Min cosine similarity for a paraphrase to reuse an answer
+ANSWER_CACHE_MAX_ENTRIES = 512
+
+FAISS_INDEX_PATH = "faiss_index" # Path where index files are stored in the repo
+FAISS_LOAD_MODE = "mmap" # "mmap" shares one read-only copy of index.faiss between processes; "memory" copies it
+
+
+# --- Building Blocks ---
+def create_embeddings(
+    api_key: str,
+    transport: PooledTransport,
+    async_transport: AsyncPooledTransport,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+    dimensions: Optional[int] = None,
+    base_url: str = university_base_url
+) -> UniversityEmbeddings:
+    return UniversityEmbeddings(
+        api_key=api_key,
+        base_url=base_url,
+        model_name=university_embedding_model_name,
+        api_version=university_api_version,
+        embed_batch_size=EMBEDDING_BATCH_SIZE,
+        transport=transport,
+        async_transport=async_transport,
+        query_cache=query_cache,
+        dimensions=dimensions # Must match the `dimensions` the index was built with
+    )
+
+def create_chat_client(api_key: str, async_transport: AsyncPooledTransport, base_url: str = university_base_url) -> AsyncUniversityChat:
+    return AsyncUniversityChat(
+        api_key=api_key,
+        base_url=base_url,
+        model_name=university_chat_model_name,
+        api_version=university_api_version,
+        transport=async_transport
+    )
+
+def create_fast_path_gate() -> FastPathGate:
+    return FastPathGate(
+        min_coverage=FAST_PATH_MIN_COVERAGE,
+        min_margin=FAST_PATH_MIN_MARGIN,
+        min_matched_terms=FAST_PATH_MIN_MATCHED_TERMS
+    )
+
+def create_chunk_selector(vectorstore: FAISS, index_path: str = FAISS_INDEX_PATH) -> ChunkSelector:
+    """Selector over the exact vectors of the native store (memory-mapped, shared with other processes).
+
+    Maps only the vector data of the already-loaded `vectorstore`; the store is not opened twice.
+    """
+    vectors = None
+    if has_store(index_path):
+        vectors = map_vectors(index_path, vectorstore.index.ntotal, vectorstore.index.d)
+    return ChunkSelector.from_vectorstore(vectorstore, vectors)
+
+def load_vector_store(
+    embeddings: UniversityEmbeddings,
+    index_path: str = FAISS_INDEX_PATH,
+    load_mode: str = FAISS_LOAD_MODE,
+    settings: Optional[dict] = None
+) -> FAISS:
+    """Opens the native index store with its tuned search settings.
+
+    Raises FileNotFoundError when there is no index (or only a legacy pickled one).
+    """
+    logger.info(f"Attempting to load FAISS index from path: {index_path}")
+    if not has_store(index_path):
+        if has_legacy_store(index_path):
+            error_msg = f"The index in '{index_path}' uses the old pickled format. " \
+                        "Run 'python build_index.py' once to convert it, then commit the result."
+        else:
+            error_msg = f"FAISS index files not found in directory '{index_path}'. " \
+                        f"Please ensure the index (including '{MANIFEST_FILENAME}') was built and committed to the repository."
+        logger.error(error_msg)
+        raise FileNotFoundError(error_msg)
+
+    try:
+        # Native format: memory-mapped vectors and texts, no unpickling
+        vectorstore = load_vectorstore(index_path, embeddings, load_mode=load_mode)
+        settings = settings if settings is not None else (load_index_settings(index_path) or {})
+        apply_search_settings(vectorstore.index, settings) # Tuned efSearch/nprobe for HNSW/IVF builds
+        logger.info(
+            f"Successfully loaded {settings.get('index_type', 'flat')} FAISS index "
+            f"({settings.get('quantization', 'none')}, {vectorstore.index.d} dims, {load_mode}) from {index_path}"
+        )
+    except Exception as e:
+        logger.exception(f"Error loading FAISS index from {index_path}: {e}")
+        raise
+    return vectorstore
+
+
+# --- Engine ---
+@dataclass
+class EngineResult:
+    question: str
+    answer: str
+    retrieval: RetrievalResult
+    from_cache: bool
+    timings: Dict[str, float] = field(default_factory=dict) # Stage -> milliseconds
+
+    @property
+    def documents(self) -> List[Document]:
+        return self.retrieval.documents
+
+
+class RAGEngine:
+    """Plain Python API over the RAG pipeline: answer(question) -> EngineResult.
+
+    Calls run on the shared background event loop, so the engine can be used from
+    synchronous code (scripts, benchmarks, worker threads) as well as from async code
+    through aanswer().
+    """
+
+    def __init__(self, pipeline: AsyncRAGPipeline):
+        self.pipeline = pipeline
+
+    @classmethod
+    def from_index(
+        cls,
+        api_key: Optional[str] = None,
+        index_path: str = FAISS_INDEX_PATH,
+        load_mode: str = FAISS_LOAD_MODE,
+        fast_path: bool = FAST_PATH_ENABLED,
+        chunk_selection: bool = CHUNK_SELECTION_ENABLED,
+        use_answer_cache: bool = True,
+        k: int = RETRIEVAL_K,
+        context_token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+        base_url: str = university_base_url,
+        pool_size: int = HTTP_POOL_SIZE
+    ) -> "RAGEngine":
+        """Builds transports, caches and every index structure for the index in `index_path`."""
+        api_key = api_key or os.getenv(API_KEY_ENV_VAR)
+        if not api_key:
+            raise ValueError(f"No University API key given and {API_KEY_ENV_VAR} is not set.")
+        settings = load_index_settings(index_path) or {}
+        async_transport = AsyncPooledTransport(pool_size=pool_size, http2=HTTP2_ENABLED)
+        embeddings = create_embeddings(
+            api_key,
+            get_transport(pool_size=pool_size),
+            async_transport,
+            query_cache=QueryEmbeddingCache(max_entries=QUERY_CACHE_MAX_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS),
+            dimensions=settings.get("embedding_dimensions"),
+            base_url=base_url
+        )
+        vectorstore = load_vector_store(embeddings, index_path, load_mode, settings)
+        answer_cache = None
+        if use_answer_cache:
+            answer_cache = SemanticAnswerCache(similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES)
+        pipeline = AsyncRAGPipeline(
+            embeddings=embeddings,
+            vectorstore=vectorstore,
+            chat_client=create_chat_client(api_key, async_transport, base_url),
+            answer_cache=answer_cache,
+            section_search=SectionSearch(vectorstore),
+            lexical_index=LexicalIndex.load(index_path),
+            fast_path_gate=create_fast_path_gate() if fast_path else None,
+            chunk_selector=create_chunk_selector(vectorstore, index_path) if chunk_selection else None,
+            k=k,
+            context_token_budget=context_token_budget
+        )
+        return cls(pipeline)
+
+    async def aretrieve(self, question: str) -> RetrievalResult:
+        return await self.pipeline.aretrieve(question)
+
+    async def aanswer(self, question: str) -> EngineResult:
+        """Retrieves, checks the answer cache and generates, timing each stage.
+
+        timings holds retrieve/answer_cache/first_token/generate/total in ms plus every
+        span of the request trace (query_embedding_ms, faiss_search_ms, chat_ttfb_ms, ...).
+        """
+        trace = RequestTrace()
+        timings = {}
+        retrieval = await self.pipeline.aretrieve(question, trace)
+        timings["retrieve_ms"] = trace.elapsed_ms()
+
+        lookup_start = time.perf_counter()
+        cached = self.pipeline.cached_answer(retrieval)
+        timings["answer_cache_ms"] = (time.perf_counter() - lookup_start) * 1000
+        if cached is not None:
+            answer, from_cache = cached, True
+        else:
+            generate_start = time.perf_counter()
+            pieces = []
+            async for delta in self.pipeline.astream_answer(retrieval):
+                if not pieces:
+                    timings["first_token_ms"] = trace.elapsed_ms()
+                pieces.append(delta)
+            timings["generate_ms"] = (time.perf_counter() - generate_start) * 1000
+            answer, from_cache = "".join(pieces), False
+        spans = trace.finish()
+        timings["total_ms"] = spans["request_total"]
+        timings.update({f"{stage}_ms": milliseconds for stage, milliseconds in spans.items()})
+        return EngineResult(question, answer, retrieval, from_cache=from_cache, timings=timings)
+
+    def retrieve(self, question: str, timeout: Optional[float] = None) -> RetrievalResult:
+        return get_background_loop().run(self.aretrieve(question), timeout=timeout)
+
+    def answer(self, question: str, timeout: Optional[float] = None) -> EngineResult:
+        return get_background_loop().run(self.aanswer(question), timeout=timeout)
@@ -0,0 +1,100 @@
+# http_client.py
+import logging
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# --- Transport Settings ---
+DEFAULT_POOL_SIZE = 10 # Max keep-alive connections kept open per host
+
+
+class PooledTransport:
+    """Keep-alive HTTP transport backed by a pooled requests.Session.
+
+    Reusing one session means the TCP+TLS handshake to the GenAI host is paid
+    once per pooled connection instead of once per request.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, gzip: bool = True):
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=False # Open extra (non-pooled) connections instead of waiting when the pool is busy
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate' if gzip else 'identity'
+        })
+        logger.info(f"Initialized pooled HTTP transport (pool_size={pool_size}, gzip={gzip})")
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.session.post(url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# --- Process-wide shared transport ---
+_transport: Optional[PooledTransport] = None
+_transport_lock = threading.Lock()
+
+def get_transport(pool_size: int = DEFAULT_POOL_SIZE, gzip: bool = True) -> PooledTransport:
+    """Returns the process-wide transport, creating it on first use.
+
+    Settings only apply to the first call; later calls share the existing pool.
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = PooledTransport(pool_size=pool_size, gzip=gzip)
+    return _transport
+
+
+class AsyncPooledTransport:
+    """asyncio counterpart of PooledTransport backed by an httpx.AsyncClient.
+
+    HTTP/2 is used when requested and the optional `h2` package is installed.
+    The client is bound to the event loop it is first used on.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, gzip: bool = True, http2: bool = False):
+        import httpx
+
+        if http2:
+            try:
+                import h2 # noqa: F401
+            except ImportError:
+                logger.info("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1.")
+                http2 = False
+        self.pool_size = pool_size
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={'Accept-Encoding': 'gzip, deflate' if gzip else 'identity'},
+            http2=http2
+        )
+        logger.info(f"Initialized async HTTP transport (pool_size={pool_size}, gzip={gzip}, http2={http2})")
+
+    async def post(self, url: str, **kwargs):
+        return await self.client.post(url, **kwargs)
+
+    async def get(self, url: str, **kwargs):
+        return await self.client.get(url, **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        """Returns an async context manager yielding a streaming httpx.Response."""
+        return self.client.stream(method, url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,275 @@
+# index_store.py
+import hashlib
+import json
+import logging
+import mmap
+import os
+from typing import Dict, List, Optional, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from index_types import index_settings
+
+logger = logging.getLogger(__name__)
+
+# --- On-disk Layout ---
+# Everything lives in the index directory next to index.faiss. No file is pickled; all
+# of them can be read without executing code from the index.
+MANIFEST_FILENAME = "manifest.json"
+FAISS_FILENAME = "index.faiss" # FAISS's own binary format (search structure, possibly quantized)
+VECTORS_FILENAME = "vectors.f32" # Exact vectors, float32 little-endian, row-major (count x dimensions); not written for flat indexes
+TEXTS_FILENAME = "texts.bin" # Chunk texts concatenated as UTF-8
+OFFSETS_FILENAME = "offsets.u64" # count + 1 byte offsets into TEXTS_FILENAME, uint64 little-endian
+DOCUMENTS_FILENAME = "documents.json" # [{"id": docstore id, "metadata": {...}}, ...] in FAISS id order
+FORMAT_NAME = "chatbot-index"
+FORMAT_VERSION = 1
+LEGACY_PICKLE_FILENAME = "index.pkl" # Written by FAISS.save_local in earlier builds
+LOAD_MODES = ("memory", "mmap")
+
+_DATA_FILES = [FAISS_FILENAME, TEXTS_FILENAME, OFFSETS_FILENAME, DOCUMENTS_FILENAME]
+
+
+def has_store(folder_path: str) -> bool:
+    return os.path.exists(os.path.join(folder_path, MANIFEST_FILENAME))
+
+def has_legacy_store(folder_path: str) -> bool:
+    return os.path.exists(os.path.join(folder_path, FAISS_FILENAME)) and \
+           os.path.exists(os.path.join(folder_path, LEGACY_PICKLE_FILENAME))
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def faiss_mmap_flags(index_type: str) -> int:
+    """FAISS read flags that map an index read-only instead of copying it into memory.
+
+    IVF indexes map their inverted lists (IO_FLAG_MMAP); flat and HNSW indexes map their
+    code arrays (IO_FLAG_MMAP_IFC, FAISS >= 1.11). Returns 0 when this FAISS cannot map.
+    """
+    if index_type == "ivf":
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return 0
+
+def _map_file(path: str):
+    """Read-only mmap of a file; empty files cannot be mapped, so they yield b""."""
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _flat_codes_offset(path: str, count: int, dimensions: int) -> Optional[int]:
+    """Byte offset of the float32 vectors that end a flat (L2 or IP) index.faiss, or None
+    when the file holds another index type. FAISS writes them last, as a uint64 float
+    count followed by the raw values."""
+    offset = os.path.getsize(path) - count * dimensions * 4
+    with open(path, "rb") as f:
+        if f.read(4) not in (b"IxF2", b"IxFI") or offset < 12:
+            return None
+        f.seek(offset - 8)
+        if int(np.frombuffer(f.read(8), dtype="<u8")[0]) != count * dimensions:
+            return None
+    return offset
+
+def map_vectors(folder_path: str, count: int, dimensions: int) -> Optional[np.ndarray]:
+    """Read-only map of the exact vectors in FAISS id order: VECTORS_FILENAME for HNSW, IVF
+    and quantized stores, the codes of index.faiss itself for flat ones. None when neither
+    holds exact vectors."""
+    if not count:
+        return np.zeros((0, dimensions), dtype=np.float32)
+    path, offset = os.path.join(folder_path, VECTORS_FILENAME), 0
+    if not os.path.exists(path):
+        path = os.path.join(folder_path, FAISS_FILENAME)
+        offset = _flat_codes_offset(path, count, dimensions)
+        if offset is None:
+            return None
+    return np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(count, dimensions))
+
+
+def save_store(folder_path: str, vectorstore: FAISS, vectors: np.ndarray):
+    """Writes `vectorstore` (FAISS index plus docstore) and its exact `vectors` in the
+    native format. The manifest is written last, so a directory without one is incomplete.
+
+    A flat index already stores `vectors` exactly, so VECTORS_FILENAME is only written for
+    HNSW, IVF and quantized indexes.
+    """
+    count = vectorstore.index.ntotal
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    if vectors.shape[0] != count:
+        raise ValueError(f"Got {vectors.shape[0]} vectors for an index of {count}.")
+
+    faiss.write_index(vectorstore.index, os.path.join(folder_path, FAISS_FILENAME))
+    data_files = list(_DATA_FILES)
+    if not isinstance(vectorstore.index, faiss.IndexFlat):
+        vectors.tofile(os.path.join(folder_path, VECTORS_FILENAME))
+        data_files.append(VECTORS_FILENAME)
+
+    documents, offsets = [], [0]
+    with open(os.path.join(folder_path, TEXTS_FILENAME), "wb") as f:
+        for faiss_id in range(count):
+            docstore_id = vectorstore.index_to_docstore_id[faiss_id]
+            doc = vectorstore.docstore.search(docstore_id)
+            encoded = doc.page_content.encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            documents.append({"id": docstore_id, "metadata": doc.metadata})
+    np.array(offsets, dtype="<u8").tofile(os.path.join(folder_path, OFFSETS_FILENAME))
+    with open(os.path.join(folder_path, DOCUMENTS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False, default=str)
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "count": count,
+        "index_type": index_settings(vectorstore.index)["index_type"],
+        "dimensions": int(vectors.shape[1]) if vectors.ndim == 2 else vectorstore.index.d,
+        "distance_strategy": str(vectorstore.distance_strategy.value),
+        "normalize_L2": bool(vectorstore._normalize_L2),
+        "files": {
+            name: {"bytes": os.path.getsize(os.path.join(folder_path, name)), "sha256": _file_sha256(os.path.join(folder_path, name))}
+            for name in data_files
+        }
+    }
+    with open(os.path.join(folder_path, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Saved native index store ({count} chunks, {manifest['dimensions']} dims) to {folder_path}")
+
+
+class ReadOnlyDocstoreError(PermissionError):
+    """Raised on writes to the serving docstore; indexes change only through build_index.py."""
+
+
+class MappedDocstore(Docstore):
+    """Read-only docstore backed by the memory-mapped text blob.
+
+    Documents are materialized on lookup from a slice of the blob, so start-up only
+    parses the small metadata file and processes sharing an index share its pages.
+    """
+
+    def __init__(self, texts, offsets: np.ndarray, documents: List[dict]):
+        self._texts = texts
+        self._offsets = offsets
+        self._positions = {entry["id"]: position for position, entry in enumerate(documents)}
+        self._metadata = [entry["metadata"] for entry in documents]
+        self._ids = [entry["id"] for entry in documents]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def search(self, search: str) -> Union[str, Document]:
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        text = bytes(self._texts[start:end]).decode("utf-8")
+        return Document(id=search, page_content=text, metadata=dict(self._metadata[position]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise ReadOnlyDocstoreError("MappedDocstore is read-only; rebuild the index with build_index.py.")
+
+    def delete(self, ids: List) -> None:
+        raise ReadOnlyDocstoreError("MappedDocstore is read-only; rebuild the index with build_index.py.")
+
+
+class IndexStore:
+    """An opened native index directory: manifest, mapped vectors and mapped docstore."""
+
+    def __init__(self, folder_path: str, verify: bool = False):
+        self.folder_path = folder_path
+        with open(os.path.join(folder_path, MANIFEST_FILENAME), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_NAME or self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {folder_path}: {self.manifest.get('format')} v{self.manifest.get('version')}")
+        for name, expected in self.manifest["files"].items():
+            path = os.path.join(folder_path, name)
+            # Sizes are checked on every open (cheap); hashes only when asked to (reads everything)
+            if os.path.getsize(path) != expected["bytes"]:
+                raise ValueError(f"{path} is {os.path.getsize(path)} bytes, manifest says {expected['bytes']}; the index is incomplete.")
+            if verify and _file_sha256(path) != expected["sha256"]:
+                raise ValueError(f"{path} does not match its manifest checksum.")
+
+        self.count = self.manifest["count"]
+        self.dimensions = self.manifest["dimensions"]
+        self.vectors = map_vectors(folder_path, self.count, self.dimensions)
+        if self.vectors is None:
+            raise ValueError(f"{folder_path} has a {self.manifest.get('index_type')} index but no {VECTORS_FILENAME}.")
+        self.offsets = np.fromfile(os.path.join(folder_path, OFFSETS_FILENAME), dtype="<u8")
+        with open(os.path.join(folder_path, DOCUMENTS_FILENAME), encoding="utf-8") as f:
+            self.documents = json.load(f)
+        self.docstore = MappedDocstore(_map_file(os.path.join(folder_path, TEXTS_FILENAME)), self.offsets, self.documents)
+        without_metadata = sum(1 for entry in self.documents if not entry.get("metadata"))
+        if without_metadata:
+            # Section routing and the context budget rely on chunk metadata (source, section, token_count)
+            logger.warning(
+                f"{without_metadata} of {self.count} chunks in {folder_path} have no metadata; section routing skips them. "
+                "Rebuild the index with 'python build_index.py' to add it."
+            )
+
+    @property
+    def index_to_docstore_id(self) -> Dict[int, str]:
+        return {position: entry["id"] for position, entry in enumerate(self.documents)}
+
+    def read_index(self, load_mode: str = "memory"):
+        """Reads index.faiss. load_mode="mmap" maps it read-only, so every process serving
+        the same index on a host shares one copy in the page cache.
+
+        A mapped index must never be added to (FAISS aborts the process). build_index.py
+        swaps in a new directory by rename, so mapped files are never rewritten in place.
+        """
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode '{load_mode}'. Expected one of {LOAD_MODES}.")
+        path = os.path.join(self.folder_path, FAISS_FILENAME)
+        if load_mode == "mmap":
+            flags = faiss_mmap_flags(self.manifest.get("index_type", "flat"))
+            if flags:
+                return faiss.read_index(path, flags)
+            logger.warning(f"FAISS {faiss.__version__} cannot memory-map this index; loading it into memory.")
+        return faiss.read_index(path)
+
+    def vectorstore(self, embeddings: Embeddings, mutable: bool = False, load_mode: str = "memory") -> FAISS:
+        """Builds a LangChain FAISS store over this directory.
+
+        The default is the serving view: the saved search index (read per `load_mode`) and
+        the mapped, read-only docstore. mutable=True returns an exact flat index rebuilt
+        from the stored vectors and an in-memory docstore, which build_index.py can add to
+        and delete from.
+        """
+        if mutable:
+            index = faiss.IndexFlatL2(self.dimensions)
+            if self.count:
+                index.add(np.ascontiguousarray(self.vectors, dtype=np.float32))
+            docstore = InMemoryDocstore({
+                entry["id"]: self.docstore.search(entry["id"]) for entry in self.documents
+            })
+        else:
+            index = self.read_index(load_mode)
+            docstore = self.docstore
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=self.index_to_docstore_id,
+            normalize_L2=self.manifest.get("normalize_L2", False),
+            distance_strategy=DistanceStrategy(self.manifest.get("distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE.value))
+        )
+
+
+def load_vectorstore(
+    folder_path: str,
+    embeddings: Embeddings,
+    mutable: bool = False,
+    verify: bool = False,
+    load_mode: str = "memory"
+) -> FAISS:
+    return IndexStore(folder_path, verify=verify).vectorstore(embeddings, mutable=mutable, load_mode=load_mode)
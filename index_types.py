@@ -0,0 +1,263 @@
+# index_types.py
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_SETTINGS_FILENAME = "index_settings.json" # Saved inside the FAISS index directory
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "fp16", "int8", "pq") # pq requires the ivf index type
+
+HNSW_M = 32 # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH_CANDIDATES = [16, 32, 64, 128, 256]
+IVF_POINTS_PER_CENTROID = 39 # FAISS warns when training with fewer points per centroid
+IVF_NPROBE_CANDIDATES = [1, 2, 4, 8, 16, 32, 64]
+PQ_DIMS_PER_SUBQUANTIZER = 16 # 3072 dims -> 192-byte codes
+REPORT_DIMENSIONS = [3072, 1536, 1024, 512, 256] # text-embedding-3 vectors can be shortened to any of these
+TARGET_RECALL = 0.95 # Recall@k against the flat index that tuning must reach
+REPORT_QUERIES = 200
+REPORT_K = 10
+REPORT_QUERY_NOISE = 0.5 # Query = stored vector + noise, in units of the per-component std
+
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def _extract_ivf(index):
+    return faiss.try_extract_index_ivf(index) if hasattr(faiss, "try_extract_index_ivf") else None
+
+def shorten_embeddings(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """Truncates text-embedding-3 vectors to `dimensions` and re-normalizes them.
+
+    This is what the API's `dimensions` parameter does server-side, so stored vectors
+    and query vectors stay comparable whichever side shortened them.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not dimensions or vectors.shape[-1] <= dimensions:
+        return vectors
+    shortened = vectors[..., :dimensions]
+    norms = np.linalg.norm(shortened, axis=-1, keepdims=True)
+    return shortened / np.where(norms == 0, 1, norms)
+
+def quantization_of(index) -> str:
+    """Returns the QUANTIZATIONS entry describing how `index` stores its vectors."""
+    ivf = _extract_ivf(index)
+    ivf = faiss.downcast_index(ivf) if ivf is not None else None
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+        storage = ivf
+    elif isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+    else:
+        storage = index
+    if isinstance(storage, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for name, qtype in _SQ_TYPES.items():
+            if storage.sq.qtype == qtype:
+                return name
+    return "none"
+
+def index_vectors(index) -> np.ndarray:
+    """Returns every stored vector of a Flat, HNSW or IVF index, in FAISS id order.
+
+    Vectors of quantized indexes come back decoded, i.e. only approximately.
+    """
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map() # IVF lists are not addressable by id without it
+    return index.reconstruct_n(0, index.ntotal)
+
+def default_nlist(n_vectors: int) -> int:
+    """~4*sqrt(n) lists, capped so every centroid still trains on enough points."""
+    return max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // IVF_POINTS_PER_CENTROID))
+
+def pq_layout(dim: int, n_vectors: int) -> Tuple[int, int]:
+    """(sub-quantizers, bits per code) for PQ; fewer bits when there is little training data."""
+    m = max(1, dim // PQ_DIMS_PER_SUBQUANTIZER)
+    while dim % m:
+        m -= 1
+    nbits = max(1, min(8, int(np.log2(max(2, n_vectors)))))
+    return m, nbits
+
+def build_index(vectors: np.ndarray, index_type: str, params: Optional[Dict[str, int]] = None, quantization: str = "none"):
+    """Builds a FAISS index of `index_type` holding `vectors` (ids 0..n-1, same order).
+
+    `quantization` stores the vectors as float16, int8 (scalar quantization) or PQ codes
+    instead of float32; queries stay float32 and are encoded by FAISS at search time.
+    """
+    params = dict(params or {})
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}'. Expected one of {QUANTIZATIONS}.")
+    if quantization == "pq" and index_type != "ivf":
+        raise ValueError("PQ quantization is only supported with the ivf index type.")
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim) if quantization == "none" else faiss.IndexScalarQuantizer(dim, _SQ_TYPES[quantization])
+    elif index_type == "hnsw":
+        m = params.get("m", HNSW_M)
+        index = faiss.IndexHNSWFlat(dim, m) if quantization == "none" else faiss.IndexHNSWSQ(dim, _SQ_TYPES[quantization], m)
+        index.hnsw.efConstruction = params.get("ef_construction", HNSW_EF_CONSTRUCTION)
+        if "ef_search" in params:
+            index.hnsw.efSearch = params["ef_search"]
+    elif index_type == "ivf":
+        nlist = params.get("nlist") or default_nlist(len(vectors))
+        quantizer = faiss.IndexFlatL2(dim)
+        if quantization == "none":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, *pq_layout(dim, len(vectors)))
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[quantization])
+        index.nprobe = params.get("nprobe", 1)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    if not index.is_trained:
+        index.train(vectors) # Centroids / quantizer ranges from the current chunk vectors
+    index.add(vectors)
+    return index
+
+def index_settings(index) -> Dict[str, object]:
+    """Describes an index's type and search parameters for INDEX_SETTINGS_FILENAME."""
+    if isinstance(index, faiss.IndexHNSW):
+        return {"index_type": "hnsw", "params": {"m": index.hnsw.nb_neighbors(1), "ef_construction": index.hnsw.efConstruction, "ef_search": index.hnsw.efSearch}}
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        return {"index_type": "ivf", "params": {"nlist": ivf.nlist, "nprobe": ivf.nprobe}}
+    return {"index_type": "flat", "params": {}}
+
+def save_index_settings(
+    index,
+    folder_path: str,
+    report: Optional[List[Dict[str, float]]] = None,
+    embedding_dimensions: Optional[int] = None
+):
+    """Writes INDEX_SETTINGS_FILENAME. `embedding_dimensions` is the `dimensions` value the
+    vectors were requested with (None for the model's native size); queries must match it.
+    """
+    settings = index_settings(index)
+    settings["quantization"] = quantization_of(index)
+    settings["dimensions"] = index.d
+    settings["embedding_dimensions"] = embedding_dimensions
+    settings["ntotal"] = index.ntotal
+    if report:
+        settings["tuning_report"] = report
+    path = os.path.join(folder_path, INDEX_SETTINGS_FILENAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    logger.info(f"Saved index settings ({settings['index_type']}, {settings['quantization']}, {index.d} dims, {settings['params']}) to {path}")
+
+def load_index_settings(folder_path: str) -> Optional[Dict[str, object]]:
+    path = os.path.join(folder_path, INDEX_SETTINGS_FILENAME)
+    if not os.path.exists(path):
+        return None # Indexes built before index types were configurable are flat
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def apply_search_settings(index, settings: Optional[Dict[str, object]]):
+    """Applies the tuned efSearch/nprobe from saved settings to a loaded index."""
+    params = (settings or {}).get("params", {})
+    if isinstance(index, faiss.IndexHNSW) and "ef_search" in params:
+        index.hnsw.efSearch = int(params["ef_search"])
+    ivf = _extract_ivf(index)
+    if ivf is not None and "nprobe" in params:
+        ivf.nprobe = int(params["nprobe"])
+
+# --- Recall vs latency ---
+def report_queries(vectors: np.ndarray, n_queries: int = REPORT_QUERIES, seed: int = 0) -> np.ndarray:
+    """Synthetic queries near the stored vectors, so reports need no embedding calls."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    noise = rng.normal(scale=REPORT_QUERY_NOISE * float(vectors.std()), size=(len(picks), vectors.shape[1]))
+    return (vectors[picks] + noise).astype(np.float32)
+
+def measure(index, queries: np.ndarray, ground_truth: np.ndarray, k: int) -> Dict[str, float]:
+    """Recall@k against `ground_truth` ids and per-query latency for one index setting."""
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+    hits = sum(len(set(row) & set(truth)) for row, truth in zip(ids, ground_truth))
+    return {
+        "recall": hits / ground_truth.size,
+        "latency_ms": 1000 * elapsed / len(queries),
+        "bytes": len(faiss.serialize_index(index))
+    }
+
+def tune_index(
+    index,
+    vectors: np.ndarray,
+    k: int = REPORT_K,
+    target_recall: float = TARGET_RECALL,
+    full_vectors: Optional[np.ndarray] = None
+) -> List[Dict[str, float]]:
+    """Sweeps efSearch/nprobe, keeps the cheapest setting reaching `target_recall` and
+    returns the recall-vs-latency report (exact float32 flat baseline first).
+
+    With `full_vectors` (the native-size vectors that `vectors` were shortened from),
+    recall is measured against the full-size flat index, so shortening counts as loss.
+    """
+    full_vectors = vectors if full_vectors is None else full_vectors
+    full_queries = report_queries(full_vectors)
+    queries = shorten_embeddings(full_queries, index.d)
+    k = min(k, len(vectors))
+    flat = build_index(full_vectors, "flat")
+    ground_truth = flat.search(full_queries, k)[1]
+    report = [{"index_type": "flat", "quantization": "none", "dimensions": flat.d, **measure(flat, full_queries, ground_truth, k)}]
+    settings = index_settings(index)
+    row_info = {"index_type": settings["index_type"], "quantization": quantization_of(index), "dimensions": index.d}
+
+    if isinstance(index, faiss.IndexHNSW):
+        name, candidates = "ef_search", HNSW_EF_SEARCH_CANDIDATES
+        def set_param(value): index.hnsw.efSearch = value
+    elif _extract_ivf(index) is not None:
+        ivf = _extract_ivf(index)
+        name, candidates = "nprobe", [n for n in IVF_NPROBE_CANDIDATES if n < ivf.nlist] + [ivf.nlist]
+        def set_param(value): ivf.nprobe = value
+    else:
+        if row_info["quantization"] != "none" or index.d != flat.d:
+            report.append({**row_info, **measure(index, queries, ground_truth, k)})
+        return report
+
+    chosen = None
+    for value in candidates:
+        set_param(value)
+        row = {**row_info, name: value, **measure(index, queries, ground_truth, k)}
+        report.append(row)
+        if chosen is None and row["recall"] >= target_recall:
+            chosen = value
+    if chosen is None:
+        chosen = candidates[-1]
+        logger.warning(f"No {name} reached recall {target_recall}; using the largest candidate ({chosen}).")
+    set_param(chosen)
+    logger.info(f"Tuned {name}={chosen} for recall@{k} >= {target_recall}.")
+    return report
+
+def compare_compression(full_vectors: np.ndarray, dimensions: List[int] = REPORT_DIMENSIONS, k: int = REPORT_K) -> List[Dict[str, float]]:
+    """Recall, latency and size of flat indexes over shortened and/or scalar-quantized
+    vectors, all measured against the native float32 flat index."""
+    report = []
+    for dims in dimensions:
+        if dims > full_vectors.shape[1]:
+            continue
+        vectors = shorten_embeddings(full_vectors, dims)
+        for quantization in ("none", "fp16", "int8"):
+            rows = tune_index(build_index(vectors, "flat", quantization=quantization), vectors, k, full_vectors=full_vectors)
+            report.extend(rows if not report else rows[1:]) # Baseline row once
+    return report
+
+def format_report(report: List[Dict[str, float]]) -> str:
+    lines = [f"{'index':<6} {'quant':<5} {'dims':>5} {'param':<14} {'recall@k':>9} {'latency ms':>11} {'size KB':>9}"]
+    for row in report:
+        param = next((f"{key}={row[key]}" for key in ("ef_search", "nprobe") if key in row), "-")
+        lines.append(
+            f"{row['index_type']:<6} {row['quantization']:<5} {row['dimensions']:>5} {param:<14} "
+            f"{row['recall']:>9.3f} {row['latency_ms']:>11.4f} {row['bytes'] / 1024:>9.0f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,53 @@
+# knowledge_loader.py
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Knowledge Base Layout ---
+# One UTF-8 text file per source under knowledge/<section>/, listed in order by
+# knowledge/sources.json. Only build_index.py reads them; the web app serves the built
+# index and never loads the raw corpus.
+KNOWLEDGE_PATH = "knowledge"
+SOURCES_FILENAME = "sources.json" # [{"source": name, "section": section, "file": path relative to KNOWLEDGE_PATH}, ...]
+
+
+def list_sources(knowledge_path: str = KNOWLEDGE_PATH, sections: Optional[List[str]] = None) -> List[Dict]:
+    """Source entries (source, section, path, bytes) in manifest order, without reading any text.
+
+    sections, when given, keeps only sources of those sections.
+    """
+    with open(os.path.join(knowledge_path, SOURCES_FILENAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    sources = []
+    for entry in manifest:
+        if sections is not None and entry["section"] not in sections:
+            continue
+        path = os.path.join(knowledge_path, entry["file"])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Knowledge source '{entry['source']}' is listed in {SOURCES_FILENAME} but {path} is missing.")
+        sources.append({
+            "source": entry["source"],
+            "section": entry["section"],
+            "path": path,
+            "bytes": os.path.getsize(path)
+        })
+    return sources
+
+def read_source_text(source: Dict) -> str:
+    """Text of one source entry; entries that already carry their "text" are returned as is."""
+    if "text" in source:
+        return source["text"]
+    with open(source["path"], encoding="utf-8", newline="") as f:
+        return f.read()
+
+def iter_sources(knowledge_path: str = KNOWLEDGE_PATH, sections: Optional[List[str]] = None) -> Iterator[Dict[str, str]]:
+    """Yields {"source", "section", "text"} one source at a time, reading each file on demand."""
+    for source in list_sources(knowledge_path, sections):
+        yield {"source": source["source"], "section": source["section"], "text": read_source_text(source)}
+
+def corpus_bytes(sources: List[Dict]) -> int:
+    """Total size of the listed source files, known without reading them."""
+    return sum(source["bytes"] for source in sources)
@@ -0,0 +1,215 @@
+# lexical_index.py
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json" # Saved inside the FAISS index directory
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60 # Standard reciprocal-rank-fusion damping constant
+
+_LATIN_TOKEN = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*%?")
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF or # CJK Unified Ideographs
+        0x3400 <= code <= 0x4DBF or # Extension A
+        0x3040 <= code <= 0x30FF or # Hiragana / Katakana
+        0xAC00 <= code <= 0xD7AF # Hangul syllables
+    )
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into BM25 terms.
+
+    Latin text yields lowercase words and numbers (thousands separators dropped, so
+    "HK$2,000" gives "hk", "2000"; "2.5%" stays one term). Runs of CJK characters,
+    which have no spaces, yield their single characters plus overlapping bigrams.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+    tokens = []
+    cjk_run = []
+
+    def flush_cjk():
+        tokens.extend(cjk_run)
+        tokens.extend(a + b for a, b in zip(cjk_run, cjk_run[1:]))
+        cjk_run.clear()
+
+    position = 0
+    while position < len(text):
+        char = text[position]
+        if _is_cjk(char):
+            cjk_run.append(char)
+            position += 1
+            continue
+        flush_cjk()
+        match = _LATIN_TOKEN.match(text, position)
+        if match:
+            tokens.append(match.group(0))
+            position = match.end()
+        else:
+            position += 1
+    flush_cjk()
+    return tokens
+
+
+class LexicalIndex:
+    """Okapi BM25 inverted index over the chunk texts of the FAISS docstore.
+
+    Runs entirely in-process, so exact-term questions ("HK$550 annual fee") can be
+    scored without a network call. Documents are identified by their docstore IDs.
+    """
+
+    def __init__(self, doc_ids: List[str], doc_lengths: List[int], postings: Dict[str, List[List[int]]]):
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings # term -> [[doc position, term frequency], ...]
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        n_docs = len(doc_ids)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            for term, entries in postings.items()
+        }
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]]) -> "LexicalIndex":
+        """Builds the index from (docstore id, text) pairs."""
+        doc_ids, doc_lengths = [], []
+        postings: Dict[str, List[List[int]]] = {}
+        for position, (doc_id, text) in enumerate(documents):
+            term_counts = Counter(tokenize(text))
+            doc_ids.append(doc_id)
+            doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                postings.setdefault(term, []).append([position, count])
+        return cls(doc_ids, doc_lengths, postings)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "LexicalIndex":
+        return cls.build(
+            (docstore_id, vectorstore.docstore.search(docstore_id).page_content)
+            for docstore_id in vectorstore.index_to_docstore_id.values()
+        )
+
+    def save(self, folder_path: str):
+        path = os.path.join(folder_path, LEXICAL_INDEX_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"doc_ids": self.doc_ids, "doc_lengths": self.doc_lengths, "postings": self.postings}, f, ensure_ascii=False, separators=(",", ":"))
+        logger.info(f"Saved lexical index ({len(self.doc_ids)} documents, {len(self.postings)} terms) to {path}")
+
+    @classmethod
+    def load(cls, folder_path: str) -> Optional["LexicalIndex"]:
+        path = os.path.join(folder_path, LEXICAL_INDEX_FILENAME)
+        if not os.path.exists(path):
+            logger.warning(f"No lexical index at {path}; hybrid retrieval is disabled until the index is rebuilt.")
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        logger.info(f"Loaded lexical index with {len(data['doc_ids'])} documents from {path}")
+        return cls(data["doc_ids"], data["doc_lengths"], data["postings"])
+
+    def search(self, query: str, k: int = 10, allowed_ids: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Returns up to k (docstore id, BM25 score) pairs, best first."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, tf in self.postings[term]:
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[position] / self.avg_doc_length
+                scores[position] = scores.get(position, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for position, score in ranked:
+            doc_id = self.doc_ids[position]
+            if allowed_ids is not None and doc_id not in allowed_ids:
+                continue
+            results.append((doc_id, score))
+            if len(results) >= k:
+                break
+        return results
+
+    def match_quality(self, query: str, top_score: float) -> Tuple[float, int]:
+        """Returns (coverage, matched_terms) for a query's best BM25 score.
+
+        Coverage compares the score with the sum of the query terms' IDFs (roughly a
+        single-occurrence match of every term in an average-length chunk); terms the
+        corpus has never seen count with the maximum IDF, so they lower confidence.
+        """
+        n_docs = len(self.doc_ids)
+        max_idf = math.log(1 + (n_docs + 0.5) / 0.5)
+        terms = set(tokenize(query))
+        reference = sum(self.idf.get(term, max_idf) for term in terms)
+        matched_terms = sum(1 for term in terms if term in self.idf)
+        coverage = min(1.0, top_score / reference) if reference else 0.0
+        return coverage, matched_terms
+
+
+class FastPathGate:
+    """Decides when BM25 results are confident enough to skip the embedding API.
+
+    A query takes the fast path when its best chunk covers most of the query terms
+    (coverage), clearly beats the runner-up (margin) and enough distinct terms matched.
+    Every decision is logged as one JSON line on the `lexical_fast_path` logger. Calibrate
+    the thresholds with `python benchmark.py --calibrate-fast-path --mode recorded`.
+    """
+
+    def __init__(self, min_coverage: float = 0.8, min_margin: float = 0.15, min_matched_terms: int = 2):
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+        self.min_matched_terms = min_matched_terms
+        self.taken = 0
+        self.declined = 0
+        self._decision_logger = logging.getLogger("lexical_fast_path")
+
+    @staticmethod
+    def measure(index: LexicalIndex, query: str, hits: List[Tuple[str, float]]) -> Tuple[float, float, int]:
+        """Returns (coverage, margin, matched_terms) of a query's BM25 hits."""
+        if not hits:
+            return 0.0, 0.0, 0
+        top_score = hits[0][1]
+        runner_up = hits[1][1] if len(hits) > 1 else 0.0
+        margin = (top_score - runner_up) / top_score if top_score > 0 else 0.0
+        coverage, matched_terms = index.match_quality(query, top_score)
+        return coverage, margin, matched_terms
+
+    def admits(self, coverage: float, margin: float, matched_terms: int) -> bool:
+        return coverage >= self.min_coverage and margin >= self.min_margin and matched_terms >= self.min_matched_terms
+
+    def decide(self, index: LexicalIndex, query: str, hits: List[Tuple[str, float]]) -> bool:
+        coverage, margin, matched_terms = self.measure(index, query, hits)
+        taken = bool(hits) and self.admits(coverage, margin, matched_terms)
+        if taken:
+            self.taken += 1
+        else:
+            self.declined += 1
+        self._decision_logger.info(json.dumps({
+            "query": query,
+            "taken": taken,
+            "coverage": round(coverage, 4),
+            "margin": round(margin, 4),
+            "matched_terms": matched_terms,
+            "top_scores": [round(score, 4) for _, score in hits[:5]]
+        }, ensure_ascii=False))
+        return taken
+
+    def stats(self) -> Dict[str, float]:
+        decisions = self.taken + self.declined
+        return {"taken": self.taken, "declined": self.declined, "take_rate": self.taken / decisions if decisions else 0.0}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuses several best-first ID rankings into one: score(id) = sum(1 / (k + rank))."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,152 @@
+# load_test.py
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from typing import List, Optional
+
+from benchmark import load_golden_set, percentiles
+from engine import HTTP_POOL_SIZE, RAGEngine, university_base_url
+from mock_genai import add_mock_arguments, mock_config_from_args, start_mock_server
+
+logger = logging.getLogger(__name__)
+
+# Simulates concurrent chat sessions against the headless engine (same pipeline, pools
+# and caches as main.py) and reports throughput and tail latency. Run it against
+# mock_genai.py to measure on a laptop without network access.
+
+# --- Defaults ---
+DEFAULT_SESSIONS = 20
+DEFAULT_QUESTIONS_PER_SESSION = 5
+DEFAULT_THINK_TIME_MS = 1000 # Mean pause between a session's questions (exponential), like a user reading
+DEFAULT_RAMP_UP_SECONDS = 2.0 # Sessions start evenly spread over this window
+LATENCY_FIELDS = ("total_ms", "first_token_ms", "retrieve_ms")
+
+
+async def run_session(
+    engine: RAGEngine,
+    session_id: int,
+    questions: List[str],
+    count: int,
+    think_time_ms: float,
+    rng: random.Random,
+    records: List[dict]
+):
+    for turn in range(count):
+        question = rng.choice(questions)
+        start = time.perf_counter()
+        record = {"session": session_id, "turn": turn, "question": question}
+        try:
+            result = await engine.aanswer(question)
+            record.update(ok=True, from_cache=result.from_cache, fast_path=result.retrieval.fast_path, **result.timings)
+        except Exception as e:
+            record.update(ok=False, error=type(e).__name__, total_ms=(time.perf_counter() - start) * 1000)
+            logger.debug(f"Session {session_id} turn {turn} failed: {e}")
+        records.append(record)
+        if think_time_ms and turn < count - 1:
+            await asyncio.sleep(rng.expovariate(1000 / think_time_ms))
+
+async def run_load(
+    engine: RAGEngine,
+    questions: List[str],
+    sessions: int = DEFAULT_SESSIONS,
+    questions_per_session: int = DEFAULT_QUESTIONS_PER_SESSION,
+    think_time_ms: float = DEFAULT_THINK_TIME_MS,
+    ramp_up_seconds: float = DEFAULT_RAMP_UP_SECONDS,
+    seed: Optional[int] = None
+) -> dict:
+    """Runs `sessions` concurrent sessions and returns the summary (see summarize)."""
+    rng = random.Random(seed)
+    records: List[dict] = []
+
+    async def delayed_session(session_id: int):
+        await asyncio.sleep(ramp_up_seconds * session_id / max(sessions, 1))
+        session_rng = random.Random(rng.random())
+        await run_session(engine, session_id, questions, questions_per_session, think_time_ms, session_rng, records)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(delayed_session(session_id) for session_id in range(sessions)))
+    return summarize(records, time.perf_counter() - start)
+
+def summarize(records: List[dict], elapsed_seconds: float) -> dict:
+    succeeded = [record for record in records if record["ok"]]
+    generated = [record for record in succeeded if not record["from_cache"]]
+    return {
+        "requests": len(records),
+        "succeeded": len(succeeded),
+        "errors": dict(Counter(record["error"] for record in records if not record["ok"])),
+        "elapsed_seconds": round(elapsed_seconds, 3),
+        "throughput_rps": round(len(succeeded) / elapsed_seconds, 3) if elapsed_seconds else 0.0,
+        "answer_cache_hit_rate": round(1 - len(generated) / len(succeeded), 4) if succeeded else 0.0,
+        "fast_path_rate": round(sum(record["fast_path"] for record in succeeded) / len(succeeded), 4) if succeeded else 0.0,
+        "latency_ms": {
+            # first_token_ms only exists for generated answers, so its percentiles cover those alone
+            field: percentiles([record[field] for record in succeeded if field in record]) for field in LATENCY_FIELDS
+        },
+        "failed_latency_ms": percentiles([record["total_ms"] for record in records if not record["ok"]])
+    }
+
+def format_summary(summary: dict) -> str:
+    lines = [
+        f"{summary['succeeded']}/{summary['requests']} requests succeeded in {summary['elapsed_seconds']:.1f}s "
+        f"({summary['throughput_rps']:.2f} req/s); answer cache hits {summary['answer_cache_hit_rate']:.0%}, "
+        f"fast path {summary['fast_path_rate']:.0%}"
+    ]
+    if summary["errors"]:
+        lines.append(f"Errors: {summary['errors']}")
+    names = sorted({name for values in summary["latency_ms"].values() for name in values}, key=lambda name: (name == "mean", name))
+    lines.append(f"{'latency':<15}" + "".join(f"{name:>10}" for name in names))
+    for field, values in summary["latency_ms"].items():
+        lines.append(f"{field:<15}" + "".join(f"{values.get(name, 0):>10.1f}" for name in names))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent chat sessions against the RAG engine.")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="Concurrent chat sessions (default: %(default)s).")
+    parser.add_argument("--questions", type=int, default=DEFAULT_QUESTIONS_PER_SESSION, help="Questions asked per session (default: %(default)s).")
+    parser.add_argument("--think-ms", type=float, default=DEFAULT_THINK_TIME_MS, help="Mean pause between a session's questions (default: %(default)s).")
+    parser.add_argument("--ramp-up", type=float, default=DEFAULT_RAMP_UP_SECONDS, help="Seconds over which sessions start (default: %(default)s).")
+    parser.add_argument("--pool-size", type=int, default=HTTP_POOL_SIZE, help="HTTP connections per transport (default: %(default)s).")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Generate every answer, even for repeated questions.")
+    parser.add_argument("--base-url", default=university_base_url, help="API base URL (default: %(default)s).")
+    parser.add_argument("--start-mock", action="store_true", help="Start mock_genai.py in this process and target it (mock options below apply).")
+    parser.add_argument("--output", help="Write the summary JSON here.")
+    parser.add_argument("--verbose", action="store_true", help="Log pipeline activity.")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s', stream=sys.stderr)
+    base_url = args.base_url
+    api_key = os.getenv("UNIVERSITY_API_KEY")
+    if args.start_mock:
+        # In-process mock shares the GIL with the client; run mock_genai.py separately for cleaner numbers
+        server = start_mock_server(port=0, config=mock_config_from_args(args))
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        api_key = api_key or "mock"
+
+    engine = RAGEngine.from_index(api_key=api_key, base_url=base_url, use_answer_cache=not args.no_answer_cache, pool_size=args.pool_size)
+    questions = [entry["question"] for entry in load_golden_set()]
+    print(f"Running {args.sessions} sessions x {args.questions} questions against {base_url} (pool size {args.pool_size})...")
+    summary = asyncio.run(run_load(
+        engine, questions, args.sessions, args.questions, args.think_ms, args.ramp_up, args.seed
+    ))
+    summary["config"] = {
+        "sessions": args.sessions,
+        "questions_per_session": args.questions,
+        "think_time_ms": args.think_ms,
+        "ramp_up_seconds": args.ramp_up,
+        "pool_size": args.pool_size,
+        "answer_cache": not args.no_answer_cache,
+        "base_url": base_url
+    }
+    print(format_summary(summary))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.output}")
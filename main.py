@@ -1,21 +1,14 @@
 # main.py
 import sys
 import streamlit as st
-import requests
+import httpx
 import json
-import os # Keep os for path checking
 import logging
 import time
-from typing import List
 
-from langchain_community.vectorstores import FAISS # ADD FAISS import
-from langchain_core.embeddings import Embeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter 
-from langchain.docstore.document import Document 
-
-
-# --- Load Data from Config ---
-from config import full_knowledge_text 
+from metrics import RequestTrace
+from rag_pipeline import RetrievalResult, get_background_loop
+from app_resources import TIMING_DEBUG_EXPANDER, build_rag_pipeline, university_api_key
 
 # --- Logging Configuration ---
 log_level = logging.DEBUG
@@ -24,132 +17,62 @@ log_format = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
 logging.basicConfig(level=log_level, format=log_format, stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
+# Embeddings client, index loading and shared caches live in university_embeddings.py and
+# app_resources.py, so serve.py can warm them up before the first session arrives.
 
-# --- Custom University Embedding Class (Keep as is) ---
-class UniversityEmbeddings(Embeddings):
-    def __init__(
-        self,
-        api_key: str,
-        base_url: str,
-        model_name: str,
-        api_version: str,
-        embed_batch_size: int = 1
-    ):
-        self.api_key = api_key
-        # Construct the specific endpoint URL for embeddings
-        self.endpoint_url = f"{base_url}/deployments/{model_name}/embeddings?api-version={api_version}"
-        self.headers = {
-            'Content-Type': 'application/json',
-            'api-key': self.api_key
-        }
-        self.embed_batch_size = embed_batch_size # How many texts to send in one API call
-        logger.info(f"Initialized UniversityEmbeddings with endpoint: {self.endpoint_url}")
-
-    def _embed(self, texts: List[str]) -> List[List[float]]:
-        all_embeddings = []
-        for i in range(0, len(texts), self.embed_batch_size):
-             batch = texts[i:i + self.embed_batch_size]
-             payload = {'input': batch if len(batch) > 1 else batch[0]}
-
-             try:
-                  response = requests.post(self.endpoint_url, json=payload, headers=self.headers, timeout=30)
-                  response.raise_for_status()
-                  response_data = response.json()
-                  batch_embeddings = [item['embedding'] for item in sorted(response_data['data'], key=lambda x: x['index'])]
-
-                  if len(batch_embeddings) != len(batch):
-                       raise ValueError(f"Number of embeddings received ({len(batch_embeddings)}) does not match number of texts sent ({len(batch)})")
-
-                  all_embeddings.extend(batch_embeddings)
-                  logger.debug(f"Successfully embedded batch of {len(batch)} texts.")
-
-             except requests.exceptions.Timeout:
-                  logger.error(f"Timeout while embedding batch starting with: '{batch[0][:50]}...'")
-                  st.error(f"Error: Timeout while generating embeddings for the knowledge base. Try reducing data or check API status.")
-                  raise # Re-raise to stop initialization if needed
-             except requests.exceptions.RequestException as e:
-                  logger.error(f"API request failed while embedding batch: {e}")
-                  if e.response is not None:
-                      logger.error(f"API Error Response: Status={e.response.status_code}, Body={e.response.text}")
-                      st.error(f"API Error ({e.response.status_code}) while generating embeddings. Check API key and endpoint.")
-                  else:
-                      st.error("Network error while generating embeddings.")
-                  raise
-             except (KeyError, IndexError, TypeError, ValueError) as e: # Include ValueError
-                  logger.error(f"Failed to parse embedding response: {e}. Response data: {response_data}")
-                  st.error(f"Invalid response structure from embedding API: {e}")
-                  raise ValueError(f"Invalid response structure from embedding API: {e}") from e
-             except Exception as e:
-                  logger.error(f"An unexpected error occurred during embedding: {e}")
-                  st.error(f"An unexpected error occurred during embedding: {e}")
-                  raise
-
-        return all_embeddings
-
-
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        if not texts:
-             logger.warning("embed_documents called with empty list.")
-             return []
-        logger.info(f"Embedding {len(texts)} documents using University API...")
-        start_time = time.time()
-        embeddings = self._embed(texts)
-        end_time = time.time()
-        logger.info(f"Finished embedding documents in {end_time - start_time:.2f} seconds.")
-        return embeddings
-
-
-    def embed_query(self, text: str) -> List[float]:
-        if not text:
-             logger.warning("embed_query called with empty string.")
-             return [] # Return empty list or handle as error?
-        logger.info("Embedding query using University API...")
-        start_time = time.time()
-        query_embedding = self._embed([text])[0]
-        end_time = time.time()
-        logger.info(f"Finished embedding query in {end_time - start_time:.2f} seconds.")
-        return query_embedding
-
-# --- Configuration ---
-university_api_key = st.secrets.get("university_api_key")
-university_base_url = "https://genai.hkbu.edu.hk/general/rest"
-university_chat_model_name = "gpt-4-o-mini"
-university_embedding_model_name = "text-embedding-3-large" 
-university_api_version = "2024-05-01-preview"
-EMBEDDING_BATCH_SIZE = 16
-
-FAISS_INDEX_PATH = "faiss_index" # Path where index files are stored in the repo
-
-# --- Helper function to initialize Vector Store ---
-@st.cache_resource(show_spinner="Loading Knowledge Base...")
-def initialize_vector_store(_embedding_function):
-    logger.info(f"Attempting to load FAISS index from path: {FAISS_INDEX_PATH}")
-    vectorstore = None
-
-    if not os.path.exists(FAISS_INDEX_PATH) or \
-       not os.path.exists(os.path.join(FAISS_INDEX_PATH, "index.faiss")) or \
-       not os.path.exists(os.path.join(FAISS_INDEX_PATH, "index.pkl")):
-        error_msg = f"FAISS index files not found in directory '{FAISS_INDEX_PATH}'. " \
-                    "Please ensure 'index.faiss' and 'index.pkl' were created and committed to the repository."
-        logger.error(error_msg)
-        st.error(error_msg)
-        st.stop()
-        return None
+# --- Helper function to stream the answer into the assistant message ---
+def stream_chat_response(rag_pipeline, retrieval, chat_status):
+    """Yields the answer text piece by piece for st.write_stream.
 
+    The async pipeline runs on the shared background event loop. chat_status['succeeded']
+    is set to True once a complete answer was received; on failure a user-facing error
+    message is yielded instead.
+    """
+    chat_status['succeeded'] = False
+    received_content = False
+    render_ms = 0.0
     try:
-        vectorstore = FAISS.load_local(
-            folder_path=FAISS_INDEX_PATH,
-            embeddings=_embedding_function,
-            allow_dangerous_deserialization=True
-        )
-        logger.info(f"Successfully loaded FAISS index from {FAISS_INDEX_PATH}")
+        for delta in get_background_loop().iterate(rag_pipeline.astream_answer(retrieval)):
+            received_content = True
+            render_start = time.perf_counter()
+            yield delta
+            render_ms += (time.perf_counter() - render_start) * 1000 # Streamlit drawing the delta
+        chat_status['succeeded'] = True
+
+    except httpx.TimeoutException:
+         logger.error("Request to University Chat API timed out.")
+         st.error("The request to the AI chat service timed out. Please try again.")
+         yield ("\n\n" if received_content else "") + "Sorry, the chat request timed out."
+    except httpx.HTTPError as e:
+         logger.exception(f"Error calling University Chat API (HTTPError): {e}")
+         err_msg = f"An error occurred while communicating with the University AI chat service: {e}"
+         st.error(err_msg)
+         yield ("\n\n" if received_content else "") + "Sorry, there was a communication problem with the AI chat service."
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError) as e: # Catch parsing/structure errors
+         logger.exception(f"Error parsing/handling response from University Chat API: {e}")
+         st.error("Received an invalid or unexpected response from the University AI chat service.")
+         yield ("\n\n" if received_content else "") + "Sorry, the AI chat service sent an unexpected response."
+    except ValueError as e: # Response arrived but carried no answer
+         logger.error(f"Could not extract content from chat API response: {e}")
+         yield ("\n\n" if received_content else "") + f"Error: {e}"
     except Exception as e:
-        logger.exception(f"Error loading FAISS index from {FAISS_INDEX_PATH}: {e}")
-        st.error(f"Failed to load the Knowledge Base from local files: {e}")
-        st.stop()
-        return None
-
-    return vectorstore
+        logger.exception("An unexpected error occurred during University Chat API interaction.")
+        st.error(f"An unexpected error occurred: {e}")
+        yield ("\n\n" if received_content else "") + "Sorry, I encountered an error processing your request."
+    finally:
+        if retrieval.trace is not None:
+            retrieval.trace.record("render", render_ms)
+
+# --- Helper function to show where the time of an answer went ---
+def show_timing_breakdown(breakdown, retrieval):
+    with st.expander("Timing breakdown"):
+        notes = [f"{len(retrieval.documents)} chunks, {retrieval.context_tokens} context tokens"]
+        if retrieval.fast_path:
+            notes.append("lexical fast path (no query embedding)")
+        if retrieval.sections:
+            notes.append(f"sections: {', '.join(retrieval.sections)}")
+        st.caption("; ".join(notes))
+        st.table({"stage": list(breakdown), "ms": [f"{milliseconds:.1f}" for milliseconds in breakdown.values()]})
 
 # --- Streamlit App UI ---
 st.set_page_config(page_title="Credit Card FAQ Chatbot", page_icon="💳")
@@ -168,27 +91,14 @@ if not university_api_key:
     logger.warning("University API key not found in secrets.")
     st.stop()
 else:
-    # *** Initialize Custom University Embeddings ***
+    # --- Async RAG pipeline over the shared, cached resources (already built if serve.py warmed up) ---
     try:
-        embeddings = UniversityEmbeddings(
-            api_key=university_api_key,
-            base_url=university_base_url,
-            model_name=university_embedding_model_name,
-            api_version=university_api_version,
-            embed_batch_size=EMBEDDING_BATCH_SIZE
-        )
-        logger.info(f"University Embeddings client initialized successfully.")
+        rag_pipeline = build_rag_pipeline(university_api_key)
     except Exception as e:
-        logger.exception("Failed to initialize University Embeddings client.")
-        st.error(f"Failed to initialize University Embeddings service: {e}")
-        st.stop()
-
-    # --- Load FAISS Vector Store from local files ---
-    vectorstore = initialize_vector_store(embeddings) # Pass embeddings object
-
-    if vectorstore is None:
-        logger.error("FAISS vector store loading failed. Stopping execution.")
+        logger.exception("Failed to load the knowledge base or initialize the API clients.")
+        st.error(f"Failed to load the Knowledge Base: {e}")
         st.stop()
+    background_loop = get_background_loop()
 
     # --- Initialize chat history ---
     if "messages" not in st.session_state:
@@ -211,102 +121,38 @@ else:
             thinking_message = st.empty()
             thinking_message.markdown("Thinking... *(Accessing knowledge base & generating response)*")
             with st.spinner("Processing your request..."):
-                # --- RAG Step: Retrieve ---
-                context = "Error during context retrieval."
-                retrieved_docs_content = []
+                # --- RAG Step: Retrieve (query embedding + FAISS search on the async pipeline) ---
+                cached_answer = None
+                trace = RequestTrace()
                 try:
                     logger.info(f"Retrieving relevant documents for query: '{prompt}' from FAISS index.")
-                    if vectorstore:
-                        retriever = vectorstore.as_retriever(
-                            search_type="similarity",
-                            search_kwargs={"k": 10}
-                        )
-                        retrieved_docs = retriever.invoke(prompt)
-                        retrieved_docs_content = [doc.page_content for doc in retrieved_docs]
+                    retrieval = background_loop.run(rag_pipeline.aretrieve(prompt, trace))
+                    logger.debug(f"Retrieved context:\n{retrieval.context[:500]}...")
 
-                        if not retrieved_docs_content:
-                            logger.warning("No relevant documents found in the FAISS knowledge base for the query.")
-                            context = "No specific information found in the knowledge base for this query."
-                        else:
-                            context = "\n\n---\n\n".join(retrieved_docs_content)
-                            logger.info(f"Retrieved {len(retrieved_docs)} documents from FAISS index.")
-                            logger.debug(f"Retrieved context:\n{context[:500]}...")
-                    else:
-                         logger.error("Vectorstore object (FAISS) is invalid/None. Cannot retrieve documents.")
-                         context = "Error: Failed to access the knowledge base (invalid vectorstore)."
+                    # --- RAG Step: Check Semantic Answer Cache ---
+                    cached_answer = rag_pipeline.cached_answer(retrieval)
 
                 except Exception as e:
                     logger.exception("Error retrieving documents from FAISS vector store.")
                     st.error(f"Error retrieving information from knowledge base files: {e}")
-                    context = "Error: Failed to access the knowledge base files."
-
-                # --- RAG Step: Augment Prompt ---
-                system_message_content = """You are an AI assistant for Standard Chartered HK credit cards.
-                - Answer the user's question based *ONLY* on the provided context below.
-                - Be concise and directly address the question.
-                - If the context doesn't contain the answer, state clearly that the information is not available in the provided documents.
-                - Do not make up information or use external knowledge.
-                - Quote specific fees, rates, or card names from the context when relevant.
-                - If the context indicates an error occurred during retrieval, inform the user politely that you couldn't access the necessary information.
-                """
-                messages_for_api = [
-                    {"role": "system", "content": system_message_content},
-                    {"role": "user", "content": f"Based on the following information:\n\nContext:\n---\n{context}\n---\n\nQuestion: {prompt}"}
-                ]
-
-                # --- RAG Step: Generate ---
-                response_content = "Sorry, I encountered an error processing your request."
-                try:
-                    url = f"{university_base_url}/deployments/{university_chat_model_name}/chat/completions?api-version={university_api_version}"
-                    headers = {
-                        'Content-Type': 'application/json',
-                        'api-key': university_api_key
-                    }
-                    payload = { 'messages': messages_for_api }
-
-                    logger.info(f"Sending request to University Chat API: {url}")
-                    api_response = requests.post(url, json=payload, headers=headers, timeout=90)
-                    api_response.raise_for_status()
-
-                    if api_response.status_code == 200:
-                        data = api_response.json()
-                        logger.info("Successfully received 200 OK response from University Chat API.")
-                        logger.debug(f"Chat API Response Data: {data}")
-                        choices = data.get('choices', [])
-                        if choices:
-                            message = choices[0].get('message', {})
-                            content = message.get('content')
-                            if content:
-                                response_content = content
-                                logger.info("Successfully extracted chat response content.")
-                            else:
-                                logger.error("Could not extract 'content' from chat API response message.")
-                                response_content = "Error: Received an incomplete response from the AI chat service."
-                        else:
-                            logger.error("Could not extract 'choices' from chat API response.")
-                            response_content = "Error: Received an invalid response structure from the AI chat service."
-
-                except requests.exceptions.Timeout:
-                     logger.error("Request to University Chat API timed out.")
-                     st.error("The request to the AI chat service timed out. Please try again.")
-                     response_content = "Sorry, the chat request timed out."
-                except requests.exceptions.RequestException as e:
-                     logger.exception(f"Error calling University Chat API (RequestException): {e}")
-                     err_msg = f"An error occurred while communicating with the University AI chat service: {e}"
-                     st.error(err_msg)
-                     response_content = "Sorry, there was a communication problem with the AI chat service."
-                except (json.JSONDecodeError, KeyError, IndexError, TypeError) as e: # Catch parsing/structure errors
-                     logger.exception(f"Error parsing/handling response from University Chat API: {e}")
-                     st.error("Received an invalid or unexpected response from the University AI chat service.")
-                     response_content = "Sorry, the AI chat service sent an unexpected response."
-                except Exception as e:
-                    logger.exception("An unexpected error occurred during University Chat API interaction.")
-                    st.error(f"An unexpected error occurred: {e}")
-
+                    retrieval = RetrievalResult(prompt, [], [], [], "Error: Failed to access the knowledge base files.", trace=trace)
 
             thinking_message.empty()
-            st.markdown(response_content)
-            logger.info(f"Assistant final response displayed.")
+
+            # --- RAG Step: Generate ---
+            if cached_answer is not None:
+                response_content = cached_answer
+                with trace.span("render"):
+                    st.markdown(response_content)
+            else:
+                # --- RAG Step: Augment Prompt & Stream Answer (cached by the pipeline once complete) ---
+                chat_status = {}
+                response_content = st.write_stream(stream_chat_response(rag_pipeline, retrieval, chat_status))
+            breakdown = trace.finish()
+            logger.info(f"Semantic answer cache stats: {rag_pipeline.answer_cache.stats()}")
+            logger.info(f"Assistant final response displayed. Timings (ms): {breakdown}")
+            if TIMING_DEBUG_EXPANDER or st.query_params.get("debug") == "timings":
+                show_timing_breakdown(breakdown, retrieval)
 
         st.session_state.messages.append({"role": "assistant", "content": response_content})
 
@@ -0,0 +1,175 @@
+# metrics.py
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Stages ---
+# query_embedding, lexical_search, faiss_search, context_assembly, chat_ttfb, chat_total,
+# render and request_total. Spans of one request are kept on its RequestTrace; every
+# span is also aggregated into the process-wide histograms exported below.
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+LATENCY_SLOS_MS: Dict[str, float] = { # Spans above these count as SLO violations
+    "query_embedding": 1500,
+    "faiss_search": 100,
+    "chat_ttfb": 3000,
+    "request_total": 10000
+}
+METRIC_PREFIX = "chatbot"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics), in milliseconds."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list:
+        running, result = 0, []
+        for count in self.counts:
+            running += count
+            result.append(running)
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, previous = 0.0, 0
+        for bound, cumulative in zip(self.buckets + (float("inf"),), self.cumulative()):
+            if cumulative >= rank:
+                if bound == float("inf"):
+                    return self.buckets[-1] # Only known to be above the largest bucket
+                in_bucket = cumulative - previous
+                return lower + (bound - lower) * ((rank - previous) / in_bucket if in_bucket else 0)
+            lower, previous = bound, cumulative
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe per-stage latency histograms and SLO violation counters."""
+
+    def __init__(self, slos_ms: Optional[Dict[str, float]] = None, buckets: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.slos_ms = dict(LATENCY_SLOS_MS if slos_ms is None else slos_ms)
+        self.bucket_bounds = tuple(buckets)
+        self.histograms: Dict[str, Histogram] = {}
+        self.slo_violations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, milliseconds: float):
+        with self._lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram(self.bucket_bounds)
+            self.histograms[stage].observe(milliseconds)
+            slo = self.slos_ms.get(stage)
+            violated = slo is not None and milliseconds > slo
+            if violated:
+                self.slo_violations[stage] = self.slo_violations.get(stage, 0) + 1
+        if violated:
+            logger.warning(f"Latency SLO exceeded: {stage} took {milliseconds:.0f} ms (SLO {slo:.0f} ms)")
+
+    def to_json(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "sum_ms": round(histogram.sum, 3),
+                        "mean_ms": round(histogram.sum / histogram.count, 3) if histogram.count else None,
+                        "p50_ms": histogram.quantile(0.5),
+                        "p95_ms": histogram.quantile(0.95),
+                        "p99_ms": histogram.quantile(0.99),
+                        "buckets": {str(bound): count for bound, count in zip(histogram.buckets + ("+Inf",), histogram.cumulative())}
+                    }
+                    for stage, histogram in sorted(self.histograms.items())
+                },
+                "slo_ms": dict(self.slos_ms),
+                "slo_violations": dict(self.slo_violations)
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        name = f"{METRIC_PREFIX}_stage_latency_milliseconds"
+        lines = [
+            f"# HELP {name} Latency of each request stage in milliseconds.",
+            f"# TYPE {name} histogram"
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.cumulative()):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.3f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            violations = f"{METRIC_PREFIX}_slo_violations_total"
+            lines += [f"# HELP {violations} Spans slower than their latency SLO.", f"# TYPE {violations} counter"]
+            for stage in sorted(self.slos_ms):
+                lines.append(f'{violations}{{stage="{stage}"}} {self.slo_violations.get(stage, 0)}')
+        return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> MetricsRegistry:
+    """Process-wide registry, shared by all sessions and exported by the probe server."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
+
+def observe(stage: str, milliseconds: float):
+    get_metrics().observe(stage, milliseconds)
+
+
+class RequestTrace:
+    """Timing spans of one request.
+
+    Passed explicitly along the request (the pipeline runs on the background event loop,
+    so context variables of the calling thread would not follow it). Repeated spans of
+    the same stage add up.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, milliseconds: float):
+        with self._lock:
+            self.spans[stage] = self.spans.get(stage, 0.0) + milliseconds
+        observe(stage, milliseconds)
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def finish(self) -> Dict[str, float]:
+        """Records request_total (time since the trace started) and returns the breakdown."""
+        self.record("request_total", self.elapsed_ms())
+        return self.breakdown()
+
+    def breakdown(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(milliseconds, 3) for stage, milliseconds in self.spans.items()}
@@ -0,0 +1,229 @@
+# mock_genai.py
+import sys
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Local stand-in for the HKBU GenAI REST API: the embeddings and chat completions
+# routes the app calls, with deterministic embeddings, lognormal latencies and injected
+# errors / 429s. Point the app at it with UNIVERSITY_BASE_URL=http://127.0.0.1:8600.
+
+# --- Defaults ---
+DEFAULT_PORT = 8600
+DEFAULT_DIMENSIONS = 3072 # text-embedding-3-large; the committed index expects this size
+_EMBEDDINGS_ROUTE = re.compile(r"^/deployments/(?P<model>[^/]+)/embeddings$")
+_CHAT_ROUTE = re.compile(r"^/deployments/(?P<model>[^/]+)/chat/completions$")
+_ANSWER_WORDS = (
+    "Based on the provided documents, the annual fee is waived for the first year and "
+    "later charged per card as listed in the Key Facts Statement for your card type."
+).split(" ")
+
+
+@dataclass
+class LatencyModel:
+    """Lognormal latency given by its median and 99th percentile, in milliseconds."""
+    median_ms: float
+    p99_ms: float
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(self.p99_ms, self.median_ms) / self.median_ms) / 2.326 # z(0.99)
+        return rng.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+@dataclass
+class MockConfig:
+    embed_latency: LatencyModel = field(default_factory=lambda: LatencyModel(120, 600)) # Per request
+    embed_per_text_ms: float = 2.0 # Added per input text, so batches cost more
+    chat_ttfb: LatencyModel = field(default_factory=lambda: LatencyModel(450, 2500)) # Time to first token
+    token_interval_ms: float = 20.0 # Between streamed tokens
+    answer_tokens: int = 40 # Words streamed per answer
+    error_rate: float = 0.0 # Fraction of requests answered with 500/503
+    throttle_rate: float = 0.0 # Fraction of requests answered with 429
+    retry_after_seconds: int = 1
+    dimensions: int = DEFAULT_DIMENSIONS
+    seed: Optional[int] = None
+
+
+def mock_embedding(text: str, dimensions: int) -> list:
+    """Deterministic unit vector for a text: the same text always embeds the same way."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+
+class MockGenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, _MockHandler)
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"embeddings": 0, "chat": 0, "errors": 0, "throttled": 0}
+
+    def draw(self, fn):
+        with self._rng_lock:
+            return fn(self._rng)
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    server: MockGenAIServer
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real endpoint, so connection pooling is exercised
+
+    def do_GET(self):
+        # Warm-up opens connections with a GET on the base URL; any status will do
+        self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?", 1)[0]
+        if not self.headers.get("api-key"):
+            self._send_json(401, {"error": {"code": "401", "message": "Access denied due to missing api-key."}})
+            return
+        embeddings_route, chat_route = _EMBEDDINGS_ROUTE.match(path), _CHAT_ROUTE.match(path)
+        if not (embeddings_route or chat_route):
+            self._send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        if self._inject_failure():
+            return
+        payload = json.loads(body or b"{}")
+        if embeddings_route:
+            self._embeddings(payload)
+        else:
+            self._chat(payload)
+
+    def _inject_failure(self) -> bool:
+        config = self.server.config
+        roll = self.server.draw(lambda rng: rng.random())
+        if roll < config.throttle_rate:
+            self.server.count("throttled")
+            self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded."}}, {"Retry-After": str(config.retry_after_seconds)})
+            return True
+        if roll < config.throttle_rate + config.error_rate:
+            self.server.count("errors")
+            status = self.server.draw(lambda rng: rng.choice((500, 503)))
+            self._send_json(status, {"error": {"code": str(status), "message": "Injected server error."}})
+            return True
+        return False
+
+    def _embeddings(self, payload: dict):
+        config = self.server.config
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        dimensions = payload.get("dimensions") or config.dimensions
+        time.sleep(self.server.draw(config.embed_latency.sample) + len(texts) * config.embed_per_text_ms / 1000)
+        self.server.count("embeddings")
+        self._send_json(200, {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": mock_embedding(text, dimensions)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": sum(len(text.split()) for text in texts)}
+        })
+
+    def _chat(self, payload: dict):
+        config = self.server.config
+        time.sleep(self.server.draw(config.chat_ttfb.sample))
+        self.server.count("chat")
+        words = [_ANSWER_WORDS[i % len(_ANSWER_WORDS)] for i in range(config.answer_tokens)]
+        if not payload.get("stream"):
+            self._send_json(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}}]})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(b'data: {"choices":[],"prompt_filter_results":[]}\n\n') # Like the real first event
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(config.token_interval_ms / 1000)
+            event = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = DEFAULT_PORT, config: Optional[MockConfig] = None) -> MockGenAIServer:
+    """Starts the mock API on a daemon thread; port 0 picks a free port (see server.server_port)."""
+    server = MockGenAIServer((host, port), config or MockConfig())
+    threading.Thread(target=server.serve_forever, name="mock-genai", daemon=True).start()
+    logger.info(f"Mock GenAI API listening on http://{host}:{server.server_port}")
+    return server
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    defaults = MockConfig()
+    parser.add_argument("--embed-median-ms", type=float, default=defaults.embed_latency.median_ms, help="Median embedding request latency (default: %(default)s).")
+    parser.add_argument("--embed-p99-ms", type=float, default=defaults.embed_latency.p99_ms, help="p99 embedding request latency (default: %(default)s).")
+    parser.add_argument("--ttfb-median-ms", type=float, default=defaults.chat_ttfb.median_ms, help="Median chat time to first token (default: %(default)s).")
+    parser.add_argument("--ttfb-p99-ms", type=float, default=defaults.chat_ttfb.p99_ms, help="p99 chat time to first token (default: %(default)s).")
+    parser.add_argument("--token-interval-ms", type=float, default=defaults.token_interval_ms, help="Delay between streamed tokens (default: %(default)s).")
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens, help="Tokens streamed per answer (default: %(default)s).")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Fraction of requests failing with 500/503 (default: %(default)s).")
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate, help="Fraction of requests answered with 429 (default: %(default)s).")
+    parser.add_argument("--dimensions", type=int, default=defaults.dimensions, help="Embedding size when the request does not set one (default: %(default)s).")
+    parser.add_argument("--seed", type=int, default=None, help="Seed latency and failure draws for repeatable runs.")
+
+def mock_config_from_args(args) -> MockConfig:
+    return MockConfig(
+        embed_latency=LatencyModel(args.embed_median_ms, args.embed_p99_ms),
+        chat_ttfb=LatencyModel(args.ttfb_median_ms, args.ttfb_p99_ms),
+        token_interval_ms=args.token_interval_ms,
+        answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        dimensions=args.dimensions,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the HKBU GenAI embeddings and chat API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s', stream=sys.stdout)
+
+    server = start_mock_server(args.host, args.port, mock_config_from_args(args))
+    print(f"Run the app against it with UNIVERSITY_BASE_URL=http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
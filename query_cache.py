@@ -0,0 +1,89 @@
+# query_cache.py
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 6 * 60 * 60 # Re-embed a cached question after six hours
+
+_KEEP_PUNCTUATION = {"%"} # Carries meaning in rate questions ("2.5%")
+
+
+def _strip_punctuation(token: str) -> str:
+    """Strips punctuation from both ends of a token, keeping inner marks like '2.5' or "card's"."""
+    start, end = 0, len(token)
+    while start < end and unicodedata.category(token[start]).startswith("P") and token[start] not in _KEEP_PUNCTUATION:
+        start += 1
+    while end > start and unicodedata.category(token[end - 1]).startswith("P") and token[end - 1] not in _KEEP_PUNCTUATION:
+        end -= 1
+    return token[start:end]
+
+def normalize_query(text: str) -> str:
+    """Normalizes a prompt so trivially different spellings share one cache entry.
+
+    Applies NFKC (folds full-width CJK punctuation), case folding, edge punctuation
+    stripping per token and whitespace collapsing.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens = (_strip_punctuation(token) for token in text.split())
+    return " ".join(token for token in tokens if token)
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU cache of query embeddings with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (stored_at, embedding)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, text: str) -> bool:
+        """Checks for a live entry without touching LRU order or hit/miss counters."""
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds
+
+    def put(self, text: str, embedding: List[float]):
+        key = normalize_query(text)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
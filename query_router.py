@@ -0,0 +1,79 @@
+# query_router.py
+import logging
+import re
+from typing import Dict, List, Optional
+
+from query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# --- Routing Rules ---
+# Keywords (English and Chinese) that point a question at the knowledge sections
+# listed in knowledge/sources.json. A question can match several sections.
+SECTION_KEYWORDS: Dict[str, List[str]] = {
+    "fees": [
+        "fee", "fees", "charge", "charges", "interest", "apr", "annualised percentage rate", "finance charge",
+        "late payment", "overlimit", "over limit", "minimum payment", "cash advance", "handling fee",
+        "foreign currency", "dcc", "returned cheque", "key facts",
+        "年費", "費用", "收費", "利息", "利率", "手續費", "逾期", "最低還款", "現金透支"
+    ],
+    "card_comparison": [
+        "compare", "comparison", "which card", "best card", "difference between", "welcome offer",
+        "比較", "邊張卡", "哪張卡"
+    ],
+    "help_centre": [
+        "faq", "how do i", "how can i", "how to", "lost", "stolen", "unauthorised", "unauthorized", "dispute",
+        "repayment", "repay", "pay my", "autopay", "authentication", "authorise", "authorize", "push notification",
+        "form", "forms", "download", "document",
+        "遺失", "被盜", "還款", "表格", "認證"
+    ],
+    "promotions": [
+        "promotion", "promotions", "promo", "offer", "offers", "discount", "lucky draw", "merchant",
+        "booking.com", "iphone", "shkp", "the point", "spending reward",
+        "優惠", "推廣", "折扣", "抽獎"
+    ],
+    "rewards": [
+        "reward", "rewards", "360", "points", "asia miles", "miles", "redeem", "redemption", "cashback", "cash back",
+        "積分", "里數", "兌換", "回贈"
+    ],
+    "services": [
+        "mobile app", "sc mobile", "online banking", "register", "registration", "e-statement", "estatement",
+        "instalment", "installment", "balance transfer", "card activation", "activate", "credit limit",
+        "手機程式", "網上理財", "分期", "結餘轉戶", "信用額"
+    ],
+    "lifestyle_privileges": [
+        "magic access", "good life", "park", "parking", "membership", "dining privilege",
+        "美食", "泊車", "會籍"
+    ]
+}
+
+# Card names appear both in the fee schedule and in the card comparison pages.
+CARD_NAMES = [
+    "smart card", "smart credit card", "simply cash", "cathay", "manhattan", "priority banking",
+    "visa infinite", "unionpay", "dual currency", "platinum", "signature"
+]
+CARD_NAME_SECTIONS = ["card_comparison", "fees"]
+
+
+def _compile(keyword: str) -> re.Pattern:
+    if keyword.isascii():
+        return re.compile(r"(?<![a-z0-9])" + re.escape(keyword) + r"(?![a-z0-9])")
+    return re.compile(re.escape(keyword)) # CJK text has no word boundaries
+
+_SECTION_PATTERNS = {section: [_compile(keyword) for keyword in keywords] for section, keywords in SECTION_KEYWORDS.items()}
+_CARD_NAME_PATTERNS = [_compile(name) for name in CARD_NAMES]
+
+
+def route_query(question: str) -> Optional[List[str]]:
+    """Returns the sections a question should be searched in, or None to search everything."""
+    normalized = normalize_query(question)
+    sections = [
+        section for section, patterns in _SECTION_PATTERNS.items()
+        if any(pattern.search(normalized) for pattern in patterns)
+    ]
+    if any(pattern.search(normalized) for pattern in _CARD_NAME_PATTERNS):
+        sections.extend(section for section in CARD_NAME_SECTIONS if section not in sections)
+    if not sections:
+        return None
+    logger.debug(f"Routed query to sections: {sections}")
+    return sections
@@ -0,0 +1,372 @@
+# rag_pipeline.py
+import asyncio
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from answer_cache import SemanticAnswerCache
+from chunk_selection import ChunkSelector
+from context_builder import count_context_tokens, join_context, select_within_budget
+from embedding_cache import hash_text
+from http_client import AsyncPooledTransport
+from lexical_index import FastPathGate, LexicalIndex, reciprocal_rank_fusion
+from metrics import RequestTrace
+from query_router import route_query
+from section_search import SectionSearch
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are an AI assistant for Standard Chartered HK credit cards.
+                - Answer the user's question based *ONLY* on the provided context below.
+                - Be concise and directly address the question.
+                - If the context doesn't contain the answer, state clearly that the information is not available in the provided documents.
+                - Do not make up information or use external knowledge.
+                - Quote specific fees, rates, or card names from the context when relevant.
+                - If the context indicates an error occurred during retrieval, inform the user politely that you couldn't access the necessary information.
+                """
+NO_CONTEXT_MESSAGE = "No specific information found in the knowledge base for this query."
+
+
+def build_messages(context: str, question: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Based on the following information:\n\nContext:\n---\n{context}\n---\n\nQuestion: {question}"}
+    ]
+
+
+# --- Event loop bridge for synchronous callers ---
+class BackgroundLoop:
+    """Runs one asyncio event loop in a daemon thread.
+
+    Synchronous callers such as the Streamlit script thread submit coroutines to it,
+    so async connection pools stay open across calls and concurrent sessions share
+    one loop instead of blocking a thread per in-flight request.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="rag-event-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def iterate(self, async_iterable) -> Iterator:
+        """Exposes an async iterator as a plain iterator (e.g. for st.write_stream)."""
+        async_iterator = async_iterable.__aiter__()
+        try:
+            while True:
+                try:
+                    yield self.run(async_iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            if hasattr(async_iterator, "aclose"):
+                self.run(async_iterator.aclose())
+
+_background_loop: Optional[BackgroundLoop] = None
+_background_loop_lock = threading.Lock()
+
+def get_background_loop() -> BackgroundLoop:
+    global _background_loop
+    if _background_loop is None:
+        with _background_loop_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundLoop()
+    return _background_loop
+
+
+# --- Async chat client ---
+class AsyncUniversityChat:
+    """Streams chat completions from the University API over a pooled async transport."""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        api_version: str,
+        transport: AsyncPooledTransport,
+        timeout: float = 90
+    ):
+        self.url = f"{base_url}/deployments/{model_name}/chat/completions?api-version={api_version}"
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'api-key': api_key
+        }
+        self.transport = transport
+        self.timeout = timeout
+
+    async def astream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Yields answer text deltas. Raises httpx errors on transport/HTTP failures and
+        ValueError when the response does not contain an answer."""
+        payload = {'messages': messages, 'stream': True}
+        logger.info(f"Sending streaming request to University Chat API: {self.url}")
+        async with self.transport.stream("POST", self.url, json=payload, headers=self.headers, timeout=self.timeout) as response:
+            if response.is_error:
+                await response.aread() # Make the error body available on the raised exception
+            response.raise_for_status()
+
+            if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                # Endpoint ignored 'stream'; fall back to the complete JSON body
+                data = json.loads(await response.aread())
+                logger.debug(f"Chat API Response Data: {data}")
+                choices = data.get('choices', [])
+                if not choices:
+                    raise ValueError("Received an invalid response structure from the AI chat service.")
+                content = choices[0].get('message', {}).get('content')
+                if not content:
+                    raise ValueError("Received an incomplete response from the AI chat service.")
+                yield content
+                return
+
+            received_content = False
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line.startswith("data:"):
+                    continue
+                event_data = line[len("data:"):].strip()
+                if event_data == "[DONE]":
+                    break
+                event = json.loads(event_data)
+                if event.get('error'): # Failures after the 200 status line arrive as an error event
+                    raise ValueError(f"AI chat service failed mid-stream: {event['error'].get('message', event['error'])}")
+                for choice in event.get('choices', []): # The first event may only carry content filter results
+                    delta = choice.get('delta') or {}
+                    if delta.get('content'):
+                        if not received_content:
+                            logger.info("Received first token from University Chat API.")
+                        received_content = True
+                        yield delta['content']
+
+            if not received_content:
+                raise ValueError("Received an incomplete response from the AI chat service.")
+            logger.info("Successfully streamed chat response content.")
+
+    async def acomplete(self, messages: List[Dict[str, str]]) -> str:
+        return "".join([delta async for delta in self.astream(messages)])
+
+
+# --- Pipeline ---
+@dataclass
+class RetrievalResult:
+    question: str
+    query_embedding: List[float]
+    documents: List[Document]
+    scores: List[float] # FAISS L2 distances, fused RRF scores when hybrid search ran, or BM25 scores on the fast path
+    context: str
+    side_results: List[Any] = field(default_factory=list) # Results of the side lookups, in registration order
+    sections: Optional[List[str]] = None # Sections the search was restricted to, None for a full search
+    fast_path: bool = False # True when BM25 alone answered retrieval (no query embedding; answers cached by question text)
+    context_tokens: int = 0 # Chat-model tokens of the chunks in `context`
+    trace: Optional[RequestTrace] = field(default=None, repr=False) # Timing spans of the request, continued by generation
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        return [hash_text(doc.page_content) for doc in self.documents]
+
+
+@dataclass
+class AnswerResult:
+    answer: str
+    retrieval: RetrievalResult
+    from_cache: bool
+
+
+class AsyncRAGPipeline:
+    """Retrieve-then-generate pipeline built on async stages.
+
+    The query embedding and any registered side lookups (e.g. cache probes or local
+    indexes that do not need the embedding) are awaited together, so their latencies
+    overlap instead of adding up. FAISS search runs in a worker thread and, when a
+    SectionSearch is configured, is restricted to the sections the question routes to.
+    With a LexicalIndex, BM25 results are fused with the vector results (RRF); with a
+    FastPathGate as well, confident BM25 matches are returned without embedding the query.
+    A ChunkSelector drops near-duplicate chunks and reorders the rest for diversity (MMR).
+    With a context_token_budget, the context holds only as many of them as fit the budget,
+    best first; chunks that neighbour each other in their source are then merged.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        vectorstore,
+        chat_client: AsyncUniversityChat,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        section_search: Optional[SectionSearch] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        fast_path_gate: Optional[FastPathGate] = None,
+        chunk_selector: Optional[ChunkSelector] = None,
+        k: int = 10,
+        context_token_budget: Optional[int] = None
+    ):
+        self.embeddings = embeddings
+        self.vectorstore = vectorstore
+        self.chat_client = chat_client
+        self.answer_cache = answer_cache
+        self.section_search = section_search # Enables routed, section-filtered search when set
+        self.lexical_index = lexical_index # Enables BM25 + vector hybrid retrieval when set
+        self.fast_path_gate = fast_path_gate # Lets confident BM25 matches skip the embedding API
+        self.chunk_selector = chunk_selector # Drops near-duplicates and repeated chunk overlap, using the stored vectors
+        self.k = k
+        self.context_token_budget = context_token_budget # Max chat-model tokens of context; None keeps all k chunks
+        self.side_lookups: List[Callable[[str], Awaitable[Any]]] = []
+
+    async def aretrieve(self, question: str, trace: Optional[RequestTrace] = None) -> RetrievalResult:
+        trace = trace or RequestTrace()
+        sections = self.route(question)
+        if self.fast_path_gate is not None and self.lexical_index is not None and not self._query_embedding_cached(question):
+            # BM25 takes microseconds, so run it first: a confident match skips the embedding call entirely
+            lexical_hits = await self._alexical_search(question, sections, trace)
+            if self.fast_path_gate.decide(self.lexical_index, question, lexical_hits):
+                side_results = await asyncio.gather(*(lookup(question) for lookup in self.side_lookups))
+                return self._lexical_only_result(question, lexical_hits, sections, list(side_results), trace)
+            query_embedding, *side_results = await asyncio.gather(
+                self._aembed_query(question, trace),
+                *(lookup(question) for lookup in self.side_lookups)
+            )
+        else:
+            query_embedding, lexical_hits, *side_results = await asyncio.gather(
+                self._aembed_query(question, trace),
+                self._alexical_search(question, sections, trace),
+                *(lookup(question) for lookup in self.side_lookups)
+            )
+        with trace.span("faiss_search"):
+            docs_and_scores = []
+            if sections:
+                docs_and_scores = await asyncio.to_thread(self.section_search.search, query_embedding, self.k, sections)
+                logger.info(f"Filtered search in sections {sections} returned {len(docs_and_scores)} chunks.")
+            if not docs_and_scores:
+                sections = None
+                docs_and_scores = await self.vectorstore.asimilarity_search_with_score_by_vector(query_embedding, k=self.k)
+        with trace.span("context_assembly"):
+            documents = [doc for doc, _ in docs_and_scores]
+            scores = [float(score) for _, score in docs_and_scores]
+            if lexical_hits:
+                documents, scores = self._fuse(documents, lexical_hits)
+            documents, scores, context_tokens = self._select_context(documents, scores)
+            if documents:
+                context = join_context(documents)
+                logger.info(f"Retrieved {len(documents)} documents ({context_tokens} tokens) from FAISS index.")
+            else:
+                logger.warning("No relevant documents found in the FAISS knowledge base for the query.")
+                context = NO_CONTEXT_MESSAGE
+        return RetrievalResult(
+            question, query_embedding, documents, scores, context, side_results, sections,
+            context_tokens=context_tokens, trace=trace
+        )
+
+    async def _aembed_query(self, question: str, trace: RequestTrace) -> List[float]:
+        with trace.span("query_embedding"): # Includes query-cache hits, which take microseconds
+            return await self.embeddings.aembed_query(question)
+
+    def _query_embedding_cached(self, question: str) -> bool:
+        """A cached query embedding makes the vector path free, so the fast path is not needed."""
+        query_cache = getattr(self.embeddings, "query_cache", None)
+        return query_cache is not None and query_cache.contains(question)
+
+    def _lexical_only_result(
+        self,
+        question: str,
+        lexical_hits: List[Tuple[str, float]],
+        sections: Optional[List[str]],
+        side_results: List[Any],
+        trace: RequestTrace
+    ) -> RetrievalResult:
+        with trace.span("context_assembly"):
+            documents, scores = [], []
+            for doc_id, score in lexical_hits:
+                doc = self.vectorstore.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    documents.append(doc)
+                    scores.append(score)
+            documents, scores, context_tokens = self._select_context(documents, scores)
+            context = join_context(documents)
+        logger.info(f"Lexical fast path: retrieved {len(documents)} documents ({context_tokens} tokens) without calling the embedding API.")
+        return RetrievalResult(
+            question, [], documents, scores, context, side_results, sections,
+            fast_path=True, context_tokens=context_tokens, trace=trace
+        )
+
+    def _select_context(self, documents: List[Document], scores: List[float]) -> Tuple[List[Document], List[float], int]:
+        """Chunks that go into the prompt: near-duplicates dropped and MMR-ordered, cut to the
+        token budget, then overlapping neighbours merged (which only saves tokens)."""
+        if self.chunk_selector is None:
+            return select_within_budget(documents, scores, self.context_token_budget)
+        documents, scores = self.chunk_selector.select(documents, scores)
+        documents, scores, _ = select_within_budget(documents, scores, self.context_token_budget)
+        documents, scores = self.chunk_selector.merge_adjacent(documents, scores)
+        return documents, scores, count_context_tokens(documents)
+
+    async def _alexical_search(self, question: str, sections: Optional[List[str]], trace: RequestTrace) -> List[Tuple[str, float]]:
+        """BM25 lookup; purely local, so it completes while the embedding request is in flight."""
+        if self.lexical_index is None:
+            return []
+        with trace.span("lexical_search"):
+            allowed_ids = self.section_search.docstore_ids(sections) if sections else None
+            return self.lexical_index.search(question, k=self.k, allowed_ids=allowed_ids)
+
+    def _fuse(self, documents: List[Document], lexical_hits: List[Tuple[str, float]]) -> Tuple[List[Document], List[float]]:
+        """Merges vector and BM25 rankings with reciprocal-rank fusion, keeping the top k."""
+        by_id = {doc.id: doc for doc in documents}
+        fused = reciprocal_rank_fusion([[doc.id for doc in documents], [doc_id for doc_id, _ in lexical_hits]])
+        fused_documents, fused_scores = [], []
+        for doc_id, score in fused[:self.k]:
+            doc = by_id.get(doc_id) or self.vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                fused_documents.append(doc)
+                fused_scores.append(score)
+        return fused_documents, fused_scores
+
+    def route(self, question: str) -> Optional[List[str]]:
+        """Sections to restrict the vector search to, or None for a full search."""
+        if self.section_search is None or not self.section_search.available:
+            return None
+        sections = route_query(question)
+        if sections and self.section_search.covers(sections):
+            return sections
+        return None
+
+    def cached_answer(self, retrieval: RetrievalResult) -> Optional[str]:
+        if self.answer_cache is None or not retrieval.documents:
+            return None
+        return self.answer_cache.lookup(retrieval.query_embedding, retrieval.chunk_ids, retrieval.question)
+
+    def remember_answer(self, retrieval: RetrievalResult, answer: str):
+        if self.answer_cache is not None and retrieval.documents:
+            self.answer_cache.store(retrieval.query_embedding, retrieval.chunk_ids, answer, retrieval.question)
+
+    async def astream_answer(self, retrieval: RetrievalResult) -> AsyncIterator[str]:
+        """Streams a freshly generated answer for a retrieval result and caches it when complete.
+
+        Records chat_ttfb and chat_total on the retrieval's trace; time spent by the consumer
+        between deltas (e.g. rendering) is left out of chat_total.
+        """
+        trace = retrieval.trace or RequestTrace()
+        pieces = []
+        chat_ms = 0.0
+        start = time.perf_counter()
+        async for delta in self.chat_client.astream(build_messages(retrieval.context, retrieval.question)):
+            chat_ms += (time.perf_counter() - start) * 1000
+            if not pieces:
+                trace.record("chat_ttfb", chat_ms)
+            pieces.append(delta)
+            yield delta
+            start = time.perf_counter()
+        trace.record("chat_total", chat_ms + (time.perf_counter() - start) * 1000)
+        self.remember_answer(retrieval, "".join(pieces))
+
+    async def aanswer(self, question: str, trace: Optional[RequestTrace] = None) -> AnswerResult:
+        """Full non-streaming pipeline for headless callers."""
+        retrieval = await self.aretrieve(question, trace)
+        cached = self.cached_answer(retrieval)
+        if cached is not None:
+            return AnswerResult(cached, retrieval, from_cache=True)
+        answer = "".join([delta async for delta in self.astream_answer(retrieval)])
+        return AnswerResult(answer, retrieval, from_cache=False)
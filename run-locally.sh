@@ -1 +1 @@
-streamlit run main.py
\ No newline at end of file
+python serve.py
\ No newline at end of file
@@ -0,0 +1,84 @@
+# section_search.py
+import logging
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def search_parameters(index, selector=None):
+    """Builds FAISS search parameters for `index`, keeping its tuned search settings.
+
+    Passing params to index.search overrides the index-level efSearch/nprobe, so they
+    are copied over explicitly.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    ivf = faiss.try_extract_index_ivf(index) if hasattr(faiss, "try_extract_index_ivf") else None
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+class SectionSearch:
+    """Vector search restricted to the chunks of selected knowledge sections.
+
+    Built once per loaded FAISS store from each chunk's `section` metadata. Searches
+    pass an ID selector to FAISS, so vectors outside the routed sections are skipped
+    during scoring rather than filtered out afterwards.
+    """
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        section_ids: Dict[str, List[int]] = {}
+        for faiss_id, docstore_id in vectorstore.index_to_docstore_id.items():
+            section = vectorstore.docstore.search(docstore_id).metadata.get("section")
+            if section:
+                section_ids.setdefault(section, []).append(faiss_id)
+        self.section_ids = {section: np.array(ids, dtype=np.int64) for section, ids in section_ids.items()}
+        self._selectors: Dict[FrozenSet[str], Tuple[object, np.ndarray]] = {}
+        if self.section_ids:
+            logger.info(f"Section search ready for {len(self.section_ids)} sections: {sorted(self.section_ids)}")
+        else:
+            logger.warning("Index chunks carry no section metadata; filtered search is disabled until the index is rebuilt.")
+
+    @property
+    def available(self) -> bool:
+        return bool(self.section_ids)
+
+    def covers(self, sections: Iterable[str]) -> bool:
+        return any(section in self.section_ids for section in sections)
+
+    def docstore_ids(self, sections: Iterable[str]) -> set:
+        """Docstore IDs of every chunk in the given sections."""
+        return {
+            self.vectorstore.index_to_docstore_id[int(faiss_id)]
+            for section in sections if section in self.section_ids
+            for faiss_id in self.section_ids[section]
+        }
+
+    def _selector(self, sections: FrozenSet[str]):
+        if sections not in self._selectors:
+            ids = np.concatenate([self.section_ids[s] for s in sorted(sections) if s in self.section_ids])
+            # Keep the id array referenced alongside the selector; FAISS does not own it
+            self._selectors[sections] = (faiss.IDSelectorBatch(ids), ids)
+        return self._selectors[sections][0]
+
+    def search(self, query_embedding: List[float], k: int, sections: Iterable[str]) -> List[Tuple[Document, float]]:
+        """Returns up to k (document, L2 distance) pairs from the given sections."""
+        vector = np.array([query_embedding], dtype=np.float32)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            faiss.normalize_L2(vector)
+        index = self.vectorstore.index
+        params = search_parameters(index, self._selector(frozenset(sections)))
+        distances, indices = index.search(vector, k, params=params)
+        results = []
+        for distance, faiss_id in zip(distances[0], indices[0]):
+            if faiss_id == -1:
+                continue
+            docstore_id = self.vectorstore.index_to_docstore_id[faiss_id]
+            results.append((self.vectorstore.docstore.search(docstore_id), float(distance)))
+        return results
@@ -0,0 +1,52 @@
+# serve.py
+import sys
+import argparse
+import logging
+import threading
+
+from streamlit.web import cli as stcli
+
+from warmup import start_readiness_server
+
+# --- Logging Configuration ---
+log_level = logging.INFO
+log_format = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+logging.basicConfig(level=log_level, format=log_format, stream=sys.stdout)
+logger = logging.getLogger(__name__)
+
+# --- Settings ---
+APP_SCRIPT = "main.py"
+APP_PORT = 8501
+READINESS_PORT = 8502 # /ready and /live for load balancers and deploy checks
+
+
+def start_warmup(synthetic_query: bool = True) -> threading.Thread:
+    """Builds the knowledge base, caches and connection pools while Streamlit starts.
+
+    The resources are st.cache_resource entries in app_resources.py, so sessions that
+    arrive later (in this same process) reuse them instead of loading on first request.
+    """
+    def run():
+        # Imported here: reading st.secrets needs nothing from the server, but the import
+        # should not delay the Streamlit server from binding its port.
+        import app_resources
+        query = app_resources.WARMUP_QUERY if synthetic_query else None
+        app_resources.warm_up(synthetic_query=query)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the chatbot with eager warm-up and a readiness probe.")
+    parser.add_argument("--port", type=int, default=APP_PORT, help="Streamlit server port.")
+    parser.add_argument("--readiness-port", type=int, default=READINESS_PORT, help="Port of the /ready and /live probe endpoints.")
+    parser.add_argument("--no-query", action="store_true", help="Skip the synthetic retrieval query during warm-up.")
+    args = parser.parse_args()
+
+    start_readiness_server(port=args.readiness_port)
+    start_warmup(synthetic_query=not args.no_query)
+
+    sys.argv = ["streamlit", "run", APP_SCRIPT, "--server.port", str(args.port)]
+    sys.exit(stcli.main())
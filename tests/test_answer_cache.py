@@ -0,0 +1,100 @@
+import os
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, index_version
+
+
+def test_paraphrase_above_the_threshold_reuses_the_answer():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], ["c1", "c2"], "HK$550")
+    assert cache.lookup([0.99, 0.05, 0.0], ["c2", "c1"]) == "HK$550" # Chunk order does not matter
+
+
+def test_question_below_the_threshold_misses():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.store([1.0, 0.0], ["c1"], "HK$550")
+    assert cache.lookup([0.9, 0.44], ["c1"]) is None # Cosine ~0.90
+    assert cache.stats()["misses"] == 1
+
+
+def test_same_question_with_different_context_misses():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], ["c1", "c2"], "HK$550")
+    assert cache.lookup([1.0, 0.0], ["c1", "c3"]) is None
+
+
+def test_empty_query_embedding_is_never_cached():
+    cache = SemanticAnswerCache()
+    cache.store([], ["c1"], "answer")
+    assert cache.stats()["entries"] == 0
+    assert cache.lookup([], ["c1"]) is None
+
+
+def test_vectors_of_another_size_do_not_match():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0, 0.0], ["c1"], "answer")
+    assert cache.lookup([1.0, 0.0], ["c1"]) is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=10)
+    cache.store([1.0, 0.0], ["c1"], "answer")
+    now[0] += 11
+    assert cache.lookup([1.0, 0.0], ["c1"]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_oldest_entry_is_evicted_past_max_entries():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store([1.0, 0.0], ["a"], "first")
+    cache.store([0.0, 1.0], ["b"], "second")
+    cache.store([0.7, 0.7], ["c"], "third")
+    assert cache.lookup([1.0, 0.0], ["a"]) is None
+    assert cache.lookup([0.0, 1.0], ["b"]) == "second"
+
+
+def test_index_rebuild_invalidates_cached_answers(tmp_path):
+    (tmp_path / "index.faiss").write_bytes(b"v1")
+    cache = SemanticAnswerCache()
+    cache.ensure_index_version(index_version(str(tmp_path)))
+    cache.store([1.0, 0.0], ["c1"], "old answer")
+
+    cache.ensure_index_version(index_version(str(tmp_path))) # Unchanged index keeps entries
+    assert cache.lookup([1.0, 0.0], ["c1"]) == "old answer"
+
+    (tmp_path / "index.faiss").write_bytes(b"rebuilt")
+    os.utime(tmp_path / "index.faiss", ns=(1, 1))
+    cache.ensure_index_version(index_version(str(tmp_path)))
+    assert cache.lookup([1.0, 0.0], ["c1"]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_index_version_of_a_missing_or_empty_directory(tmp_path):
+    empty = index_version(str(tmp_path))
+    assert index_version(str(tmp_path / "missing")) == empty # Neither holds an index
+    (tmp_path / "index.faiss").write_bytes(b"v1")
+    assert index_version(str(tmp_path)) != empty
+
+
+def test_retrievals_without_an_embedding_are_cached_by_question_text():
+    cache = SemanticAnswerCache()
+    cache.store([], ["c1", "c2"], "HK$2,000", question="What is the annual fee?")
+    assert cache.lookup([], ["c2", "c1"], question="what is the  annual fee") == "HK$2,000"
+    assert cache.lookup([], ["c1", "c3"], question="What is the annual fee?") is None # Different context
+    assert cache.lookup([], ["c1", "c2"], question="What is the late charge?") is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_question_text_entries_expire_and_follow_index_rebuilds(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=10)
+    cache.ensure_index_version("v1")
+    cache.store([], ["c1"], "answer", question="annual fee")
+    now[0] += 11
+    assert cache.lookup([], ["c1"], question="annual fee") is None
+    cache.store([], ["c1"], "answer", question="annual fee")
+    cache.ensure_index_version("v2")
+    assert cache.lookup([], ["c1"], question="annual fee") is None
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmark import RecordedEmbeddings, load_recorded_embeddings
+
+
+def test_recorded_embeddings_replay_only_recorded_questions():
+    embeddings = RecordedEmbeddings({"What is the annual fee?": [0.1, 0.2]})
+    assert embeddings.embed_query("What is the annual fee?") == [0.1, 0.2]
+    with pytest.raises(KeyError, match="--record"):
+        embeddings.embed_query("Another question")
+    with pytest.raises(RuntimeError, match="--mode mock"):
+        embeddings.embed_documents(["a chunk"])
+
+
+def test_recorded_mode_without_recordings_explains_how_to_record(tmp_path):
+    with pytest.raises(FileNotFoundError, match="--record"):
+        load_recorded_embeddings(str(tmp_path))
@@ -0,0 +1,168 @@
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import build_index
+from build_index import exchange_directories, save_index_atomically, update_index_incrementally
+from index_store import load_vectorstore
+from index_types import index_vectors
+from lexical_index import LEXICAL_INDEX_FILENAME
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic vectors per text; records every text sent for embedding."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.vector(text)
+
+    @staticmethod
+    def vector(text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+
+def chunk(text, **metadata):
+    return Document(page_content=text, metadata={"source": "fees", **metadata})
+
+
+CHUNKS = [chunk("Annual fee HK$2,000", chunk_index=0), chunk("Late charge HK$300", chunk_index=1), chunk("Cash advance fee 3.5%", chunk_index=2)]
+
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbeddings()
+
+
+@pytest.fixture
+def db(embeddings):
+    db = FAISS.from_documents(list(CHUNKS), embeddings)
+    embeddings.embedded.clear()
+    return db
+
+
+def stored(db):
+    """{text: (docstore id, metadata, vector)} in FAISS id order."""
+    result = {}
+    for faiss_id, docstore_id in db.index_to_docstore_id.items():
+        doc = db.docstore.search(docstore_id)
+        result[doc.page_content] = (docstore_id, doc.metadata, db.index.reconstruct(faiss_id).tolist())
+    return result
+
+
+def test_unchanged_chunks_are_left_alone(db, embeddings):
+    before = stored(db)
+    assert update_index_incrementally(db, list(CHUNKS)) == (0, 0)
+    assert embeddings.embedded == []
+    assert stored(db) == before
+
+
+def test_added_chunk_is_the_only_one_embedded(db, embeddings):
+    before = stored(db)
+    new = chunk("Overlimit fee waived", chunk_index=3)
+    assert update_index_incrementally(db, list(CHUNKS) + [new]) == (1, 0)
+    assert embeddings.embedded == ["Overlimit fee waived"]
+    after = stored(db)
+    assert {text: after[text][0] for text in before} == {text: entry[0] for text, entry in before.items()} # Ids kept
+    assert after["Overlimit fee waived"][2] == CountingEmbeddings.vector("Overlimit fee waived")
+
+
+def test_edited_chunk_replaces_its_old_version(db, embeddings):
+    edited = chunk("Late charge HK$350", chunk_index=1)
+    assert update_index_incrementally(db, [CHUNKS[0], edited, CHUNKS[2]]) == (1, 1)
+    assert embeddings.embedded == ["Late charge HK$350"]
+    after = stored(db)
+    assert set(after) == {"Annual fee HK$2,000", "Late charge HK$350", "Cash advance fee 3.5%"}
+    assert db.index.ntotal == len(db.index_to_docstore_id) == 3
+
+
+def test_deleted_chunk_is_removed_without_embedding(db, embeddings):
+    before = stored(db)
+    assert update_index_incrementally(db, [CHUNKS[0], CHUNKS[2]]) == (0, 1)
+    assert embeddings.embedded == []
+    after = stored(db)
+    assert set(after) == {"Annual fee HK$2,000", "Cash advance fee 3.5%"}
+    assert after["Cash advance fee 3.5%"] == before["Cash advance fee 3.5%"]
+    assert db.index.ntotal == 2
+
+
+def test_metadata_only_change_reuses_the_stored_vector(db, embeddings):
+    before = stored(db)
+    relabeled = [chunk(doc.page_content, **doc.metadata, section="fees") for doc in CHUNKS]
+    assert update_index_incrementally(db, relabeled) == (3, 3)
+    assert embeddings.embedded == []
+    after = stored(db)
+    for text, (_, metadata, vector) in after.items():
+        assert metadata["section"] == "fees"
+        assert vector == before[text][2]
+
+
+def test_duplicate_texts_are_counted_separately(db, embeddings):
+    assert update_index_incrementally(db, list(CHUNKS) + [CHUNKS[1]]) == (1, 0)
+    assert embeddings.embedded == ["Late charge HK$300"]
+    assert db.index.ntotal == 4
+    assert update_index_incrementally(db, list(CHUNKS)) == (0, 1)
+    assert db.index.ntotal == 3
+
+
+def save(db, folder_path):
+    save_index_atomically(db, index_vectors(db.index), folder_path)
+
+
+def test_saved_index_reloads_with_the_same_chunks(db, embeddings, tmp_path):
+    folder_path = str(tmp_path / "faiss_index")
+    save(db, folder_path)
+    loaded = load_vectorstore(folder_path, embeddings, verify=True)
+    assert stored(loaded) == stored(db)
+    assert os.path.exists(os.path.join(folder_path, LEXICAL_INDEX_FILENAME))
+
+
+def test_resave_swaps_the_directory_and_leaves_no_temporary_files(db, embeddings, tmp_path):
+    folder_path = str(tmp_path / "faiss_index")
+    save(db, folder_path)
+    update_index_incrementally(db, [CHUNKS[0]])
+    save(db, folder_path)
+    assert os.listdir(tmp_path) == ["faiss_index"]
+    assert set(stored(load_vectorstore(folder_path, embeddings))) == {"Annual fee HK$2,000"}
+
+
+def test_resave_without_an_atomic_exchange_falls_back_to_renames(db, embeddings, tmp_path, monkeypatch):
+    monkeypatch.setattr(build_index, "exchange_directories", lambda path_a, path_b: False)
+    folder_path = str(tmp_path / "faiss_index")
+    save(db, folder_path)
+    update_index_incrementally(db, [CHUNKS[1]])
+    save(db, folder_path)
+    assert os.listdir(tmp_path) == ["faiss_index"]
+    assert set(stored(load_vectorstore(folder_path, embeddings))) == {"Late charge HK$300"}
+
+
+def test_failed_save_keeps_the_previous_index(db, embeddings, tmp_path, monkeypatch):
+    folder_path = str(tmp_path / "faiss_index")
+    save(db, folder_path)
+
+    def broken_save(folder_path, vectorstore, vectors):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(build_index, "save_store", broken_save)
+    with pytest.raises(OSError):
+        save(db, folder_path)
+    assert os.listdir(tmp_path) == ["faiss_index"]
+    assert stored(load_vectorstore(folder_path, embeddings)) == stored(db)
+
+
+def test_exchange_directories_swaps_contents(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "new").write_text("new")
+    if not exchange_directories(str(tmp_path / "a"), str(tmp_path / "b")):
+        pytest.skip("renameat2(RENAME_EXCHANGE) is not available here")
+    assert os.listdir(tmp_path / "b") == ["new"]
+    assert os.listdir(tmp_path / "a") == []
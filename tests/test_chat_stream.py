@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from http_client import AsyncPooledTransport
+from rag_pipeline import AsyncUniversityChat
+
+MESSAGES = [{"role": "user", "content": "What is the annual fee?"}]
+
+
+def sse_event(content=None, **event):
+    if content is not None:
+        event = {"choices": [{"index": 0, "delta": {"content": content}}]}
+    return f"data: {json.dumps(event)}\n\n".encode()
+
+
+def chat_with(handler):
+    transport = AsyncPooledTransport()
+    transport.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncUniversityChat("test", "http://localhost", "gpt-4-o-mini", "test", transport)
+
+
+def streaming_handler(chunks, status=200):
+    async def body():
+        for chunk in chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def handler(request):
+        return httpx.Response(status, headers={"Content-Type": "text/event-stream"}, content=body())
+    return handler
+
+
+def collect(chat):
+    async def run():
+        return [delta async for delta in chat.astream(MESSAGES)]
+    return asyncio.run(run())
+
+
+def test_stream_yields_deltas_until_done():
+    chat = chat_with(streaming_handler([
+        sse_event(choices=[], prompt_filter_results=[]), # First event carries no choices
+        sse_event("The annual fee "),
+        b": keep-alive comment\n\n",
+        sse_event("is HK$2,000."),
+        b"data: [DONE]\n\n",
+        sse_event("never read"),
+    ]))
+    assert collect(chat) == ["The annual fee ", "is HK$2,000."]
+
+
+def test_event_split_across_network_chunks_is_reassembled():
+    event = sse_event("HK$2,000")
+    chat = chat_with(streaming_handler([event[:15], event[15:30], event[30:], b"data: [DONE]\n\n"]))
+    assert collect(chat) == ["HK$2,000"]
+
+
+def test_non_streaming_json_body_is_used_as_the_answer():
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, json={"choices": [{"message": {"content": "HK$2,000"}}]})
+    assert collect(chat_with(handler)) == ["HK$2,000"]
+
+
+def test_json_body_without_an_answer_is_an_error():
+    chat = chat_with(lambda request: httpx.Response(200, json={"choices": []}))
+    with pytest.raises(ValueError, match="invalid response"):
+        collect(chat)
+
+
+def test_http_error_status_raises_with_the_body_available():
+    chat = chat_with(lambda request: httpx.Response(429, json={"error": {"message": "Rate limit exceeded."}}))
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        collect(chat)
+    assert error.value.response.status_code == 429
+    assert "Rate limit" in error.value.response.text
+
+
+def test_error_event_in_the_middle_of_a_stream_raises():
+    chat = chat_with(streaming_handler([
+        sse_event("The annual fee "),
+        sse_event(error={"code": "500", "message": "Injected server error."}),
+        sse_event("never read"),
+    ]))
+    with pytest.raises(ValueError, match="Injected server error"):
+        collect(chat)
+
+
+def test_connection_lost_in_the_middle_of_a_stream_raises():
+    chat = chat_with(streaming_handler([sse_event("The annual fee "), httpx.ReadError("connection reset")]))
+    with pytest.raises(httpx.ReadError):
+        collect(chat)
+
+
+def test_stream_without_content_is_an_error():
+    chat = chat_with(streaming_handler([b"data: [DONE]\n\n"]))
+    with pytest.raises(ValueError, match="incomplete response"):
+        collect(chat)
@@ -0,0 +1,85 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from chunk_selection import ChunkSelector
+from context_builder import TOKEN_COUNT_KEY
+
+
+def selector_for(vectors_by_id, **kwargs):
+    ids = list(vectors_by_id)
+    vectors = np.array([vectors_by_id[doc_id] for doc_id in ids], dtype=np.float32)
+    return ChunkSelector(vectors, dict(enumerate(ids)), **kwargs)
+
+
+def doc(doc_id, text="", **metadata):
+    return Document(id=doc_id, page_content=text or doc_id, metadata=metadata)
+
+
+def test_near_duplicate_of_a_better_ranked_chunk_is_dropped():
+    selector = selector_for({"a": [1.0, 0.0], "a_copy": [0.99, 0.01], "b": [0.0, 1.0]})
+    documents, scores = selector.select([doc("a"), doc("a_copy"), doc("b")], [3, 2, 1])
+    assert [d.id for d in documents] == ["a", "b"]
+    assert scores == [3, 1]
+
+
+def test_similar_but_distinct_chunks_are_kept():
+    selector = selector_for({"a": [1.0, 0.0], "b": [0.95, 0.312]}) # Cosine ~0.95, under the 0.97 threshold
+    documents, _ = selector.select([doc("a"), doc("b")], [2, 1])
+    assert [d.id for d in documents] == ["a", "b"]
+
+
+def test_mmr_moves_a_distinct_chunk_ahead_of_a_similar_one():
+    selector = selector_for({"a": [1.0, 0.0, 0.0], "similar": [0.9, 0.436, 0.0], "other": [0.0, 0.0, 1.0]})
+    documents, scores = selector.select([doc("a"), doc("similar"), doc("other")], [3, 2, 1])
+    assert [d.id for d in documents] == ["a", "other", "similar"]
+    assert scores == [3, 1, 2] # Scores travel with their chunks
+
+    keep_order = selector_for({"a": [1.0, 0.0, 0.0], "similar": [0.9, 0.436, 0.0], "other": [0.0, 0.0, 1.0]}, mmr_lambda=1.0)
+    assert [d.id for d in keep_order.select([doc("a"), doc("similar"), doc("other")], [3, 2, 1])[0]] == ["a", "similar", "other"]
+
+
+def test_chunks_without_a_stored_vector_are_never_dropped():
+    selector = selector_for({"a": [1.0, 0.0]})
+    documents, _ = selector.select([doc("a"), doc("unknown"), doc("unknown2")], [3, 2, 1])
+    assert {d.id for d in documents} == {"a", "unknown", "unknown2"}
+
+
+def test_single_chunk_passes_through():
+    selector = selector_for({"a": [1.0, 0.0]})
+    assert selector.select([doc("a")], [1.0]) == ([doc("a")], [1.0])
+
+
+def test_merge_adjacent_keeps_the_shared_overlap_once():
+    first = doc("c0", "Annual fee HK$2,000. Waived", source="fees", section="fees", chunk_index=0, start_index=0)
+    second = doc("c1", "Waived for the first year.", source="fees", section="fees", chunk_index=1, start_index=21)
+    documents, _ = ChunkSelector.merge_adjacent([first, second], [2, 1])
+    assert len(documents) == 1
+    assert documents[0].page_content == "Annual fee HK$2,000. Waived for the first year."
+    assert documents[0].metadata["merged_chunk_indexes"] == [0, 1]
+    assert documents[0].metadata[TOKEN_COUNT_KEY] > 0
+
+
+def test_merge_adjacent_restores_the_stripped_paragraph_break():
+    first = doc("c0", "First paragraph.", source="s", chunk_index=0, start_index=0)
+    second = doc("c1", "Second paragraph.", source="s", chunk_index=1, start_index=18)
+    documents, _ = ChunkSelector.merge_adjacent([first, second], [2, 1])
+    assert documents[0].page_content == "First paragraph.\n\nSecond paragraph."
+
+
+def test_merged_run_takes_the_best_rank_and_its_score():
+    later = doc("c1", "B", source="s", chunk_index=1, start_index=3)
+    other = doc("x", "X", source="other", chunk_index=0, start_index=0)
+    earlier = doc("c0", "A", source="s", chunk_index=0, start_index=0)
+    documents, scores = ChunkSelector.merge_adjacent([later, other, earlier], [0.9, 0.8, 0.7])
+    assert [d.page_content for d in documents] == ["A\n\nB", "X"] # Source order inside the run
+    assert scores == [0.9, 0.8]
+
+
+def test_merge_adjacent_leaves_unrelated_chunks_alone():
+    documents = [
+        doc("a0", source="a", chunk_index=0, start_index=0),
+        doc("b1", source="b", chunk_index=1, start_index=0), # Another source
+        doc("a2", source="a", chunk_index=2, start_index=0), # Not consecutive with a0
+        doc("plain"), # No chunk position metadata
+    ]
+    assert ChunkSelector.merge_adjacent(documents, [4, 3, 2, 1]) == (documents, [4, 3, 2, 1])
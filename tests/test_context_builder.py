@@ -0,0 +1,111 @@
+import pytest
+from langchain_core.documents import Document
+
+import token_batching
+from context_builder import (
+    CONTEXT_SEPARATOR, TOKEN_COUNT_ESTIMATED_KEY, TOKEN_COUNT_KEY, chunk_tokens, count_chunk_tokens, count_context_tokens,
+    join_context, select_within_budget, store_token_count
+)
+
+SEPARATOR_TOKENS = count_chunk_tokens(CONTEXT_SEPARATOR)
+
+
+def chunk(name, tokens):
+    return Document(id=name, page_content=f"{name} text", metadata={TOKEN_COUNT_KEY: tokens})
+
+
+def test_chunk_tokens_prefers_the_stored_count():
+    assert chunk_tokens(chunk("a", 42)) == 42
+    unlabeled = Document(page_content="An index built before token counts were stored.")
+    assert chunk_tokens(unlabeled) == count_chunk_tokens(unlabeled.page_content) > 0
+
+
+def test_budget_keeps_chunks_in_rank_order_until_full():
+    docs = [chunk("a", 100), chunk("b", 100), chunk("c", 100)]
+    selected, scores, total = select_within_budget(docs, [0.9, 0.8, 0.7], max_tokens=200 + SEPARATOR_TOKENS)
+    assert [doc.id for doc in selected] == ["a", "b"]
+    assert scores == [0.9, 0.8]
+    assert total == 200 + SEPARATOR_TOKENS
+
+
+def test_chunk_that_does_not_fit_is_skipped_for_smaller_ones():
+    docs = [chunk("a", 100), chunk("big", 500), chunk("small", 50)]
+    selected, scores, _ = select_within_budget(docs, [3, 2, 1], max_tokens=200)
+    assert [doc.id for doc in selected] == ["a", "small"]
+    assert scores == [3, 1]
+
+
+def test_top_chunk_is_kept_even_when_larger_than_the_budget():
+    docs = [chunk("huge", 900), chunk("b", 10)]
+    selected, _, total = select_within_budget(docs, [1.0, 0.5], max_tokens=100)
+    assert [doc.id for doc in selected] == ["huge"]
+    assert total == 900
+
+
+def test_no_budget_keeps_every_chunk():
+    docs = [chunk("a", 1000), chunk("b", 1000)]
+    selected, _, total = select_within_budget(docs, [1.0, 0.5], max_tokens=None)
+    assert len(selected) == 2
+    assert total == count_context_tokens(docs)
+
+
+def test_empty_retrieval():
+    assert select_within_budget([], [], max_tokens=100) == ([], [], 0)
+    assert count_context_tokens([]) == 0
+
+
+def test_context_tokens_include_separators():
+    docs = [chunk("a", 10), chunk("b", 20), chunk("c", 30)]
+    assert count_context_tokens(docs) == 60 + 2 * SEPARATOR_TOKENS
+    assert join_context(docs) == CONTEXT_SEPARATOR.join(["a text", "b text", "c text"])
+
+
+class WordEncoding:
+    """Stands in for a tiktoken encoding: one token per word."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+@pytest.fixture
+def tiktoken_available(monkeypatch):
+    monkeypatch.setattr(token_batching, "_get_encoding", lambda model_name: WordEncoding())
+
+
+@pytest.fixture
+def tiktoken_unavailable(monkeypatch):
+    monkeypatch.setattr(token_batching, "_get_encoding", lambda model_name: None)
+
+
+def test_estimated_count_is_flagged(tiktoken_unavailable):
+    metadata = {}
+    store_token_count(metadata, "Annual fee HK$2,000")
+    assert metadata == {TOKEN_COUNT_KEY: len("Annual fee HK$2,000") // 3 + 1, TOKEN_COUNT_ESTIMATED_KEY: True}
+
+
+def test_exact_count_clears_the_flag(tiktoken_available):
+    metadata = {TOKEN_COUNT_KEY: 7, TOKEN_COUNT_ESTIMATED_KEY: True} # e.g. copied from a merged chunk
+    store_token_count(metadata, "Annual fee HK$2,000")
+    assert metadata == {TOKEN_COUNT_KEY: 3}
+
+
+def test_estimated_count_is_recounted_once_tiktoken_works(tiktoken_available):
+    estimated = Document(page_content="Annual fee HK$2,000", metadata={TOKEN_COUNT_KEY: 7, TOKEN_COUNT_ESTIMATED_KEY: True})
+    assert chunk_tokens(estimated) == 3
+    assert chunk_tokens(chunk("exact", 42)) == 42 # Exact counts are still trusted
+
+
+def test_estimated_count_is_used_while_tiktoken_is_unavailable(tiktoken_unavailable):
+    estimated = Document(page_content="Annual fee HK$2,000", metadata={TOKEN_COUNT_KEY: 7, TOKEN_COUNT_ESTIMATED_KEY: True})
+    assert chunk_tokens(estimated) == 7
+
+
+def test_budget_uses_recounted_tokens(tiktoken_available):
+    docs = [
+        Document(id="a", page_content="one two", metadata={TOKEN_COUNT_KEY: 1}),
+        Document(id="big", page_content="a b c d e f g h", metadata={TOKEN_COUNT_KEY: 1, TOKEN_COUNT_ESTIMATED_KEY: True}),
+        Document(id="small", page_content="x", metadata={TOKEN_COUNT_KEY: 1, TOKEN_COUNT_ESTIMATED_KEY: True}),
+    ]
+    selected, _, total = select_within_budget(docs, [3, 2, 1], max_tokens=5)
+    assert [doc.id for doc in selected] == ["a", "small"]
+    assert total == 1 + len(CONTEXT_SEPARATOR.split()) + 1
@@ -0,0 +1,72 @@
+import pytest
+
+from embedding_cache import EmbeddingCache
+from university_embeddings import UniversityEmbeddings
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "embeddings.sqlite3")
+
+
+def open_cache(path, model="text-embedding-3-large", dimensions=None):
+    return EmbeddingCache(path, model_name=model, api_version="2024-05-01-preview", dimensions=dimensions)
+
+
+def test_get_many_returns_hits_and_none_for_misses(cache_path):
+    cache = open_cache(cache_path)
+    cache.put_many(["annual fee", "asia miles"], [[0.5, 0.25], [1.0, -1.0]])
+    assert cache.get_many(["asia miles", "unknown", "annual fee", "asia miles"]) == [
+        [1.0, -1.0], None, [0.5, 0.25], [1.0, -1.0]
+    ]
+    cache.close()
+
+
+def test_entries_survive_reopening(cache_path):
+    cache = open_cache(cache_path)
+    cache.put_many(["annual fee"], [[0.5, 0.25]])
+    cache.close()
+    assert open_cache(cache_path).get_many(["annual fee"]) == [[0.5, 0.25]]
+
+
+def test_namespaces_are_separated_by_model_and_dimensions(cache_path):
+    native = open_cache(cache_path)
+    native.put_many(["annual fee"], [[0.5, 0.25]])
+    assert open_cache(cache_path, dimensions=1024).get_many(["annual fee"]) == [None]
+    assert open_cache(cache_path, model="text-embedding-3-small").get_many(["annual fee"]) == [None]
+    assert open_cache(cache_path).get_many(["annual fee"]) == [[0.5, 0.25]]
+
+
+def test_put_many_overwrites_an_existing_entry(cache_path):
+    cache = open_cache(cache_path)
+    cache.put_many(["annual fee"], [[0.5, 0.25]])
+    cache.put_many(["annual fee"], [[0.75, 0.0]])
+    assert cache.get_many(["annual fee"]) == [[0.75, 0.0]]
+
+
+def test_get_many_handles_more_texts_than_one_sqlite_query(cache_path):
+    cache = open_cache(cache_path)
+    texts = [f"chunk {i}" for i in range(1200)]
+    cache.put_many(texts, [[float(i)] for i in range(1200)])
+    assert cache.get_many(texts) == [[float(i)] for i in range(1200)]
+
+
+def test_embed_documents_only_calls_the_api_for_uncached_texts(cache_path):
+    embeddings = UniversityEmbeddings(
+        api_key="test",
+        base_url="http://localhost",
+        model_name="text-embedding-3-large",
+        api_version="2024-05-01-preview",
+        embed_batch_size=8,
+        embedding_cache=open_cache(cache_path)
+    )
+    sent = []
+
+    def fake_post_batch(batch):
+        sent.extend(batch)
+        return [[float(len(text))] for text in batch]
+
+    embeddings._post_batch = fake_post_batch
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0], [2.0]]
+    assert embeddings.embed_documents(["bb", "ccc", "a"]) == [[2.0], [3.0], [1.0]]
+    assert sent == ["a", "bb", "ccc"] # Second call only sent the new text
@@ -0,0 +1,135 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from engine import create_chunk_selector
+from index_store import VECTORS_FILENAME, IndexStore, ReadOnlyDocstoreError, faiss_mmap_flags, load_vectorstore, save_store
+from index_types import build_index, index_vectors
+
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    db = FAISS.from_documents(
+        [Document(page_content="annual fee", metadata={"section": "fees"}), Document(page_content="asia miles", metadata={})],
+        FixedEmbeddings()
+    )
+    save_store(str(tmp_path), db, index_vectors(db.index))
+    return str(tmp_path)
+
+
+def test_serving_docstore_rejects_writes(store_path):
+    vectorstore = load_vectorstore(store_path, FixedEmbeddings())
+    first_id = vectorstore.index_to_docstore_id[0]
+    with pytest.raises(ReadOnlyDocstoreError):
+        vectorstore.docstore.add({"new": Document(page_content="new")})
+    with pytest.raises(PermissionError): # Callers may catch the builtin
+        vectorstore.docstore.delete([first_id])
+    assert vectorstore.docstore.search(first_id).page_content == "annual fee"
+
+
+def test_mutable_store_accepts_writes(store_path):
+    vectorstore = load_vectorstore(store_path, FixedEmbeddings(), mutable=True)
+    vectorstore.delete([vectorstore.index_to_docstore_id[0]])
+    assert vectorstore.index.ntotal == 1
+
+
+def test_loading_warns_about_chunks_without_metadata(store_path, caplog):
+    load_vectorstore(store_path, FixedEmbeddings())
+    assert "1 of 2 chunks" in caplog.text
+
+
+def saved_chunks(vectorstore):
+    """[(docstore id, text, metadata)] in FAISS id order."""
+    chunks = []
+    for faiss_id in range(vectorstore.index.ntotal):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[faiss_id])
+        chunks.append((vectorstore.index_to_docstore_id[faiss_id], doc.page_content, doc.metadata))
+    return chunks
+
+
+def search(vectorstore, query):
+    return [(doc.id, score) for doc, score in vectorstore.similarity_search_with_score(query, k=3)]
+
+
+@pytest.fixture
+def original():
+    return FAISS.from_documents(
+        [
+            Document(page_content="Annual fee HK$2,000", metadata={"source": "fees", "section": "fees", "chunk_index": 0}),
+            Document(page_content="年費豁免 for the first year", metadata={"source": "fees", "chunk_index": 1}), # Multi-byte UTF-8
+            Document(page_content="", metadata={"source": "empty"}),
+            Document(page_content="Asia Miles conversion", metadata={"source": "miles", "token_count": 4}),
+        ],
+        FixedEmbeddings()
+    )
+
+
+@pytest.mark.parametrize("load_mode", ["memory", "mmap"])
+def test_saved_store_round_trips(original, tmp_path, load_mode):
+    save_store(str(tmp_path), original, index_vectors(original.index))
+    loaded = load_vectorstore(str(tmp_path), FixedEmbeddings(), verify=True, load_mode=load_mode)
+    assert saved_chunks(loaded) == saved_chunks(original)
+    assert loaded.index_to_docstore_id == original.index_to_docstore_id
+    for query in ["annual fee", "Asia Miles conversion", ""]:
+        assert search(loaded, query) == search(original, query)
+    mutable = load_vectorstore(str(tmp_path), FixedEmbeddings(), mutable=True)
+    assert saved_chunks(mutable) == saved_chunks(original)
+    assert search(mutable, "annual fee") == search(original, "annual fee")
+
+
+def test_flat_store_keeps_its_vectors_only_in_the_faiss_index(original, tmp_path):
+    save_store(str(tmp_path), original, index_vectors(original.index))
+    assert not os.path.exists(tmp_path / VECTORS_FILENAME)
+    np.testing.assert_array_equal(IndexStore(str(tmp_path)).vectors, index_vectors(original.index))
+
+
+def test_approximate_store_saves_its_exact_vectors(original, tmp_path):
+    vectors = index_vectors(original.index)
+    original.index = build_index(vectors, "hnsw")
+    save_store(str(tmp_path), original, vectors)
+    np.testing.assert_array_equal(np.fromfile(tmp_path / VECTORS_FILENAME, dtype="<f4").reshape(vectors.shape), vectors)
+    np.testing.assert_array_equal(IndexStore(str(tmp_path)).vectors, vectors)
+
+
+def test_chunk_selector_reuses_the_loaded_store(store_path, caplog):
+    vectorstore = load_vectorstore(store_path, FixedEmbeddings(), load_mode="mmap")
+    selector = create_chunk_selector(vectorstore, store_path)
+    assert caplog.text.count("have no metadata") == 1
+    np.testing.assert_array_equal(selector.vectors, index_vectors(vectorstore.index))
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+def test_mmap_load_matches_memory_load(original, tmp_path, index_type):
+    vectors = index_vectors(original.index)
+    original.index = build_index(vectors, index_type, {"nlist": 2, "nprobe": 2})
+    save_store(str(tmp_path), original, vectors)
+    in_memory = load_vectorstore(str(tmp_path), FixedEmbeddings(), load_mode="memory")
+    mapped = load_vectorstore(str(tmp_path), FixedEmbeddings(), load_mode="mmap")
+    for query in ["annual fee", "Asia Miles conversion", "x" * 40]:
+        assert search(mapped, query) == search(in_memory, query)
+
+
+def test_mmap_load_falls_back_to_memory_without_the_faiss_flag(store_path, monkeypatch, caplog):
+    monkeypatch.delattr(faiss, "IO_FLAG_MMAP_IFC")
+    assert faiss_mmap_flags("flat") == 0
+    vectorstore = load_vectorstore(store_path, FixedEmbeddings(), load_mode="mmap")
+    assert "cannot memory-map" in caplog.text
+    assert search(vectorstore, "annual fee") == search(load_vectorstore(store_path, FixedEmbeddings()), "annual fee")
+
+
+def test_unknown_load_mode_is_rejected(store_path):
+    with pytest.raises(ValueError, match="Unknown load mode"):
+        load_vectorstore(store_path, FixedEmbeddings(), load_mode="mmapped")
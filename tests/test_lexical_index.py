@@ -0,0 +1,98 @@
+import pytest
+
+from lexical_index import RRF_K, FastPathGate, LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex.build([
+        ("fees", "The annual fee is HK$2,000 for the Smart Credit Card."),
+        ("miles", "Earn Asia Miles on every HK$6 spent with the Cathay card."),
+        ("cjk", "信用卡年費豁免"),
+        ("rate", "The finance charge APR is 35.57% per annum."),
+    ])
+
+
+def test_tokenize_latin_words_numbers_and_percentages():
+    assert tokenize("Annual Fee: HK$2,000") == ["annual", "fee", "hk", "2000"]
+    assert tokenize("APR 2.5% p.a.") == ["apr", "2.5%", "p.a"]
+    assert tokenize("cardholder's limit") == ["cardholder's", "limit"]
+
+
+def test_tokenize_cjk_runs_yield_characters_and_bigrams():
+    assert tokenize("年費") == ["年", "費", "年費"]
+    assert tokenize("信用卡") == ["信", "用", "卡", "信用", "用卡"]
+
+
+def test_tokenize_mixed_and_full_width_text():
+    assert tokenize("Smart卡年費") == ["smart", "卡", "年", "費", "卡年", "年費"]
+    assert tokenize("ＨＫ＄５５０") == ["hk", "550"] # NFKC folds full-width forms
+
+
+def test_tokenize_empty_and_punctuation_only():
+    assert tokenize("") == []
+    assert tokenize(" ?!, ") == []
+
+
+def test_search_ranks_the_chunk_with_the_query_terms_first(index):
+    hits = index.search("annual fee HK$2,000", k=2)
+    assert hits[0][0] == "fees"
+    assert all(score > 0 for _, score in hits)
+
+
+def test_search_matches_chinese_questions_through_bigrams(index):
+    assert index.search("年費是多少", k=1)[0][0] == "cjk"
+
+
+def test_search_with_an_empty_or_unknown_query_returns_nothing(index):
+    assert index.search("") == []
+    assert index.search("zzzz qqqq") == []
+
+
+def test_search_honours_allowed_ids_and_k(index):
+    hits = index.search("hk card", k=10, allowed_ids={"miles"})
+    assert [doc_id for doc_id, _ in hits] == ["miles"]
+    assert len(index.search("the hk card", k=1)) == 1
+
+
+def test_saved_index_loads_with_the_same_results(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = LexicalIndex.load(str(tmp_path))
+    assert loaded.search("asia miles") == index.search("asia miles")
+    assert LexicalIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_match_quality_counts_unknown_terms_against_coverage(index):
+    top_score = index.search("asia miles", k=1)[0][1]
+    coverage, matched = index.match_quality("asia miles", top_score)
+    diluted, diluted_matched = index.match_quality("asia miles zzzz", top_score)
+    assert matched == 2 and diluted_matched == 2
+    assert 0 < diluted < coverage <= 1.0
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["d", "c", "e"]])
+    assert fused[0] == ("c", pytest.approx(1 / (RRF_K + 3) + 1 / (RRF_K + 2)))
+    assert {doc_id for doc_id, _ in fused} == {"a", "b", "c", "d", "e"}
+    assert dict(fused)["a"] == dict(fused)["d"] > dict(fused)["b"] # Top of one list each, then rank order
+
+
+def test_reciprocal_rank_fusion_with_empty_rankings():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], ["a"]]) == [("a", 1 / (RRF_K + 1))]
+
+
+def test_fast_path_gate_needs_every_threshold(index):
+    gate = FastPathGate(min_coverage=0.5, min_margin=0.1, min_matched_terms=2)
+    hits = index.search("asia miles cathay", k=10)
+    coverage, margin, matched = gate.measure(index, "asia miles cathay", hits)
+    assert matched == 3 and coverage >= 0.5 and margin >= 0.1
+    assert gate.decide(index, "asia miles cathay", hits)
+    assert not FastPathGate(min_coverage=0.5, min_margin=0.1, min_matched_terms=4).decide(index, "asia miles cathay", hits)
+    assert gate.stats() == {"taken": 1, "declined": 0, "take_rate": 1.0}
+
+
+def test_fast_path_gate_declines_without_hits(index):
+    gate = FastPathGate(min_coverage=0.0, min_margin=0.0, min_matched_terms=0)
+    assert gate.measure(index, "zzzz", []) == (0.0, 0.0, 0)
+    assert not gate.decide(index, "zzzz", [])
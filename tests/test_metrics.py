@@ -0,0 +1,123 @@
+import re
+
+import pytest
+
+import metrics
+from metrics import Histogram, MetricsRegistry, RequestTrace
+
+
+def histogram(*values, buckets=(10, 20, 30)):
+    result = Histogram(buckets)
+    for value in values:
+        result.observe(value)
+    return result
+
+
+def test_value_on_a_bucket_bound_counts_in_that_bucket():
+    assert histogram(10, 20, 20.001).cumulative() == [1, 2, 3, 3] # le is inclusive
+
+
+def test_quantile_interpolates_inside_a_bucket():
+    values = histogram(1, 2, 3, 4)
+    assert values.quantile(0.5) == 5.0 # Halfway through (0, 10]
+    assert values.quantile(0.0) == 0.0
+    assert values.quantile(1.0) == 10.0
+
+
+def test_quantile_at_a_bucket_edge_is_the_bound():
+    values = histogram(5, 5, 15, 15)
+    assert values.quantile(0.5) == 10.0 # Exactly the observations of the first bucket
+    assert values.quantile(0.75) == 15.0
+    assert histogram(5, 5, 25, 25).quantile(0.5) == 10.0 # An empty bucket in between does not move it
+
+
+def test_quantile_above_the_largest_bucket_is_the_largest_bound():
+    assert histogram(5, 100, 200).quantile(0.99) == 30
+
+
+def test_quantile_of_an_empty_histogram_is_unknown():
+    assert histogram().quantile(0.5) is None
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry(slos_ms={"faiss_search": 100, "chat_ttfb": 3000}, buckets=(10, 100))
+    for milliseconds in [5, 100, 250.5]:
+        registry.observe("faiss_search", milliseconds)
+    registry.observe("query_embedding", 12)
+    return registry
+
+
+def test_prometheus_exposition(registry):
+    name = "chatbot_stage_latency_milliseconds"
+    assert registry.to_prometheus().splitlines() == [
+        f"# HELP {name} Latency of each request stage in milliseconds.",
+        f"# TYPE {name} histogram",
+        f'{name}_bucket{{stage="faiss_search",le="10"}} 1',
+        f'{name}_bucket{{stage="faiss_search",le="100"}} 2',
+        f'{name}_bucket{{stage="faiss_search",le="+Inf"}} 3',
+        f'{name}_sum{{stage="faiss_search"}} 355.500',
+        f'{name}_count{{stage="faiss_search"}} 3',
+        f'{name}_bucket{{stage="query_embedding",le="10"}} 0',
+        f'{name}_bucket{{stage="query_embedding",le="100"}} 1',
+        f'{name}_bucket{{stage="query_embedding",le="+Inf"}} 1',
+        f'{name}_sum{{stage="query_embedding"}} 12.000',
+        f'{name}_count{{stage="query_embedding"}} 1',
+        "# HELP chatbot_slo_violations_total Spans slower than their latency SLO.",
+        "# TYPE chatbot_slo_violations_total counter",
+        'chatbot_slo_violations_total{stage="chat_ttfb"} 0',
+        'chatbot_slo_violations_total{stage="faiss_search"} 1', # 250.5 ms; 100 ms is within the SLO
+    ]
+
+
+def test_prometheus_samples_are_well_formed(registry):
+    sample = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*\{(?:[a-zA-Z_]\w*="[^"]*",?)+\} -?[0-9.]+$')
+    text = registry.to_prometheus()
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        assert line.startswith("# ") or sample.match(line), line
+
+
+def test_json_matches_the_histograms(registry):
+    stage = registry.to_json()["stages"]["faiss_search"]
+    assert stage["count"] == 3
+    assert stage["buckets"] == {"10": 1, "100": 2, "+Inf": 3}
+    assert stage["p50_ms"] == pytest.approx(55.0)
+    assert registry.to_json()["slo_violations"] == {"faiss_search": 1}
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, "_metrics", registry)
+    return registry
+
+
+def test_request_trace_adds_up_repeated_spans(fresh_metrics):
+    trace = RequestTrace()
+    trace.record("query_embedding", 40)
+    trace.record("query_embedding", 2.5)
+    with trace.span("faiss_search"):
+        pass
+    breakdown = trace.breakdown()
+    assert breakdown["query_embedding"] == 42.5
+    assert 0 <= breakdown["faiss_search"] < 100
+    assert fresh_metrics.histograms["query_embedding"].count == 2 # Every span is observed on its own
+
+
+def test_request_trace_span_is_recorded_when_the_stage_raises(fresh_metrics):
+    trace = RequestTrace()
+    with pytest.raises(ValueError):
+        with trace.span("chat_total"):
+            raise ValueError("stream broke")
+    assert "chat_total" in trace.breakdown()
+    assert fresh_metrics.histograms["chat_total"].count == 1
+
+
+def test_request_trace_finish_adds_the_total(fresh_metrics):
+    trace = RequestTrace()
+    trace.record("render", 1)
+    breakdown = trace.finish()
+    assert set(breakdown) == {"render", "request_total"}
+    assert breakdown["request_total"] >= 0
+    assert fresh_metrics.histograms["request_total"].count == 1
@@ -0,0 +1,68 @@
+import query_cache
+from query_cache import QueryEmbeddingCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_query_folds_case_whitespace_and_edge_punctuation():
+    assert normalize_query("  What is the ANNUAL fee?  ") == "what is the annual fee"
+    assert normalize_query("What's the fee of the card's holder!!") == "what's the fee of the card's holder"
+
+
+def test_normalize_query_keeps_inner_marks_and_percent():
+    assert normalize_query("Is the rate 2.5%?") == "is the rate 2.5%"
+
+
+def test_normalize_query_folds_full_width_characters():
+    assert normalize_query("年費是多少？") == normalize_query("年費是多少?")
+    assert normalize_query("ＡＢＣ") == "abc"
+
+
+def test_normalize_query_empty_and_punctuation_only():
+    assert normalize_query("") == ""
+    assert normalize_query(" ?! ") == ""
+
+
+def test_paraphrased_spelling_hits_the_same_entry():
+    cache = QueryEmbeddingCache()
+    cache.put("What is the annual fee?", [0.1, 0.2])
+    assert cache.get("what is the  ANNUAL fee") == [0.1, 0.2]
+    assert cache.stats()["hits"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    assert cache.get("a") == [1.0] # "b" is now the least recently used
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert cache.get("c") == [3.0]
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(query_cache.time, "monotonic", clock)
+    cache = QueryEmbeddingCache(ttl_seconds=60)
+    cache.put("annual fee", [1.0])
+    clock.now += 59
+    assert cache.contains("annual fee")
+    assert cache.get("annual fee") == [1.0]
+    clock.now += 2
+    assert not cache.contains("annual fee")
+    assert cache.get("annual fee") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_contains_does_not_count_as_a_lookup():
+    cache = QueryEmbeddingCache()
+    cache.put("a", [1.0])
+    assert cache.contains("a") and not cache.contains("b")
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
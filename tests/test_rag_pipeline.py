@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from answer_cache import SemanticAnswerCache
+from lexical_index import FastPathGate, LexicalIndex
+from rag_pipeline import AsyncRAGPipeline
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return [float(len(text)), 1.0]
+
+
+class CountingChat:
+    def __init__(self):
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        yield "The annual fee is HK$2,000."
+
+
+def make_pipeline(fast_path_gate):
+    embeddings = CountingEmbeddings()
+    vectorstore = FAISS.from_documents([
+        Document(page_content="The annual fee of the Smart Credit Card is HK$2,000."),
+        Document(page_content="Earn Asia Miles with the Cathay card."),
+    ], embeddings)
+    embeddings.queries = 0
+    return AsyncRAGPipeline(
+        embeddings=embeddings,
+        vectorstore=vectorstore,
+        chat_client=CountingChat(),
+        answer_cache=SemanticAnswerCache(),
+        lexical_index=LexicalIndex.from_vectorstore(vectorstore),
+        fast_path_gate=fast_path_gate,
+        k=2
+    )
+
+
+def test_repeated_fast_path_question_is_answered_from_the_cache():
+    pipeline = make_pipeline(FastPathGate(min_coverage=0.0, min_margin=0.0, min_matched_terms=1))
+
+    async def ask_twice():
+        return [await pipeline.aanswer("Smart Credit Card annual fee?") for _ in range(2)]
+
+    first, second = asyncio.run(ask_twice())
+    assert first.retrieval.fast_path and second.retrieval.fast_path
+    assert pipeline.embeddings.queries == 0 # Neither question was embedded
+    assert not first.from_cache and second.from_cache
+    assert second.answer == first.answer
+    assert pipeline.chat_client.calls == 1
+
+
+def test_repeated_vector_path_question_is_answered_from_the_cache():
+    pipeline = make_pipeline(None)
+
+    async def ask_twice():
+        return [await pipeline.aanswer("Smart Credit Card annual fee?") for _ in range(2)]
+
+    first, second = asyncio.run(ask_twice())
+    assert not first.retrieval.fast_path
+    assert second.from_cache
+    assert pipeline.chat_client.calls == 1
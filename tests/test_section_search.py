@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from index_store import has_store, load_vectorstore
+from lexical_index import LexicalIndex
+from query_router import route_query
+from section_search import SectionSearch
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "faiss_index")
+
+pytestmark = pytest.mark.skipif(not has_store(INDEX_PATH), reason="no committed index")
+
+
+class NoEmbeddings(Embeddings):
+    """The tests query with stored vectors, so nothing is ever embedded."""
+
+    def embed_documents(self, texts):
+        raise AssertionError("unexpected embedding call")
+
+    def embed_query(self, text):
+        raise AssertionError("unexpected embedding call")
+
+
+@pytest.fixture(scope="module")
+def vectorstore():
+    return load_vectorstore(INDEX_PATH, NoEmbeddings())
+
+
+@pytest.fixture(scope="module")
+def section_search(vectorstore):
+    return SectionSearch(vectorstore)
+
+
+def stored_chunk(vectorstore, section):
+    """(faiss id, document) of the first chunk of `section` in the committed index."""
+    for faiss_id, docstore_id in vectorstore.index_to_docstore_id.items():
+        doc = vectorstore.docstore.search(docstore_id)
+        if doc.metadata.get("section") == section:
+            return faiss_id, doc
+    pytest.fail(f"The committed index has no chunks in section '{section}'; rebuild it with build_index.py.")
+
+
+def test_committed_index_carries_section_metadata(section_search):
+    assert section_search.available
+    assert {"fees", "card_comparison", "promotions"} <= set(section_search.section_ids)
+
+
+def test_routed_vector_search_returns_only_chunks_of_the_routed_sections(vectorstore, section_search):
+    sections = route_query("What is the annual fee of the Smart card?")
+    assert sections is not None and set(sections) == {"fees", "card_comparison"}
+    assert section_search.covers(sections)
+
+    # Query with a promotions chunk's own vector: unfiltered, that chunk is the nearest hit
+    faiss_id, promotion = stored_chunk(vectorstore, "promotions")
+    query_vector = vectorstore.index.reconstruct(faiss_id).tolist()
+    assert vectorstore.similarity_search_with_score_by_vector(query_vector, k=1)[0][0].id == promotion.id
+
+    results = section_search.search(query_vector, k=10, sections=sections)
+    assert len(results) == 10
+    assert {doc.metadata["section"] for doc, _ in results} <= set(sections)
+
+
+def test_routed_lexical_search_returns_only_chunks_of_the_routed_sections(vectorstore, section_search):
+    lexical_index = LexicalIndex.load(INDEX_PATH)
+    assert lexical_index is not None
+    sections = route_query("Booking.com hotel promotion")
+    assert sections == ["promotions"]
+    allowed_ids = section_search.docstore_ids(sections)
+    hits = lexical_index.search("booking.com hotel annual fee", k=10, allowed_ids=allowed_ids)
+    assert hits
+    for docstore_id, _ in hits:
+        assert vectorstore.docstore.search(docstore_id).metadata["section"] == "promotions"
+
+
+@pytest.mark.xfail(strict=True, reason="13 chunks still span old source separators; rebuild with API access (build_index.py --dry-run lists them)")
+def test_every_committed_chunk_carries_source_and_section(vectorstore):
+    for docstore_id in vectorstore.index_to_docstore_id.values():
+        metadata = vectorstore.docstore.search(docstore_id).metadata
+        assert metadata.get("source") and metadata.get("section")
@@ -0,0 +1,86 @@
+from token_batching import AdaptiveBatchSizer, next_batch_end, pack_batches
+from university_embeddings import UniversityEmbeddings
+
+
+def test_pack_batches_respects_both_limits_and_keeps_order():
+    ranges = pack_batches([3, 3, 3, 3, 3], max_texts=2, max_tokens=100)
+    assert ranges == [(0, 2), (2, 4), (4, 5)]
+    ranges = pack_batches([40, 40, 40, 10], max_texts=10, max_tokens=90)
+    assert ranges == [(0, 2), (2, 4)]
+
+
+def test_pack_batches_empty_input():
+    assert pack_batches([], max_texts=4, max_tokens=100) == []
+
+
+def test_text_over_the_token_budget_forms_its_own_batch():
+    assert next_batch_end([500, 10], 0, max_texts=8, max_tokens=100) == 1
+    assert pack_batches([10, 500, 10], max_texts=8, max_tokens=100) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_token_limit_grows_past_its_starting_value_on_fast_token_bound_batches():
+    sizer = AdaptiveBatchSizer(max_texts=64, max_tokens=1000, ceiling_tokens=1600)
+    for _ in range(10):
+        _, max_tokens = sizer.limits()
+        sizer.record_success(n_texts=10, latency=0.1, n_tokens=max_tokens)
+    assert sizer.limits() == (64, 1600) # Grew, but never past the hard ceiling
+
+
+def test_token_limit_does_not_grow_when_batches_are_not_token_bound():
+    sizer = AdaptiveBatchSizer(max_texts=64, max_tokens=1000)
+    sizer.record_success(n_texts=10, latency=0.1, n_tokens=200)
+    assert sizer.limits() == (64, 1000)
+
+
+def test_limits_shrink_when_slow_and_recover_afterwards():
+    sizer = AdaptiveBatchSizer(max_texts=16, max_tokens=1000, target_latency=1.0)
+    sizer.record_success(n_texts=16, latency=5.0, n_tokens=1000)
+    assert sizer.limits() == (12, 750)
+    for _ in range(5):
+        max_texts, max_tokens = sizer.limits()
+        sizer.record_success(n_texts=max_texts, latency=0.1, n_tokens=max_tokens)
+    max_texts, max_tokens = sizer.limits()
+    assert max_texts > 16 and max_tokens > 1000
+
+
+def test_throttling_halves_the_text_limit():
+    sizer = AdaptiveBatchSizer(max_texts=16)
+    sizer.record_throttled()
+    sizer.record_throttled()
+    assert sizer.limits()[0] == 4
+    for _ in range(20):
+        sizer.record_throttled()
+    assert sizer.limits()[0] == 1
+
+
+def test_oversize_lowers_the_hard_ceiling():
+    sizer = AdaptiveBatchSizer(max_texts=64, max_tokens=8000)
+    sizer.record_oversize(n_texts=40, n_tokens=6000)
+    assert sizer.limits() == (20, 3000)
+    for _ in range(20):
+        _, max_tokens = sizer.limits()
+        sizer.record_success(n_texts=1, latency=0.1, n_tokens=max_tokens)
+    assert sizer.limits()[1] < 6000
+
+
+def test_concurrent_embedding_packs_batches_with_the_current_limits():
+    embeddings = UniversityEmbeddings(
+        api_key="test",
+        base_url="http://localhost",
+        model_name="text-embedding-3-large",
+        api_version="test",
+        embed_batch_size=2,
+        max_concurrency=2
+    )
+    batch_sizes = []
+
+    def fake_post_batch(batch):
+        batch_sizes.append(len(batch))
+        return [[float(text)] for text in batch]
+
+    embeddings._post_batch = fake_post_batch
+    texts = [str(i) for i in range(60)]
+    vectors = embeddings.embed_documents(texts)
+    assert vectors == [[float(i)] for i in range(60)] # Input order kept across concurrent batches
+    assert batch_sizes[0] == 2
+    assert max(batch_sizes) > 2 # Later batches picked up the limit grown by earlier ones
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+import requests
+
+import university_embeddings
+from university_embeddings import UniversityEmbeddings
+
+ENDPOINT = "http://localhost/deployments/text-embedding-3-large/embeddings?api-version=test"
+
+
+def embedding_body(n_texts):
+    return {"data": [{"index": i, "embedding": [float(i), 1.0]} for i in range(n_texts)]}
+
+
+def sync_response(status, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body or {}).encode()
+    response.headers.update(headers or {})
+    response.url = ENDPOINT
+    return response
+
+
+class FakeTransport:
+    def __init__(self, statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.calls = 0
+
+    def post(self, url, json, headers, timeout):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        n_texts = len(json["input"]) if isinstance(json["input"], list) else 1
+        return sync_response(status, embedding_body(n_texts), self.headers if status != 200 else None)
+
+
+class FakeAsyncTransport(FakeTransport):
+    async def post(self, url, json, headers, timeout):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        response_headers = self.headers if status != 200 else None
+        return httpx.Response(status, json=embedding_body(1), headers=response_headers, request=httpx.Request("POST", url))
+
+
+def make_embeddings(transport=None, async_transport=None, **kwargs):
+    return UniversityEmbeddings(
+        api_key="test",
+        base_url="http://localhost",
+        model_name="text-embedding-3-large",
+        api_version="test",
+        transport=transport,
+        async_transport=async_transport,
+        **kwargs
+    )
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(university_embeddings.time, "sleep", delays.append)
+
+    async def fake_async_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(university_embeddings.asyncio, "sleep", fake_async_sleep)
+    return delays
+
+
+def test_retry_delay_honours_retry_after_and_throttles():
+    embeddings = make_embeddings(transport=FakeTransport([]), embed_batch_size=8, retry_backoff=1.0)
+    assert embeddings._retry_delay(429, {"Retry-After": "5"}, attempt=0) == 5.0
+    assert embeddings.batch_sizer.limits()[0] == 4
+    assert embeddings._retry_delay(503, {}, attempt=1) == 2.0
+    assert embeddings._retry_delay(None, None, attempt=0) == 1.0 # Timeout or network error
+
+
+def test_retry_delay_gives_up_on_client_errors_and_after_max_retries():
+    embeddings = make_embeddings(transport=FakeTransport([]), max_retries=2)
+    assert embeddings._retry_delay(400, {}, attempt=0) is None
+    assert embeddings._retry_delay(413, {}, attempt=0) is None
+    assert embeddings._retry_delay(500, {}, attempt=2) is None
+
+
+def test_sync_batch_waits_for_retry_after(sleeps):
+    transport = FakeTransport([429, 200], headers={"Retry-After": "7"})
+    embeddings = make_embeddings(transport=transport)
+    assert embeddings._embed_batch(["a", "b"]) == [[0.0, 1.0], [1.0, 1.0]]
+    assert transport.calls == 2
+    assert sleeps == [7.0]
+
+
+def test_async_query_waits_for_retry_after(sleeps):
+    transport = FakeAsyncTransport([429, 200], headers={"Retry-After": "7"})
+    embeddings = make_embeddings(transport=FakeTransport([]), async_transport=transport)
+    assert asyncio.run(embeddings.aembed_query("annual fee")) == [0.0, 1.0]
+    assert transport.calls == 2
+    assert sleeps == [7.0]
+    assert embeddings.batch_sizer.limits()[0] == 1 # The 429 was recorded like on the sync path
+
+
+def test_async_query_fails_at_once_on_payload_too_large(sleeps):
+    transport = FakeAsyncTransport([413, 200])
+    embeddings = make_embeddings(transport=FakeTransport([]), async_transport=transport)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(embeddings.aembed_query("annual fee"))
+    assert transport.calls == 1
+    assert sleeps == []
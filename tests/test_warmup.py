@@ -0,0 +1,91 @@
+import threading
+
+import httpx
+import pytest
+
+import warmup
+from warmup import FAILED, READY, STARTING, WARMING, run_warmup, start_readiness_server
+
+
+@pytest.fixture(autouse=True)
+def fresh_readiness(monkeypatch):
+    monkeypatch.setattr(warmup, "_readiness", None)
+
+
+@pytest.fixture
+def probe():
+    server = start_readiness_server(host="127.0.0.1", port=0)
+    host, port = server.server_address
+    with httpx.Client(base_url=f"http://{host}:{port}") as client:
+        yield client
+    server.shutdown()
+    server.server_close()
+
+
+def ready(probe):
+    response = probe.get("/ready")
+    return response.status_code, response.json()
+
+
+def step(name, required=True, error=None):
+    def run():
+        if error:
+            raise error
+    return (name, run, required)
+
+
+def test_ready_goes_from_starting_through_warming_to_ready(probe):
+    status, body = ready(probe)
+    assert (status, body["state"], body["steps"]) == (503, STARTING, {})
+
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_step():
+        entered.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=run_warmup, args=([step("index"), ("knowledge_base", slow_step, True)],))
+    thread.start()
+    assert entered.wait(5)
+    status, body = ready(probe)
+    assert (status, body["state"]) == (503, WARMING)
+    assert body["steps"]["index"]["ok"] and "knowledge_base" not in body["steps"]
+
+    release.set()
+    thread.join(5)
+    status, body = ready(probe)
+    assert (status, body["state"]) == (200, READY)
+    assert set(body["steps"]) == {"index", "knowledge_base"}
+    assert body["warmup_seconds"] is not None
+
+
+def test_failed_optional_step_still_ends_ready(probe):
+    assert run_warmup([step("knowledge_base"), step("connections", required=False, error=OSError("refused"))])
+    status, body = ready(probe)
+    assert (status, body["state"]) == (200, READY)
+    assert body["steps"]["connections"]["error"] == "OSError: refused"
+    assert body["steps"]["knowledge_base"]["ok"]
+
+
+def test_failed_required_step_stops_the_warmup(probe):
+    ran = []
+    steps = [step("knowledge_base", error=RuntimeError("index missing")), ("connections", lambda: ran.append(True), False)]
+    assert not run_warmup(steps)
+    status, body = ready(probe)
+    assert (status, body["state"]) == (503, FAILED)
+    assert body["steps"]["knowledge_base"]["error"] == "RuntimeError: index missing"
+    assert ran == [] # Later steps depend on the failed one
+
+
+def test_missing_api_key_fails_readiness(probe, monkeypatch):
+    import app_resources
+    monkeypatch.setattr(app_resources, "university_api_key", None)
+    assert not app_resources.warm_up()
+    status, body = ready(probe)
+    assert (status, body["state"]) == (503, FAILED)
+    assert "university_api_key" in body["steps"]["api_key"]["error"]
+
+
+def test_live_and_unknown_paths(probe):
+    assert probe.get("/live").json() == {"state": "alive"}
+    assert probe.get("/nope").status_code == 404
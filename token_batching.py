@@ -0,0 +1,118 @@
+# token_batching.py
+import logging
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Embedding API Limits (text-embedding-3-*) ---
+DEFAULT_MAX_BATCH_TOKENS = 8000 # Conservative starting per-request token budget for the embedding endpoint
+DEFAULT_MAX_BATCH_TEXTS = 2048 # Max inputs accepted in a single embedding request
+MODEL_MAX_BATCH_TOKENS = 300_000 # Hard per-request token limit of the embedding API; the tuned budget never exceeds it
+FALLBACK_CHARS_PER_TOKEN = 3 # Pessimistic estimate used when the tiktoken encoding is unavailable
+TOKEN_BOUND_FILL = 0.9 # A batch this full of its token budget was limited by tokens, not by text count
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e: # tiktoken downloads its BPE files on first use, which can fail offline
+        logger.warning(f"tiktoken encoding unavailable for '{model_name}' ({e}); estimating tokens from length.")
+        return None
+
+def count_tokens(text: str, model_name: str = "text-embedding-3-large") -> int:
+    """Counts tokens with tiktoken, falling back to a length-based estimate."""
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return len(text) // FALLBACK_CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def tokens_are_estimated(model_name: str = "text-embedding-3-large") -> bool:
+    """True when count_tokens falls back to the length-based estimate for `model_name`."""
+    return _get_encoding(model_name) is None
+
+
+def next_batch_end(token_counts: List[int], start: int, max_texts: int, max_tokens: int) -> int:
+    """Returns the end index of the batch starting at `start` that fits both limits.
+
+    A single text over the token budget still forms its own batch.
+    """
+    end = start
+    batch_tokens = 0
+    while end < len(token_counts) and end - start < max_texts:
+        if end > start and batch_tokens + token_counts[end] > max_tokens:
+            break
+        batch_tokens += token_counts[end]
+        end += 1
+    return end
+
+def pack_batches(token_counts: List[int], max_texts: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Greedily packs consecutive texts into (start, end) ranges, preserving input order."""
+    ranges = []
+    start = 0
+    while start < len(token_counts):
+        end = next_batch_end(token_counts, start, max_texts, max_tokens)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class AdaptiveBatchSizer:
+    """Tunes the embedding batch limits from observed latency and API pushback.
+
+    The text and token limits are soft targets between 1 and their hard ceilings (the
+    API's limits). They grow additively while requests finish under the target latency
+    and shrink multiplicatively on slow responses and 429 (throttled), so they recover
+    once the API does. A 413 (too large) shrinks them and also lowers the hard ceilings,
+    since the server has shown where its real limit is.
+    """
+
+    def __init__(
+        self,
+        max_texts: int,
+        max_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        ceiling_texts: int = DEFAULT_MAX_BATCH_TEXTS,
+        ceiling_tokens: int = MODEL_MAX_BATCH_TOKENS,
+        target_latency: float = 2.0
+    ):
+        self.max_texts = max_texts
+        self.max_tokens = max_tokens
+        self.ceiling_texts = max(ceiling_texts, max_texts)
+        self.ceiling_tokens = max(ceiling_tokens, max_tokens)
+        self.token_step = max(1, max_tokens // 4) # Additive growth per fast, token-bound batch
+        self.target_latency = target_latency # Seconds per request we are happy to wait
+        self._lock = threading.Lock()
+
+    def limits(self) -> Tuple[int, int]:
+        with self._lock:
+            return self.max_texts, self.max_tokens
+
+    def record_success(self, n_texts: int, latency: float, n_tokens: Optional[int] = None):
+        with self._lock:
+            if latency > self.target_latency * 1.5:
+                self.max_texts = max(1, int(self.max_texts * 0.75))
+                self.max_tokens = max(1, int(self.max_tokens * 0.75))
+                logger.debug(f"Slow embedding batch ({latency:.2f}s); limits -> {self.max_texts} texts / {self.max_tokens} tokens")
+            elif latency < self.target_latency:
+                if n_texts >= self.max_texts:
+                    self.max_texts = min(self.ceiling_texts, self.max_texts + max(1, self.max_texts // 4))
+                if n_tokens is not None and n_tokens >= self.max_tokens * TOKEN_BOUND_FILL:
+                    self.max_tokens = min(self.ceiling_tokens, self.max_tokens + self.token_step)
+
+    def record_throttled(self):
+        with self._lock:
+            self.max_texts = max(1, self.max_texts // 2)
+            logger.info(f"Embedding API throttled (429); max batch texts -> {self.max_texts}")
+
+    def record_oversize(self, n_texts: int, n_tokens: int):
+        with self._lock:
+            self.max_texts = max(1, min(self.max_texts, n_texts // 2))
+            self.max_tokens = max(1, min(self.max_tokens, n_tokens // 2))
+            self.ceiling_tokens = min(self.ceiling_tokens, max(1, n_tokens - 1)) # The server rejected this size
+            logger.info(f"Embedding request too large (413); limits -> {self.max_texts} texts / {self.max_tokens} tokens")
@@ -0,0 +1,279 @@
+# university_embeddings.py
+import asyncio
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+import httpx
+import requests
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EmbeddingCache
+from http_client import AsyncPooledTransport, PooledTransport, get_transport
+from index_types import shorten_embeddings
+from metrics import observe
+from query_cache import QueryEmbeddingCache
+from token_batching import DEFAULT_MAX_BATCH_TOKENS, AdaptiveBatchSizer, count_tokens, next_batch_end
+
+logger = logging.getLogger(__name__)
+
+
+class UniversityEmbeddings(Embeddings):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        api_version: str,
+        embed_batch_size: int = 1,
+        max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        transport: PooledTransport = None,
+        async_transport: AsyncPooledTransport = None,
+        embedding_cache: EmbeddingCache = None,
+        query_cache: QueryEmbeddingCache = None,
+        max_concurrency: int = 1,
+        max_retries: int = 2,
+        retry_backoff: float = 1.0,
+        dimensions: int = None
+    ):
+        self.api_key = api_key
+        # Construct the specific endpoint URL for embeddings
+        self.endpoint_url = f"{base_url}/deployments/{model_name}/embeddings?api-version={api_version}"
+        self.headers = {
+            'Content-Type': 'application/json',
+            'api-key': self.api_key
+        }
+        self.model_name = model_name
+        self.embed_batch_size = embed_batch_size # Starting number of texts per API call, tuned at runtime
+        self.batch_sizer = AdaptiveBatchSizer(max_texts=embed_batch_size, max_tokens=max_batch_tokens)
+        self.transport = transport or get_transport() # Shared keep-alive connection pool
+        self.async_transport = async_transport # Used by aembed_query when set
+        self.embedding_cache = embedding_cache # Optional on-disk cache consulted by embed_documents
+        self.query_cache = query_cache # Optional in-memory cache consulted by embed_query
+        self.max_concurrency = max_concurrency # Max batch requests in flight at once
+        self.max_retries = max_retries # Retries per failed batch before giving up
+        self.retry_backoff = retry_backoff # Base delay in seconds, doubled on each retry
+        self.dimensions = dimensions # Shortened embedding size requested from the API; None for the native size
+        logger.info(f"Initialized UniversityEmbeddings with endpoint: {self.endpoint_url}")
+
+    def _payload(self, batch: List[str]) -> dict:
+        payload = {'input': batch if len(batch) > 1 else batch[0]}
+        if self.dimensions:
+            payload['dimensions'] = self.dimensions
+        return payload
+
+    def _post_batch(self, batch: List[str]) -> List[List[float]]:
+        """Sends one batch to the embedding endpoint and returns its vectors in input order."""
+        payload = self._payload(batch)
+        response = self.transport.post(self.endpoint_url, json=payload, headers=self.headers, timeout=30)
+        response.raise_for_status()
+        return self._parse_embedding_response(response.json(), batch)
+
+    async def _apost_batch(self, batch: List[str]) -> List[List[float]]:
+        """Async variant of _post_batch over the pooled async transport."""
+        payload = self._payload(batch)
+        response = await self.async_transport.post(self.endpoint_url, json=payload, headers=self.headers, timeout=30)
+        response.raise_for_status()
+        return self._parse_embedding_response(response.json(), batch)
+
+    def _parse_embedding_response(self, response_data: dict, batch: List[str]) -> List[List[float]]:
+        try:
+            batch_embeddings = [item['embedding'] for item in sorted(response_data['data'], key=lambda x: x['index'])]
+        except (KeyError, IndexError, TypeError) as e:
+            logger.error(f"Failed to parse embedding response: {e}. Response data: {response_data}")
+            raise ValueError(f"Invalid response structure from embedding API: {e}") from e
+
+        if len(batch_embeddings) != len(batch):
+            raise ValueError(f"Number of embeddings received ({len(batch_embeddings)}) does not match number of texts sent ({len(batch)})")
+        if self.dimensions and batch_embeddings and len(batch_embeddings[0]) > self.dimensions:
+            # Deployment ignored `dimensions`; apply the same truncate-and-renormalize transform locally
+            batch_embeddings = shorten_embeddings(batch_embeddings, self.dimensions).tolist()
+        return batch_embeddings
+
+    def _retry_delay(self, status: Optional[int], headers, attempt: int) -> Optional[float]:
+        """Retry policy shared by the sync and async paths.
+
+        Timeouts and network errors (no status), 429s and 5xx responses are retried with
+        exponential backoff, waiting at least as long as a Retry-After header asks.
+        Returns the delay in seconds, or None when the request must fail now.
+        """
+        if status == 429:
+            self.batch_sizer.record_throttled()
+        retryable = status is None or status == 429 or status >= 500
+        if not retryable or attempt >= self.max_retries:
+            return None
+        delay = self.retry_backoff * (2 ** attempt)
+        retry_after = headers.get('Retry-After') if headers is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def _embed_batch(self, batch: List[str], n_tokens: Optional[int] = None) -> List[List[float]]:
+        """Embeds one batch, retrying it on its own after timeouts, network errors, 429s and 5xx responses.
+
+        A 413 (payload too large) splits the batch in half instead of counting as a failure.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                start_time = time.time()
+                batch_embeddings = self._post_batch(batch)
+                self.batch_sizer.record_success(len(batch), time.time() - start_time, n_tokens)
+                logger.debug(f"Successfully embedded batch of {len(batch)} texts.")
+                return batch_embeddings
+            except requests.exceptions.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                if status == 413 and len(batch) > 1:
+                    self.batch_sizer.record_oversize(len(batch), sum(count_tokens(t, self.model_name) for t in batch))
+                    middle = len(batch) // 2
+                    return self._embed_batch(batch[:middle]) + self._embed_batch(batch[middle:])
+
+                delay = self._retry_delay(status, e.response.headers if e.response is not None else None, attempt)
+                if delay is None:
+                    if isinstance(e, requests.exceptions.Timeout):
+                        logger.error(f"Timeout while embedding batch starting with: '{batch[0][:50]}...'")
+                    else:
+                        logger.error(f"API request failed while embedding batch: {e}")
+                        if e.response is not None:
+                            logger.error(f"API Error Response: Status={e.response.status_code}, Body={e.response.text}")
+                    raise
+                logger.warning(f"Embedding batch failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.")
+                time.sleep(delay)
+
+    def _embed_concurrently(self, texts: List[str], token_counts: List[int]) -> List[List[List[float]]]:
+        """Keeps up to max_concurrency batch requests in flight.
+
+        Each batch is packed only when a slot frees up, so it uses the limits tuned from
+        the batches that finished before it. Results are returned in input order.
+        """
+        batch_results: List[Optional[List[List[float]]]] = []
+        in_flight = {} # future -> position in batch_results
+        start = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while start < len(texts) or in_flight:
+                while start < len(texts) and len(in_flight) < self.max_concurrency:
+                    max_texts, max_tokens = self.batch_sizer.limits()
+                    end = next_batch_end(token_counts, start, max_texts, max_tokens)
+                    future = executor.submit(self._embed_batch, texts[start:end], sum(token_counts[start:end]))
+                    in_flight[future] = len(batch_results)
+                    batch_results.append(None)
+                    start = end
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_results[in_flight.pop(future)] = future.result()
+        logger.info(f"Embedded {len(texts)} texts in {len(batch_results)} batches with up to {self.max_concurrency} requests in flight.")
+        return batch_results
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        token_counts = [count_tokens(text, self.model_name) for text in texts]
+
+        try:
+            if self.max_concurrency > 1 and len(texts) > 1:
+                batch_results = self._embed_concurrently(texts, token_counts)
+            else:
+                # Sequential mode re-reads the tuned limits before packing each batch
+                batch_results = []
+                start = 0
+                while start < len(texts):
+                    max_texts, max_tokens = self.batch_sizer.limits()
+                    end = next_batch_end(token_counts, start, max_texts, max_tokens)
+                    batch_results.append(self._embed_batch(texts[start:end], sum(token_counts[start:end])))
+                    start = end
+
+        except requests.exceptions.Timeout:
+             logger.error("Timeout while generating embeddings. Try reducing data or check API status.")
+             raise # Callers (UI, index builder, warm-up) decide how to report it
+        except requests.exceptions.RequestException as e:
+             if e.response is not None:
+                 logger.error(f"API Error ({e.response.status_code}) while generating embeddings. Check API key and endpoint.")
+             else:
+                 logger.error("Network error while generating embeddings.")
+             raise
+        except ValueError as e:
+             logger.error(f"Invalid response structure from embedding API: {e}")
+             raise
+        except Exception as e:
+             logger.error(f"An unexpected error occurred during embedding: {e}")
+             raise
+
+        all_embeddings = []
+        for batch_embeddings in batch_results:
+            all_embeddings.extend(batch_embeddings)
+        return all_embeddings
+
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+             logger.warning("embed_documents called with empty list.")
+             return []
+        start_time = time.time()
+        if self.embedding_cache is None:
+            logger.info(f"Embedding {len(texts)} documents using University API...")
+            embeddings = self._embed(texts)
+        else:
+            embeddings = self.embedding_cache.get_many(texts)
+            missing = [i for i, vector in enumerate(embeddings) if vector is None]
+            logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses. "
+                        f"Embedding {len(missing)} documents using University API...")
+            if missing:
+                missing_texts = [texts[i] for i in missing]
+                new_embeddings = self._embed(missing_texts)
+                self.embedding_cache.put_many(missing_texts, new_embeddings)
+                for i, vector in zip(missing, new_embeddings):
+                    embeddings[i] = vector
+        end_time = time.time()
+        logger.info(f"Finished embedding documents in {end_time - start_time:.2f} seconds.")
+        return embeddings
+
+
+    def embed_query(self, text: str) -> List[float]:
+        if not text:
+             logger.warning("embed_query called with empty string.")
+             return [] # Return empty list or handle as error?
+        if self.query_cache is not None:
+            cached_embedding = self.query_cache.get(text)
+            if cached_embedding is not None:
+                logger.info(f"Query embedding cache hit. Stats: {self.query_cache.stats()}")
+                return cached_embedding
+        logger.info("Embedding query using University API...")
+        start_time = time.perf_counter()
+        query_embedding = self._embed([text])[0]
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        observe("query_embedding_api", elapsed_ms) # API time only; the pipeline's query_embedding span includes cache hits
+        logger.info(f"Finished embedding query in {elapsed_ms:.0f} ms.")
+        if self.query_cache is not None:
+            self.query_cache.put(text, query_embedding)
+        return query_embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.async_transport is None:
+            return await super().aembed_query(text) # Runs embed_query in a worker thread
+        if not text:
+             logger.warning("aembed_query called with empty string.")
+             return []
+        if self.query_cache is not None:
+            cached_embedding = self.query_cache.get(text)
+            if cached_embedding is not None:
+                logger.info(f"Query embedding cache hit. Stats: {self.query_cache.stats()}")
+                return cached_embedding
+        logger.info("Embedding query using University API (async)...")
+        start_time = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                query_embedding = (await self._apost_batch([text]))[0]
+                break
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                # A 413 cannot be split for a single query, so like the sync path it fails at once
+                response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+                delay = self._retry_delay(response.status_code if response is not None else None, response.headers if response is not None else None, attempt)
+                if delay is None:
+                    logger.error(f"API request failed while embedding query: {e}")
+                    raise
+                logger.warning(f"Query embedding failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        observe("query_embedding_api", elapsed_ms)
+        logger.info(f"Finished embedding query in {elapsed_ms:.0f} ms.")
+        if self.query_cache is not None:
+            self.query_cache.put(text, query_embedding)
+        return query_embedding
@@ -0,0 +1,141 @@
+# warmup.py
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Readiness States ---
+STARTING = "starting" # Process is up, warm-up not begun
+WARMING = "warming"
+READY = "ready" # Every required step succeeded; optional steps may have failed
+FAILED = "failed" # A required step failed; the app would fail its first request too
+
+WarmupStep = Tuple[str, Callable[[], None], bool] # (name, function, required)
+
+
+class Readiness:
+    """Thread-safe readiness state of the server, with the outcome of each warm-up step."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = STARTING
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.steps: Dict[str, dict] = {}
+
+    def begin(self):
+        with self._lock:
+            self.state = WARMING
+
+    def record(self, name: str, required: bool, seconds: float, error: Optional[str] = None):
+        with self._lock:
+            self.steps[name] = {
+                "ok": error is None,
+                "required": required,
+                "seconds": round(seconds, 3),
+                "error": error
+            }
+
+    def finish(self):
+        with self._lock:
+            failed_required = [name for name, step in self.steps.items() if step["required"] and not step["ok"]]
+            self.state = FAILED if failed_required else READY
+            self.ready_at = time.time()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == READY
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "uptime_seconds": round(time.time() - self.started_at, 3),
+                "warmup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+                "steps": {name: dict(step) for name, step in self.steps.items()}
+            }
+
+
+_readiness: Optional[Readiness] = None
+_readiness_lock = threading.Lock()
+
+def get_readiness() -> Readiness:
+    """Process-wide readiness state, shared by the warm-up thread and the probe server."""
+    global _readiness
+    with _readiness_lock:
+        if _readiness is None:
+            _readiness = Readiness()
+        return _readiness
+
+
+def run_warmup(steps: List[WarmupStep], readiness: Optional[Readiness] = None) -> bool:
+    """Runs the warm-up steps in order and records each one's timing and outcome.
+
+    A failed required step stops the warm-up (later steps depend on it); a failed optional
+    step is logged and skipped. Returns True when the server ended up ready.
+    """
+    readiness = readiness or get_readiness()
+    readiness.begin()
+    for name, step, required in steps:
+        start = time.perf_counter()
+        try:
+            step()
+            readiness.record(name, required, time.perf_counter() - start)
+            logger.info(f"Warm-up step '{name}' done in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            readiness.record(name, required, time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+            if required:
+                logger.exception(f"Warm-up step '{name}' failed; the server is not ready.")
+                break
+            logger.warning(f"Optional warm-up step '{name}' failed: {e}")
+    readiness.finish()
+    logger.info(f"Warm-up finished: {readiness.snapshot()}")
+    return readiness.is_ready
+
+
+# --- Readiness Probe Endpoint ---
+class _ProbeHandler(BaseHTTPRequestHandler):
+    """/ready: 200 once warmed up, 503 before or on failure. /live: 200 while the process runs.
+    /metrics: per-stage latency histograms in Prometheus text format; /metrics.json: the same as JSON."""
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/ready":
+            snapshot = get_readiness().snapshot()
+            self._send(200 if snapshot["state"] == READY else 503, snapshot)
+        elif path == "/live":
+            self._send(200, {"state": "alive"})
+        elif path == "/metrics":
+            self._send_text(200, get_metrics().to_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/metrics.json":
+            self._send(200, get_metrics().to_json())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _send(self, status: int, body: dict):
+        self._send_text(status, json.dumps(body), "application/json")
+
+    def _send_text(self, status: int, body: str, content_type: str):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Probe {self.address_string()}: {format % args}")
+
+def start_readiness_server(host: str = "0.0.0.0", port: int = 8502) -> ThreadingHTTPServer:
+    """Serves /ready, /live and /metrics from a daemon thread, next to the Streamlit server."""
+    server = ThreadingHTTPServer((host, port), _ProbeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="readiness-probe", daemon=True).start()
+    logger.info(f"Readiness probe listening on http://{host}:{port}/ready")
+    return server